@@ -6,7 +6,6 @@ AI categorization API views for smart transaction classification
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta
@@ -19,13 +18,7 @@ from .serializers import (
     CategoryPredictionRequestSerializer,
     TrainingDataSerializer
 )
-
-
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for AI categorization views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+from utils.pagination import StandardResultsSetPagination
 
 
 class CategoryPredictionViewSet(viewsets.ModelViewSet):
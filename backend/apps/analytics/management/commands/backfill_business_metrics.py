@@ -0,0 +1,48 @@
+# backend/apps/analytics/management/commands/backfill_business_metrics.py
+"""
+Management command to rebuild BusinessMetrics for a date range
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.services import MetricsRollupService
+from apps.analytics.tasks import backfill_business_metrics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily, weekly and monthly business metrics for a date range in chunks of users'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First day (YYYY-MM-DD)')
+        parser.add_argument('end', help='Last day (YYYY-MM-DD)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Users per rebuild job',
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Rebuild the chunks in this process instead of queueing parallel jobs',
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            start, end = date.fromisoformat(options['start']), date.fromisoformat(options['end'])
+        except ValueError:
+            raise CommandError('Dates must be YYYY-MM-DD')
+        if start > end:
+            raise CommandError('Start must not be after end')
+        
+        if not options['sync']:
+            result = backfill_business_metrics.delay(start.isoformat(), end.isoformat(), options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Backfill queued ({result.id})'))
+            return
+        
+        for user_ids in MetricsRollupService.user_chunks(start, end, options['chunk_size']):
+            MetricsRollupService.rebuild(user_ids, start, end)
+            self.stdout.write(f'Rebuilt {len(user_ids)} users')
+        self.stdout.write(self.style.SUCCESS('Backfill complete'))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0002_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alertrule",
+            index=models.Index(
+                fields=["user", "metric_field", "is_active"],
+                name="alert_rules_user_id_4f3088_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:25
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicate_references(apps, schema_editor):
+    """Keep the oldest row of each (reference_id, category) before it becomes unique"""
+    CashFlowData = apps.get_model("analytics", "CashFlowData")
+    duplicated = CashFlowData.objects.exclude(reference_id="").order_by().values(
+        "reference_id", "category"
+    ).annotate(rows=models.Count("id")).filter(rows__gt=1)
+    for row in duplicated:
+        keep = CashFlowData.objects.filter(
+            reference_id=row["reference_id"], category=row["category"]
+        ).order_by("created_at", "id").values_list("id", flat=True).first()
+        CashFlowData.objects.filter(
+            reference_id=row["reference_id"], category=row["category"]
+        ).exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0003_alertrule_alert_rules_user_id_4f3088_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashFlowGeneration",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("total_transactions", models.PositiveIntegerField(default=0)),
+                ("processed_count", models.PositiveIntegerField(default=0)),
+                ("created_count", models.PositiveIntegerField(default=0)),
+                ("error_message", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "cash_flow_generations",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.RunPython(drop_duplicate_references, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cashflowdata",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("reference_id", ""), _negated=True),
+                fields=("reference_id", "category"),
+                name="unique_cash_flow_reference",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashflowgeneration",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="cash_flow_generations",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
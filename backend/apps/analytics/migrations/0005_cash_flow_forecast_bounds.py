@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0004_cash_flow_generation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflowdata",
+            name="net_flow_lower",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Lower bound of the predicted net flow",
+                max_digits=15,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashflowdata",
+            name="net_flow_upper",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Upper bound of the predicted net flow",
+                max_digits=15,
+                null=True,
+            ),
+        ),
+    ]
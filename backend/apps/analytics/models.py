@@ -169,54 +169,25 @@ class BusinessMetrics(models.Model):
         return f"{self.user.get_full_name()} - {self.period_type.title()} - {self.period_start}"
     
     def calculate_metrics(self):
-        """Calculate all metrics for the period"""
-        from apps.transactions.models import Transaction
-        from apps.inventory.models import Product
-        from decimal import Decimal
-        
-        # Get transactions for the period
-        transactions = Transaction.objects.filter(
-            user=self.user,
-            transaction_date__date__gte=self.period_start,
-            transaction_date__date__lte=self.period_end,
-            status='completed',
-            transaction_type='sale'
-        )
-        
-        # Sales Metrics
-        self.total_sales_count = transactions.count()
-        self.total_sales_amount = sum(t.total_amount for t in transactions) or Decimal('0.00')
-        
-        if self.total_sales_count > 0:
-            self.average_transaction_value = self.total_sales_amount / self.total_sales_count
-        
-        # Cost and Profit Metrics
-        total_cost = Decimal('0.00')
-        for transaction in transactions:
-            for item in transaction.transaction_items.all():
-                total_cost += item.unit_cost * item.quantity
-        
-        self.total_cost_of_goods = total_cost
-        self.gross_profit = self.total_sales_amount - total_cost
-        
-        if self.total_sales_amount > 0:
-            self.gross_profit_margin = (self.gross_profit / self.total_sales_amount) * 100
-        
-        # Customer Metrics
-        unique_phones = set()
-        for t in transactions:
-            if t.customer_phone:
-                unique_phones.add(t.customer_phone)
-        self.unique_customers = len(unique_phones)
-        
-        # Days Active
-        active_dates = set(t.transaction_date.date() for t in transactions)
-        self.days_active = len(active_dates)
-        
-        # Calculate performance score (0-100)
-        self.performance_score = self._calculate_performance_score()
-        
-        self.save()
+        """Recompute the period from its transactions (see MetricsRollupService)"""
+        from .services import MetricsRollupService
+        MetricsRollupService.rebuild([self.user_id], self.period_start, self.period_end)
+        self.refresh_from_db()
+    
+    def apply_derived(self):
+        """Average transaction value and gross margin from the period totals"""
+        cents = Decimal('0.01')
+        if self.total_sales_count:
+            self.average_transaction_value = (
+                Decimal(self.total_sales_amount) / self.total_sales_count
+            ).quantize(cents)
+        else:
+            self.average_transaction_value = Decimal('0.00')
+        if self.total_sales_amount:
+            margin = Decimal(self.gross_profit) / Decimal(self.total_sales_amount) * 100
+            self.gross_profit_margin = max(min(margin, Decimal('999.99')), Decimal('-999.99')).quantize(cents)
+        else:
+            self.gross_profit_margin = Decimal('0.00')
     
     def _calculate_performance_score(self):
         """Calculate overall business performance score"""
@@ -335,6 +306,20 @@ class CashFlowData(models.Model):
         validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
         help_text='Confidence in prediction (if applicable)'
     )
+    net_flow_lower = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text='Lower bound of the predicted net flow'
+    )
+    net_flow_upper = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text='Upper bound of the predicted net flow'
+    )
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -350,6 +335,14 @@ class CashFlowData(models.Model):
             models.Index(fields=['flow_type', 'category']),
             models.Index(fields=['is_predicted']),
         ]
+        constraints = [
+            # One generated row per source record and category
+            models.UniqueConstraint(
+                fields=['reference_id', 'category'],
+                condition=~models.Q(reference_id=''),
+                name='unique_cash_flow_reference'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.category.replace('_', ' ').title()} - ₦{self.net_flow}"
@@ -360,6 +353,53 @@ class CashFlowData(models.Model):
         super().save(*args, **kwargs)
 
 
+class CashFlowGeneration(models.Model):
+    """
+    A background run generating CashFlowData from a user's transactions.
+    The counters report progress while the worker runs.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cash_flow_generations'
+    )
+    
+    start_date = models.DateField()
+    end_date = models.DateField()
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_transactions = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'cash_flow_generations'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.start_date} - {self.end_date} ({self.status})"
+    
+    @property
+    def progress_percentage(self):
+        if not self.total_transactions:
+            return 100 if self.status == 'completed' else 0
+        return round(self.processed_count * 100 / self.total_transactions, 1)
+
+
 class BusinessInsight(models.Model):
     """
     AI-generated business insights and recommendations
@@ -555,6 +595,7 @@ class AlertRule(models.Model):
         ordering = ['name']
         indexes = [
             models.Index(fields=['user', 'is_active']),
+            models.Index(fields=['user', 'metric_field', 'is_active']),
             models.Index(fields=['alert_type']),
             models.Index(fields=['last_triggered']),
         ]
@@ -4,7 +4,7 @@ Analytics serializers for business insights and metrics
 """
 
 from rest_framework import serializers
-from .models import BusinessMetrics, CashFlowData, BusinessInsight, AlertRule
+from .models import BusinessMetrics, CashFlowData, CashFlowGeneration, BusinessInsight, AlertRule
 
 
 class BusinessMetricsSerializer(serializers.ModelSerializer):
@@ -46,7 +46,8 @@ class CashFlowDataSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'flow_type', 'category', 'inflow_amount', 'outflow_amount',
             'net_flow', 'flow_date', 'description', 'reference_id',
-            'is_predicted', 'confidence_score', 'created_at'
+            'is_predicted', 'confidence_score', 'net_flow_lower', 'net_flow_upper',
+            'created_at'
         ]
         read_only_fields = ['id', 'net_flow', 'created_at']
     
@@ -55,6 +56,22 @@ class CashFlowDataSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class CashFlowGenerationSerializer(serializers.ModelSerializer):
+    """
+    Serializer for cash flow generation runs and their progress
+    """
+    progress_percentage = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = CashFlowGeneration
+        fields = [
+            'id', 'start_date', 'end_date', 'status', 'total_transactions',
+            'processed_count', 'created_count', 'progress_percentage',
+            'error_message', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = fields
+
+
 class BusinessInsightSerializer(serializers.ModelSerializer):
     """
     Serializer for AI-generated business insights
@@ -0,0 +1,887 @@
+# backend/apps/analytics/services.py
+"""
+Analytics services
+Incremental alert rule evaluation, the cached composite dashboard, the
+daily / weekly / monthly BusinessMetrics rollups, CashFlowData
+generation from transactions and cash flow forecasts
+"""
+
+import calendar
+import hashlib
+import json
+from datetime import time, timedelta
+from decimal import Decimal
+from functools import partial
+
+import numpy as np
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction as db_transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import Coalesce, ExtractHour, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.users.models import User
+from utils.retention import keyset_batches
+
+from .models import AlertRule, BusinessMetrics, CashFlowData, CashFlowGeneration
+
+
+# Metrics published by the signal handlers in signals.py. An AlertRule
+# watches one of these through its ``metric_field``.
+ALERT_METRICS = {
+    'current_stock': 'Stock level of the product that changed',
+    'low_stock_count': 'Number of products at or below their minimum level',
+    'out_of_stock_count': 'Number of products with no stock',
+    'inventory_value': 'Total value of stock at cost price',
+    'transaction_amount': 'Total of the transaction that was recorded',
+    'daily_sales': "Total of today's completed sales",
+    'daily_transactions': "Number of today's transactions",
+    'savings_balance': 'Balance of the savings account that changed',
+}
+
+# Notification type used for each alert type
+ALERT_NOTIFICATION_TYPES = {
+    'low_stock': 'low_stock',
+    'high_sales': 'transaction',
+    'low_sales': 'transaction',
+    'cash_flow_negative': 'warning',
+    'loan_payment_due': 'loan_reminder',
+    'savings_goal_reached': 'savings_goal',
+    'unusual_activity': 'warning',
+    'custom': 'system',
+}
+
+
+class AlertEngine:
+    """
+    Evaluates alert rules when a metric changes.
+
+    Active rules are indexed per user by ``metric_field`` and cached, so a
+    change only looks at the rules watching that metric and costs no query
+    when there are none. Cooldowns are claimed with a conditional UPDATE
+    and the notifications from one evaluation are inserted in one batch
+    once the surrounding transaction commits.
+    """
+    
+    CACHE_TIMEOUT = 60 * 60
+    
+    @staticmethod
+    def _cache_key(user_id):
+        return f'alert_rules:{user_id}'
+    
+    @classmethod
+    def rule_index(cls, user_id):
+        """Active rules of a user, grouped by the metric they watch"""
+        key = cls._cache_key(user_id)
+        index = cache.get(key)
+        if index is None:
+            index = {}
+            rules = AlertRule.objects.filter(user_id=user_id, is_active=True).values(
+                'id', 'name', 'alert_type', 'metric_field', 'operator',
+                'threshold_value', 'cooldown_hours', 'last_triggered'
+            )
+            for rule in rules:
+                index.setdefault(rule['metric_field'], []).append(rule)
+            cache.set(key, index, cls.CACHE_TIMEOUT)
+        return index
+    
+    @classmethod
+    def invalidate(cls, user_id):
+        cache.delete(cls._cache_key(user_id))
+    
+    @classmethod
+    def watched_metrics(cls, user_id, metrics):
+        """The subset of ``metrics`` that at least one active rule watches"""
+        index = cls.rule_index(user_id)
+        return [metric for metric in metrics if metric in index]
+    
+    @classmethod
+    def evaluate(cls, user_id, values, context=None):
+        """
+        Evaluate the rules watching the metrics in ``values``
+        (``{metric: current_value}``) and queue notifications for the
+        ones that fire. Returns the fired rule ids.
+        """
+        index = cls.rule_index(user_id)
+        now = timezone.now()
+        context = context or {}
+        fired = []
+        notifications = []
+        
+        for metric, value in values.items():
+            for rule in index.get(metric, ()):
+                if not compare(rule['operator'], value, rule['threshold_value']):
+                    continue
+                if in_cooldown(rule, now):
+                    continue
+                if not cls._claim(rule, now):
+                    continue
+                fired.append(rule['id'])
+                notifications.append(build_notification(user_id, rule, metric, value, context))
+        
+        if fired:
+            # last_triggered changed, reload on next evaluation
+            cls.invalidate(user_id)
+            from apps.notifications.services import create_notifications
+            db_transaction.on_commit(partial(create_notifications, notifications))
+        return fired
+    
+    @staticmethod
+    def _claim(rule, now):
+        """Record the trigger unless another worker fired the rule first"""
+        cooldown_start = now - timedelta(hours=rule['cooldown_hours'])
+        return AlertRule.objects.filter(
+            Q(last_triggered__isnull=True) | Q(last_triggered__lte=cooldown_start),
+            id=rule['id'],
+            is_active=True,
+        ).update(last_triggered=now, trigger_count=F('trigger_count') + 1) == 1
+
+
+def compare(operator, value, threshold):
+    """Same comparison as AlertRule.evaluate_condition, on plain values"""
+    value = Decimal(str(value))
+    if operator == 'gt':
+        return value > threshold
+    elif operator == 'lt':
+        return value < threshold
+    elif operator == 'eq':
+        return value == threshold
+    elif operator == 'gte':
+        return value >= threshold
+    elif operator == 'lte':
+        return value <= threshold
+    return False
+
+
+def in_cooldown(rule, now):
+    last_triggered = rule['last_triggered']
+    if not last_triggered:
+        return False
+    return now - last_triggered < timedelta(hours=rule['cooldown_hours'])
+
+
+def build_notification(user_id, rule, metric, value, context):
+    from apps.notifications.models import Notification
+    
+    subject = context.get('subject')
+    label = metric.replace('_', ' ')
+    message = f"{label.capitalize()} is {value}"
+    if subject:
+        message = f"{subject}: {message}"
+    message += f" ({rule['operator']} {rule['threshold_value']})"
+    
+    return Notification(
+        user_id=user_id,
+        title=rule['name'],
+        message=message,
+        notification_type=ALERT_NOTIFICATION_TYPES.get(rule['alert_type'], 'system'),
+        priority='high',
+        metadata={
+            'alert_rule_id': str(rule['id']),
+            'metric': metric,
+            'value': str(value),
+            'threshold_value': str(rule['threshold_value']),
+            **{key: str(val) for key, val in context.items()},
+        },
+    )
+
+
+def inventory_metrics(user_id):
+    from apps.inventory.services import InventoryValuationService
+    summary = InventoryValuationService.get_summary(user_id)
+    return {
+        'low_stock_count': summary.low_stock_count,
+        'out_of_stock_count': summary.out_of_stock_count,
+        'inventory_value': summary.total_inventory_value,
+    }
+
+
+def daily_sales_metrics(user_id):
+    from apps.transactions.models import Transaction
+    today = timezone.now().date()
+    totals = Transaction.objects.filter(
+        user_id=user_id, transaction_date__date=today
+    ).aggregate(
+        daily_sales=Coalesce(
+            Sum('total_amount', filter=Q(transaction_type='sale', status='completed')),
+            Decimal('0.00')
+        ),
+        daily_transactions=Count('id'),
+    )
+    return totals
+
+
+class DashboardService:
+    """
+    Per-user cached snapshot behind the composite dashboard.
+    
+    The snapshot is cached in sections (sales, inventory, savings, loans),
+    each stored with a hash of its content. The signal handlers in
+    signals.py delete only the section a change affects once it commits,
+    so the next read rebuilds that section and reuses the others. The ETag
+    is built from the section hashes: revalidating an unchanged dashboard
+    is answered from the cache alone. Sections are keyed by day (today's
+    sales start from zero) and expire after CACHE_TIMEOUT to pick up
+    changes made with queryset updates, which send no signals.
+    """
+    
+    SECTIONS = ('sales', 'inventory', 'savings', 'loans')
+    CACHE_TIMEOUT = 60 * 10
+    
+    @staticmethod
+    def _cache_key(user_id, section):
+        return f'dashboard:{user_id}:{section}:{timezone.localdate():%Y%m%d}'
+    
+    @classmethod
+    def invalidate(cls, user_id, *sections):
+        cache.delete_many([cls._cache_key(user_id, section) for section in sections or cls.SECTIONS])
+    
+    @staticmethod
+    def _etag(hashes):
+        return hashlib.md5(':'.join(hashes).encode()).hexdigest()
+    
+    @classmethod
+    def cached_etag(cls, user_id):
+        """ETag of the cached snapshot, or None when a section has to be rebuilt"""
+        entries = cache.get_many([cls._cache_key(user_id, section) for section in cls.SECTIONS])
+        if len(entries) < len(cls.SECTIONS):
+            return None
+        return cls._etag(entries[cls._cache_key(user_id, section)]['hash'] for section in cls.SECTIONS)
+    
+    @classmethod
+    def snapshot(cls, user_id):
+        """``(data, etag)`` of the user's dashboard, rebuilding missing sections"""
+        keys = {section: cls._cache_key(user_id, section) for section in cls.SECTIONS}
+        cached = cache.get_many(keys.values())
+        data, hashes, rebuilt = {}, [], {}
+        for section, key in keys.items():
+            entry = cached.get(key)
+            if entry is None:
+                payload = getattr(cls, f'{section}_section')(user_id)
+                content = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True)
+                entry = rebuilt[key] = {'data': payload, 'hash': hashlib.md5(content.encode()).hexdigest()}
+            data[section] = entry['data']
+            hashes.append(entry['hash'])
+        if rebuilt:
+            cache.set_many(rebuilt, cls.CACHE_TIMEOUT)
+        return data, cls._etag(hashes)
+    
+    @staticmethod
+    def sales_section(user_id):
+        """Today's and this month's transactions, in one aggregate query"""
+        from apps.transactions.models import Transaction
+        today = timezone.now().date()
+        month_start = today.replace(day=1)
+        zero = Decimal('0.00')
+        periods = {
+            'today': Q(transaction_date__date=today),
+            'this_month': Q(transaction_date__date__gte=month_start),
+        }
+        sale = Q(transaction_type='sale')
+        aggregates = {}
+        for period, condition in periods.items():
+            aggregates.update({
+                f'{period}__total_transactions': Count('id', filter=condition),
+                f'{period}__total_amount': Coalesce(Sum('total_amount', filter=condition), zero),
+                f'{period}__sales_count': Count('id', filter=condition & sale),
+                f'{period}__sales_amount': Coalesce(Sum('total_amount', filter=condition & sale), zero),
+            })
+        totals = Transaction.objects.filter(
+            user_id=user_id, transaction_date__date__gte=month_start
+        ).aggregate(**aggregates)
+        
+        section = {period: {} for period in periods}
+        for name, value in totals.items():
+            period, field = name.split('__')
+            section[period][field] = value
+        return section
+    
+    @staticmethod
+    def inventory_section(user_id):
+        from apps.inventory.services import InventoryValuationService
+        summary = InventoryValuationService.get_summary(user_id)
+        return {
+            'total_products': summary.product_count,
+            'active_products': summary.active_product_count,
+            'low_stock_products': summary.low_stock_count,
+            'out_of_stock_products': summary.out_of_stock_count,
+            # A summary built on first access is not read back from the database
+            'total_inventory_value': Decimal(summary.total_inventory_value).quantize(Decimal('0.01')),
+        }
+    
+    @staticmethod
+    def savings_section(user_id):
+        from apps.savings.models import SavingsAccount
+        zero = Decimal('0.00')
+        return SavingsAccount.objects.filter(user_id=user_id).aggregate(
+            total_accounts=Count('id'),
+            active_accounts=Count('id', filter=Q(status='active')),
+            total_balance=Coalesce(Sum('current_balance'), zero),
+            total_interest_earned=Coalesce(Sum('total_interest_earned'), zero),
+        )
+    
+    @staticmethod
+    def loans_section(user_id):
+        from apps.loans.services import borrower_summary
+        return borrower_summary(user_id)
+
+
+# Weekly and monthly BusinessMetrics are rolled up from the daily rows
+ROLLUP_PERIODS = {'weekly': TruncWeek, 'monthly': TruncMonth}
+
+# Daily totals that transaction events change and roll-ups sum
+TOTAL_FIELDS = ['total_sales_amount', 'total_sales_count', 'total_cost_of_goods', 'gross_profit', 'cash_flow']
+PERIOD_FIELDS = [
+    *TOTAL_FIELDS, 'average_transaction_value', 'gross_profit_margin', 'unique_customers',
+    'days_active', 'updated_at',
+]
+
+MAX_GROWTH_RATE = Decimal('99999999.99')
+
+
+def period_bounds(period_type, day):
+    """First and last day of the ``period_type`` period containing ``day``"""
+    if period_type == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if period_type == 'monthly':
+        start = day.replace(day=1)
+        return start, start.replace(day=calendar.monthrange(day.year, day.month)[1])
+    return day, day
+
+
+def growth_rate(current, previous):
+    if not previous or previous <= 0:
+        return Decimal('0.00')
+    rate = ((Decimal(current) - Decimal(previous)) / Decimal(previous) * 100).quantize(Decimal('0.01'))
+    return max(min(rate, MAX_GROWTH_RATE), -MAX_GROWTH_RATE)
+
+
+class MetricsRollupService:
+    """
+    Keeps daily, weekly and monthly BusinessMetrics current.
+    
+    Daily rows follow transaction events: saving or deleting a completed
+    transaction applies its amount, cost of goods and cash flow to the
+    day's row with F() increments (see signals.py) and re-derives the
+    average value and margin. Weekly and monthly rows are rolled up from
+    the daily rows in one grouped query per period type; only unique
+    customers, which cannot be summed, are counted from transactions.
+    Growth rate and performance score are recomputed against the
+    neighbouring period after every roll-up.
+    
+    ``close`` runs nightly for the previous day: it rebuilds that day's
+    rows from transactions (filling customer counts and the peak hour and
+    correcting drift from status changes), then rolls up its week and
+    month. ``rebuild`` does the same for any range and is what the
+    chunked backfill jobs run.
+    """
+    
+    @classmethod
+    def record(cls, user_id, day, **deltas):
+        """Add ``deltas`` (TOTAL_FIELDS) to the user's daily row for ``day``"""
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+        rows = BusinessMetrics.objects.filter(user_id=user_id, period_type='daily', period_start=day)
+        increments = {field: F(field) + value for field, value in deltas.items()}
+        
+        with db_transaction.atomic():
+            if not rows.update(**increments, updated_at=timezone.now()):
+                BusinessMetrics.objects.bulk_create([
+                    BusinessMetrics(user_id=user_id, period_type='daily', period_start=day, period_end=day)
+                ], ignore_conflicts=True)
+                rows.update(**increments, updated_at=timezone.now())
+            metrics = rows.only(*TOTAL_FIELDS).get()
+            metrics.apply_derived()
+            rows.update(
+                average_transaction_value=metrics.average_transaction_value,
+                gross_profit_margin=metrics.gross_profit_margin,
+                days_active=1 if metrics.total_sales_count > 0 else 0,
+            )
+    
+    @classmethod
+    def record_transaction(cls, transaction, sign=1):
+        """
+        Apply a completed transaction to its day (``sign=-1`` to take it
+        out). ``transaction`` is a Transaction or its ``metrics_snapshot()``.
+        """
+        if not isinstance(transaction, dict):
+            transaction = transaction.metrics_snapshot()
+        if transaction['status'] != 'completed':
+            return
+        amount = transaction['total_amount'] * sign
+        deltas = {'cash_flow': amount if transaction['flow_direction'] == 'inward' else -amount}
+        if transaction['transaction_type'] == 'sale':
+            cost = transaction['cost_of_goods'] * sign
+            deltas.update(
+                total_sales_amount=amount,
+                total_sales_count=sign,
+                total_cost_of_goods=cost,
+                gross_profit=amount - cost,
+            )
+        cls.record(transaction['user_id'], timezone.localdate(transaction['transaction_date']), **deltas)
+    
+    @classmethod
+    def record_change(cls, before, after):
+        """
+        Move a transaction's contribution from its ``before`` snapshot to
+        ``after``. Weeks and months of days already closed are rolled up
+        again once the change commits.
+        """
+        if before == after:
+            return
+        with db_transaction.atomic():
+            cls.record_transaction(before, sign=-1)
+            cls.record_transaction(after)
+            closed = timezone.localdate() - timedelta(days=1)
+            days = [
+                timezone.localdate(snapshot['transaction_date']) for snapshot in (before, after)
+                if snapshot['status'] == 'completed'
+            ]
+            days = [day for day in days if day < closed]
+            if days:
+                db_transaction.on_commit(partial(cls.roll_up, [after['user_id']], min(days), max(days)))
+    
+    @classmethod
+    def rebuild(cls, user_ids, start, end):
+        """Recompute the users' daily rows for a date range, then roll them up"""
+        start = parse_date(start) if isinstance(start, str) else start
+        end = parse_date(end) if isinstance(end, str) else end
+        cls.rebuild_days(user_ids, start, end)
+        cls.roll_up(user_ids, start, end)
+    
+    @staticmethod
+    def _transactions(user_ids, start, end):
+        from apps.transactions.models import Transaction
+        return Transaction.objects.filter(
+            user_id__in=user_ids, status='completed', transaction_date__date__range=(start, end)
+        ).order_by()
+    
+    @classmethod
+    def _replace(cls, user_ids, period_type, start, end, rows, fields):
+        """Upsert ``rows`` and zero the users' other periods in the range"""
+        empty = {'peak_sales_hour': None, 'top_selling_products': [], 'slow_moving_products': []}
+        zeros = {field: empty.get(field, 0) for field in fields if field != 'updated_at'}
+        with db_transaction.atomic():
+            BusinessMetrics.objects.filter(
+                user_id__in=user_ids, period_type=period_type, period_start__range=(start, end)
+            ).update(**zeros, updated_at=timezone.now())
+            BusinessMetrics.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'period_type', 'period_start'],
+                update_fields=fields,
+            )
+    
+    @classmethod
+    def rebuild_days(cls, user_ids, start, end):
+        zero = Decimal('0.00')
+        sale = Q(transaction_type='sale')
+        transactions = cls._transactions(user_ids, start, end).annotate(day=TruncDate('transaction_date'))
+        totals = transactions.values('user_id', 'day').annotate(
+            sales_amount=Coalesce(Sum('total_amount', filter=sale), zero),
+            sales_count=Count('id', filter=sale),
+            cost=Coalesce(Sum('cost_of_goods', filter=sale), zero),
+            inflow=Coalesce(Sum('total_amount', filter=Q(flow_direction='inward')), zero),
+            outflow=Coalesce(Sum('total_amount', filter=Q(flow_direction='outward')), zero),
+            customers=Count('counterparty_phone', filter=sale & ~Q(counterparty_phone=''), distinct=True),
+        )
+        peak = {}
+        hourly = transactions.filter(sale).annotate(hour=ExtractHour('transaction_date')).values(
+            'user_id', 'day', 'hour'
+        ).annotate(amount=Sum('total_amount'))
+        for row in hourly:
+            key = (row['user_id'], row['day'])
+            if key not in peak or row['amount'] > peak[key][1]:
+                peak[key] = (row['hour'], row['amount'])
+        
+        rows = []
+        for row in totals:
+            metrics = BusinessMetrics(
+                user_id=row['user_id'], period_type='daily',
+                period_start=row['day'], period_end=row['day'],
+                total_sales_amount=row['sales_amount'],
+                total_sales_count=row['sales_count'],
+                total_cost_of_goods=row['cost'],
+                gross_profit=row['sales_amount'] - row['cost'],
+                cash_flow=row['inflow'] - row['outflow'],
+                unique_customers=row['customers'],
+                days_active=1 if row['sales_count'] else 0,
+            )
+            hour = peak.get((row['user_id'], row['day']))
+            metrics.peak_sales_hour = time(hour[0]) if hour else None
+            metrics.apply_derived()
+            rows.append(metrics)
+        cls._replace(user_ids, 'daily', start, end, rows, [*PERIOD_FIELDS, 'peak_sales_hour'])
+        cls.score(user_ids, 'daily', start, end)
+    
+    @classmethod
+    def roll_up(cls, user_ids, start, end):
+        """Rebuild the weeks and months covering a date range from the daily rows"""
+        from apps.inventory.services import SalesRankingService
+        for period_type, trunc in ROLLUP_PERIODS.items():
+            first = period_bounds(period_type, start)[0]
+            last = period_bounds(period_type, end)[1]
+            totals = BusinessMetrics.objects.filter(
+                user_id__in=user_ids, period_type='daily', period_start__range=(first, last)
+            ).order_by().annotate(period=trunc('period_start')).values('user_id', 'period').annotate(
+                # Aliased, since an aggregate named after its field shadows it
+                **{f'sum_{field}': Sum(field) for field in TOTAL_FIELDS},
+                active_days=Count('id', filter=Q(total_sales_count__gt=0)),
+            )
+            customers = cls._transactions(user_ids, first, last).filter(
+                transaction_type='sale'
+            ).exclude(counterparty_phone='').annotate(
+                period=trunc('transaction_date', output_field=DateField())
+            ).values('user_id', 'period').annotate(count=Count('counterparty_phone', distinct=True))
+            customers = {(row['user_id'], row['period']): row['count'] for row in customers}
+            
+            rows = []
+            for row in totals:
+                period_start, period_end = period_bounds(period_type, row['period'])
+                metrics = BusinessMetrics(
+                    user_id=row['user_id'], period_type=period_type,
+                    period_start=period_start, period_end=period_end,
+                    unique_customers=customers.get((row['user_id'], row['period']), 0),
+                    days_active=row['active_days'],
+                    **{field: row[f'sum_{field}'] for field in TOTAL_FIELDS},
+                )
+                metrics.apply_derived()
+                metrics.top_selling_products, metrics.slow_moving_products = (
+                    SalesRankingService.period_rankings(row['user_id'], period_start, period_end)
+                )
+                rows.append(metrics)
+            cls._replace(
+                user_ids, period_type, first, last, rows,
+                [*PERIOD_FIELDS, 'top_selling_products', 'slow_moving_products']
+            )
+            cls.score(user_ids, period_type, first, last)
+    
+    @staticmethod
+    def score(user_ids, period_type, first, last):
+        """Growth rate against the previous period and performance score, for the range and the period after it"""
+        before = period_bounds(period_type, first - timedelta(days=1))[0]
+        after = period_bounds(period_type, last + timedelta(days=1))[1]
+        rows = BusinessMetrics.objects.filter(
+            user_id__in=user_ids, period_type=period_type, period_start__range=(before, after)
+        ).only(
+            'id', 'user_id', 'period_start', 'period_end', 'total_sales_amount',
+            'gross_profit_margin', 'days_active', 'growth_rate', 'performance_score'
+        ).order_by('user_id', 'period_start')
+        
+        previous = {}
+        changed = []
+        for metrics in rows:
+            prior = previous.get(metrics.user_id)
+            previous[metrics.user_id] = metrics
+            if metrics.period_start < first:
+                continue
+            prior_start = period_bounds(period_type, metrics.period_start - timedelta(days=1))[0]
+            prior_sales = prior.total_sales_amount if prior and prior.period_start == prior_start else 0
+            metrics.growth_rate = growth_rate(metrics.total_sales_amount, prior_sales)
+            metrics.performance_score = metrics._calculate_performance_score()
+            changed.append(metrics)
+        BusinessMetrics.objects.bulk_update(changed, ['growth_rate', 'performance_score'], batch_size=500)
+        return len(changed)
+    
+    @classmethod
+    def active_users(cls, start, end):
+        """Users with transactions or daily metrics in a date range"""
+        from apps.transactions.models import Transaction
+        users = set(Transaction.objects.filter(
+            transaction_date__date__range=(start, end)
+        ).order_by().values_list('user_id', flat=True).distinct())
+        users.update(BusinessMetrics.objects.filter(
+            period_type='daily', period_start__range=(start, end)
+        ).order_by().values_list('user_id', flat=True).distinct())
+        return sorted(users)
+    
+    @classmethod
+    def user_chunks(cls, start, end, chunk_size=200):
+        users = cls.active_users(start, end)
+        return [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)]
+    
+    @classmethod
+    def close(cls, day=None, chunk_size=200):
+        """Finalize a day (default yesterday) and roll up its week and month"""
+        day = day or timezone.localdate() - timedelta(days=1)
+        chunks = cls.user_chunks(day, day, chunk_size)
+        for user_ids in chunks:
+            cls.rebuild(user_ids, day, day)
+        return sum(len(user_ids) for user_ids in chunks)
+
+
+# transaction_type -> (flow_type, category, whether the amount flows in)
+TRANSACTION_CASH_FLOWS = {
+    'sale': ('operating', 'sales_revenue', True),
+    'purchase': ('operating', 'inventory_purchase', False),
+}
+
+
+class CashFlowGenerationService:
+    """
+    Generates CashFlowData rows from a user's completed transactions.
+    
+    Transactions in the range are walked in primary-key batches. For each
+    batch one query finds the ``(reference_id, category)`` pairs already
+    generated, only the missing rows are built (net flow included, so
+    ``CashFlowData.save`` is not needed) and they are written with one
+    bulk_create. The unique constraint on those columns makes repeated or
+    overlapping runs insert nothing twice. The progress counters are
+    updated after every batch.
+    """
+    
+    def __init__(self, generation, batch_size=2000):
+        self.generation = generation
+        self.batch_size = batch_size
+    
+    def transactions(self):
+        from apps.transactions.models import Transaction
+        generation = self.generation
+        return Transaction.objects.filter(
+            user_id=generation.user_id,
+            status='completed',
+            transaction_type__in=TRANSACTION_CASH_FLOWS,
+            transaction_date__date__range=(generation.start_date, generation.end_date),
+        )
+    
+    def build(self, row):
+        from apps.transactions.models import Transaction
+        flow_type, category, inflow = TRANSACTION_CASH_FLOWS[row['transaction_type']]
+        amount = row['total_amount']
+        label = dict(Transaction.TRANSACTION_TYPES)[row['transaction_type']]
+        return CashFlowData(
+            user_id=self.generation.user_id,
+            flow_type=flow_type,
+            category=category,
+            inflow_amount=amount if inflow else 0,
+            outflow_amount=0 if inflow else amount,
+            net_flow=amount if inflow else -amount,
+            flow_date=timezone.localdate(row['transaction_date']),
+            reference_id=str(row['id']),
+            description=f"{label} - {row['transaction_number']}",
+        )
+    
+    def run_batch(self, pks):
+        rows = list(self.transactions().filter(pk__in=pks).values(
+            'id', 'transaction_type', 'total_amount', 'transaction_date', 'transaction_number'
+        ))
+        existing = set(CashFlowData.objects.filter(
+            reference_id__in=[str(row['id']) for row in rows],
+            category__in={category for _, category, _ in TRANSACTION_CASH_FLOWS.values()},
+        ).values_list('reference_id', 'category'))
+        missing = [
+            flow for flow in map(self.build, rows)
+            if (flow.reference_id, flow.category) not in existing
+        ]
+        CashFlowData.objects.bulk_create(missing, batch_size=self.batch_size, ignore_conflicts=True)
+        return len(missing)
+    
+    def run(self):
+        generation = self.generation
+        queryset = CashFlowGeneration.objects.filter(pk=generation.pk)
+        
+        transactions = self.transactions()
+        queryset.update(
+            status='running',
+            started_at=timezone.now(),
+            total_transactions=transactions.count(),
+        )
+        
+        try:
+            for pks in keyset_batches(transactions, ('id',), self.batch_size):
+                created = self.run_batch(pks)
+                queryset.update(
+                    processed_count=F('processed_count') + len(pks),
+                    created_count=F('created_count') + created,
+                )
+        except Exception as exc:
+            queryset.update(status='failed', error_message=str(exc), completed_at=timezone.now())
+            raise
+        
+        queryset.update(status='completed', completed_at=timezone.now())
+        generation.refresh_from_db()
+        return generation
+
+
+def _amounts(values):
+    """Decimal amounts from an array, rounded to kobo"""
+    return [Decimal(int(cents)).scaleb(-2) for cents in np.rint(np.asarray(values) * 100)]
+
+
+class CashFlowForecastService:
+    """
+    Nightly cash flow forecasts for every user with recorded cash flow.
+    
+    Actual daily inflows and outflows over the ``history_days`` before
+    ``today`` are read with one grouped query per batch of users and laid
+    out as users x days numpy matrices; days before a user's first
+    recorded flow are left out of their history. Every row of the batch
+    is fitted at once: each series is split into multiplicative
+    day-of-week, month-end and month-of-year factors (each shrunk towards
+    1 by how few days support it) and a level, the adjusted mean of the
+    last ``level_days``.
+    
+    A day's forecast is the level times its factors. The interval is
+    ``z`` standard deviations of the in-sample net flow residuals; the
+    confidence score falls as the residuals grow relative to the flows
+    and rises with the length of history. Each run replaces the users'
+    predicted CashFlowData rows after ``today``, one per user and day.
+    """
+    
+    MIN_HISTORY_DAYS = 14
+    FULL_HISTORY_DAYS = 90
+    MONTH_END_DAYS = 3
+    # Pseudo-days pulling each factor towards 1
+    SHRINKAGE = {'weekday': 4, 'month_end': 6, 'month': 30}
+    
+    def __init__(self, history_days=365, horizon_days=90, level_days=28, z=1.96,
+                 batch_size=500, today=None):
+        if not 30 <= horizon_days <= 90:
+            raise ValueError('Forecast horizon must be between 30 and 90 days')
+        self.history_days = history_days
+        self.horizon_days = horizon_days
+        self.level_days = level_days
+        self.z = z
+        self.batch_size = batch_size
+        self.today = today or timezone.localdate()
+        self.start = self.today - timedelta(days=history_days)
+        self.history = self.features([self.start + timedelta(days=i) for i in range(history_days)])
+        self.dates = [self.today + timedelta(days=i) for i in range(1, horizon_days + 1)]
+        self.horizon = self.features(self.dates)
+    
+    def features(self, dates):
+        """Weekday, month-end flag and month (0-11) of each date"""
+        return (
+            np.array([day.weekday() for day in dates]),
+            np.array([
+                day.day > calendar.monthrange(day.year, day.month)[1] - self.MONTH_END_DAYS
+                for day in dates
+            ], dtype=int),
+            np.array([day.month - 1 for day in dates]),
+        )
+    
+    def actuals(self):
+        return CashFlowData.objects.filter(
+            is_predicted=False, flow_date__gte=self.start, flow_date__lt=self.today
+        )
+    
+    def users(self):
+        return User.objects.filter(id__in=self.actuals().values('user_id'))
+    
+    def flow_matrices(self, user_ids):
+        """Inflows, outflows and whether anything was recorded, per user (rows) and day"""
+        rows = self.actuals().filter(user_id__in=user_ids).order_by().values('user_id', 'flow_date').annotate(
+            inflow=Sum('inflow_amount'), outflow=Sum('outflow_amount')
+        ).values_list('user_id', 'flow_date', 'inflow', 'outflow')
+        
+        shape = (len(user_ids), self.history_days)
+        inflows, outflows, recorded = np.zeros(shape), np.zeros(shape), np.zeros(shape, dtype=bool)
+        index = {pk: i for i, pk in enumerate(user_ids)}
+        cells = [(index[pk], (day - self.start).days, float(inflow), float(outflow))
+                 for pk, day, inflow, outflow in rows]
+        if cells:
+            users, days, inflow, outflow = zip(*cells)
+            users, days = np.array(users), np.array(days)
+            np.add.at(inflows, (users, days), inflow)
+            np.add.at(outflows, (users, days), outflow)
+            recorded[users, days] = True
+        return inflows, outflows, recorded
+    
+    @staticmethod
+    def factors(series, active, labels, count, shrinkage):
+        """Each label's mean over the row's mean, shrunk towards 1 (rows x ``count``)"""
+        onehot = (labels[:, None] == np.arange(count)).astype(float)
+        weights = active.astype(float)
+        days = weights @ onehot
+        sums = (series * weights) @ onehot
+        mean = (series * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1)
+        label_mean = np.divide(sums, days, out=np.zeros_like(sums), where=days > 0)
+        ratio = np.divide(label_mean, mean[:, None], out=np.ones_like(sums), where=mean[:, None] > 0)
+        return (days * ratio + shrinkage) / (days + shrinkage)
+    
+    def fit(self, series, active):
+        """
+        Level and factors of each row of ``series``, and the in-sample fit
+        (the adjusted mean of the whole history times the factors)
+        """
+        weekday, month_end, month = self.history
+        weekly = self.factors(series, active, weekday, 7, self.SHRINKAGE['weekday'])
+        adjusted = series / weekly[:, weekday]
+        ends = self.factors(adjusted, active, month_end, 2, self.SHRINKAGE['month_end'])
+        adjusted = adjusted / ends[:, month_end]
+        seasonal = self.factors(adjusted, active, month, 12, self.SHRINKAGE['month'])
+        adjusted = adjusted / seasonal[:, month]
+        
+        recent = active & (np.arange(self.history_days) >= self.history_days - self.level_days)
+        level = (adjusted * recent).sum(axis=1) / np.maximum(recent.sum(axis=1), 1)
+        base = (adjusted * active).sum(axis=1) / np.maximum(active.sum(axis=1), 1)
+        profile = (weekly, ends, seasonal)
+        return level, profile, base[:, None] * self.pattern(profile, self.history)
+    
+    @staticmethod
+    def pattern(profile, features):
+        """Product of the factors that apply on each day of ``features``"""
+        weekly, ends, seasonal = profile
+        weekday, month_end, month = features
+        return weekly[:, weekday] * ends[:, month_end] * seasonal[:, month]
+    
+    def forecast(self, inflows, outflows, active):
+        """Predicted inflows and outflows, net flow interval half-width and confidence"""
+        observed = np.maximum(active.sum(axis=1), 1)
+        predicted, fitted = [], []
+        for series in (inflows, outflows):
+            level, profile, fit = self.fit(series, active)
+            predicted.append(level[:, None] * self.pattern(profile, self.horizon))
+            fitted.append(fit)
+        
+        residuals = np.where(active, (inflows - outflows) - (fitted[0] - fitted[1]), 0)
+        std = np.sqrt((residuals ** 2).sum(axis=1) / observed)
+        scale = (np.where(active, inflows + outflows, 0)).sum(axis=1) / observed
+        spread = np.divide(std, scale, out=np.zeros_like(std), where=scale > 0)
+        confidence = np.minimum(observed / self.FULL_HISTORY_DAYS, 1) / (1 + spread)
+        return predicted[0], predicted[1], self.z * std, np.round(confidence, 3)
+    
+    def run_batch(self, pks):
+        pks = list(pks)
+        inflows, outflows, recorded = self.flow_matrices(pks)
+        first_day = recorded.argmax(axis=1)
+        active = recorded.any(axis=1)[:, None] & (np.arange(self.history_days) >= first_day[:, None])
+        keep = np.flatnonzero(active.sum(axis=1) >= self.MIN_HISTORY_DAYS)
+        
+        predictions = []
+        if len(keep):
+            inflow, outflow, margin, confidence = self.forecast(inflows[keep], outflows[keep], active[keep])
+            margins = _amounts(margin)
+            for row, i in enumerate(keep):
+                values = zip(self.dates, _amounts(inflow[row]), _amounts(outflow[row]))
+                for day, inflow_amount, outflow_amount in values:
+                    net_flow = inflow_amount - outflow_amount
+                    predictions.append(CashFlowData(
+                        user_id=pks[i],
+                        flow_type='operating',
+                        category='other',
+                        inflow_amount=inflow_amount,
+                        outflow_amount=outflow_amount,
+                        net_flow=net_flow,
+                        net_flow_lower=net_flow - margins[row],
+                        net_flow_upper=net_flow + margins[row],
+                        flow_date=day,
+                        description='Forecast',
+                        is_predicted=True,
+                        confidence_score=float(confidence[row]),
+                    ))
+        
+        with db_transaction.atomic():
+            CashFlowData.objects.filter(user_id__in=pks, is_predicted=True, flow_date__gt=self.today).delete()
+            CashFlowData.objects.bulk_create(predictions, batch_size=1000)
+        return len(keep)
+    
+    def run(self):
+        forecast = 0
+        for pks in keyset_batches(self.users(), ('id',), self.batch_size):
+            forecast += self.run_batch(pks)
+        return forecast
@@ -0,0 +1,150 @@
+# backend/apps/analytics/signals.py
+"""
+Feed stock, transaction and savings changes into the alert engine and the
+daily business metrics, and drop the dashboard sections they make stale
+"""
+
+from functools import partial
+
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.inventory.models import Product
+from apps.loans.models import Loan
+from apps.savings.models import SavingsAccount
+from apps.savings.signals import balance_changed
+from apps.transactions.models import Transaction
+from .models import AlertRule
+from .services import AlertEngine, DashboardService, MetricsRollupService, daily_sales_metrics, inventory_metrics
+
+PRODUCT_METRICS = ['current_stock', 'low_stock_count', 'out_of_stock_count', 'inventory_value']
+TRANSACTION_METRICS = ['transaction_amount', 'daily_sales', 'daily_transactions']
+SAVINGS_METRICS = ['savings_balance']
+
+
+def _evaluate_on_commit(user_id, collect, context):
+    """Evaluate once the change is committed, so aggregates see it"""
+    def run():
+        values = collect()
+        if values:
+            AlertEngine.evaluate(user_id, values, context)
+    db_transaction.on_commit(run)
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    watched = AlertEngine.watched_metrics(instance.user_id, PRODUCT_METRICS)
+    if not watched:
+        return
+    
+    def collect():
+        values = {}
+        if 'current_stock' in watched:
+            values['current_stock'] = instance.current_stock
+        if len(watched) > len(values):
+            values.update(
+                (metric, value) for metric, value in inventory_metrics(instance.user_id).items()
+                if metric in watched
+            )
+        return values
+    
+    _evaluate_on_commit(
+        instance.user_id, collect, {'subject': instance.name, 'product_id': instance.id}
+    )
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    watched = AlertEngine.watched_metrics(instance.user_id, TRANSACTION_METRICS)
+    if not watched:
+        return
+    
+    def collect():
+        values = {}
+        if 'transaction_amount' in watched:
+            values['transaction_amount'] = instance.total_amount
+        if len(watched) > len(values):
+            values.update(
+                (metric, value) for metric, value in daily_sales_metrics(instance.user_id).items()
+                if metric in watched
+            )
+        return values
+    
+    _evaluate_on_commit(
+        instance.user_id, collect,
+        {'subject': instance.transaction_number, 'transaction_id': instance.id}
+    )
+
+
+@receiver(post_save, sender=SavingsAccount)
+@receiver(balance_changed, sender=SavingsAccount)
+def savings_balance_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if not AlertEngine.watched_metrics(instance.user_id, SAVINGS_METRICS):
+        return
+    
+    _evaluate_on_commit(
+        instance.user_id,
+        partial(dict, savings_balance=instance.current_balance),
+        {'subject': instance.account_name, 'savings_account_id': instance.id}
+    )
+
+
+@receiver(post_save, sender=AlertRule)
+@receiver(post_delete, sender=AlertRule)
+def alert_rule_changed(sender, instance, **kwargs):
+    AlertEngine.invalidate(instance.user_id)
+
+
+def _invalidate_dashboard(user_id, section):
+    """Drop the section once the change commits, so a rebuild sees it"""
+    db_transaction.on_commit(partial(DashboardService.invalidate, user_id, section))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def transaction_dashboard_changed(sender, instance, **kwargs):
+    _invalidate_dashboard(instance.user_id, 'sales')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_dashboard_changed(sender, instance, **kwargs):
+    _invalidate_dashboard(instance.user_id, 'inventory')
+
+
+@receiver(post_save, sender=SavingsAccount)
+@receiver(post_delete, sender=SavingsAccount)
+@receiver(balance_changed, sender=SavingsAccount)
+def savings_dashboard_changed(sender, instance, **kwargs):
+    _invalidate_dashboard(instance.user_id, 'savings')
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+def loan_dashboard_changed(sender, instance, **kwargs):
+    _invalidate_dashboard(instance.borrower_id, 'loans')
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_recorded(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    snapshot = instance.metrics_snapshot()
+    if created:
+        MetricsRollupService.record_transaction(snapshot)
+    elif instance._metrics_snapshot is not None:
+        # Edits (status, amount, type, date) move the transaction between days
+        MetricsRollupService.record_change(instance._metrics_snapshot, snapshot)
+    instance._metrics_snapshot = snapshot
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_removed(sender, instance, **kwargs):
+    MetricsRollupService.record_transaction(instance._metrics_snapshot or instance.metrics_snapshot(), sign=-1)
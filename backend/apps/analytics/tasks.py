@@ -0,0 +1,51 @@
+# backend/apps/analytics/tasks.py
+"""
+Background tasks for analytics
+"""
+
+from datetime import date
+
+from celery import group, shared_task
+
+from .models import CashFlowGeneration
+from .services import CashFlowForecastService, CashFlowGenerationService, MetricsRollupService
+
+
+@shared_task
+def close_business_metrics(day=None):
+    """Finalize yesterday's metrics and roll up its week and month (run nightly by beat)"""
+    return MetricsRollupService.close(date.fromisoformat(day) if day else None)
+
+
+@shared_task
+def rebuild_business_metrics(user_ids, start, end):
+    """Rebuild one chunk of users' metrics for a date range"""
+    MetricsRollupService.rebuild(user_ids, start, end)
+    return len(user_ids)
+
+
+@shared_task
+def backfill_business_metrics(start, end, chunk_size=200):
+    """Rebuild metrics for a date range as parallel jobs, one per chunk of users"""
+    chunks = MetricsRollupService.user_chunks(date.fromisoformat(start), date.fromisoformat(end), chunk_size)
+    group(
+        rebuild_business_metrics.s([str(user_id) for user_id in user_ids], start, end)
+        for user_ids in chunks
+    ).apply_async()
+    return len(chunks)
+
+
+@shared_task
+def generate_cash_flow(generation_id):
+    """Generate CashFlowData for a pending CashFlowGeneration"""
+    generation = CashFlowGeneration.objects.filter(id=generation_id, status='pending').first()
+    if generation is None:
+        return None
+    CashFlowGenerationService(generation).run()
+    return str(generation.id)
+
+
+@shared_task
+def forecast_cash_flow():
+    """Refit every user's cash flow forecast (run nightly by beat)"""
+    return CashFlowForecastService().run()
@@ -1,3 +1,458 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Product, ProductCategory
+from apps.notifications.models import Notification
+from apps.transactions.models import Transaction, TransactionCategory
+from apps.users.models import User
+from .models import AlertRule, BusinessMetrics, CashFlowData, CashFlowGeneration
+from .services import (
+    CashFlowForecastService, CashFlowGenerationService, DashboardService, MetricsRollupService
+)
+
+
+class AlertEngineTests(TestCase):
+    """Rules fire from stock changes without scanning other rules"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='alerts@example.com', username='alerts', password='pass',
+            phone_number='08030000007', first_name='Gbenga', last_name='Ola'
+        )
+        cls.category = ProductCategory.objects.create(name='Grains', category_type='food_beverages')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_rule(self, **kwargs):
+        defaults = {
+            'user': self.user, 'name': 'Rice running low', 'alert_type': 'low_stock',
+            'metric_field': 'current_stock', 'operator': 'lte',
+            'threshold_value': Decimal('5'),
+        }
+        defaults.update(kwargs)
+        return AlertRule.objects.create(**defaults)
+
+    def create_product(self, stock):
+        return Product.objects.create(
+            user=self.user, category=self.category, name='Rice',
+            cost_price=Decimal('40000'), selling_price=Decimal('45000'), current_stock=stock
+        )
+
+    def test_rule_fires_on_stock_change(self):
+        rule = self.create_rule()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.create_product(Decimal('10'))
+        self.assertFalse(Notification.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.current_stock = Decimal('4')
+            product.save()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.notification_type, 'low_stock')
+        self.assertEqual(notification.metadata['alert_rule_id'], str(rule.id))
+        rule.refresh_from_db()
+        self.assertEqual(rule.trigger_count, 1)
+
+    def test_cooldown_is_respected(self):
+        self.create_rule(last_triggered=timezone.now() - timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(Decimal('1'))
+        self.assertFalse(Notification.objects.exists())
+
+    def test_aggregate_metric(self):
+        self.create_rule(name='Too many empty shelves', metric_field='out_of_stock_count',
+                         operator='gte', threshold_value=Decimal('1'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(Decimal('0'))
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_no_rules_means_no_queries(self):
+        product = self.create_product(Decimal('10'))
+        product.current_stock = Decimal('9')
+        # Warm the rule index cache
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.current_stock = Decimal('8')
+        with self.assertNumQueries(2):
+            # Product update and inventory summary update only
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+
+
+class DashboardTests(TestCase):
+    """The composite dashboard is cached per section and revalidated by ETag"""
+
+    url = '/api/analytics/metrics/overview/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='dashboard@example.com', username='dashboard', password='pass',
+            phone_number='08030000010', first_name='Musa', last_name='Ibrahim'
+        )
+        cls.category = ProductCategory.objects.create(name='Drinks', category_type='food_beverages')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_product(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                user=self.user, category=self.category, name=name,
+                cost_price=Decimal('100'), selling_price=Decimal('150'), current_stock=Decimal('3')
+            )
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        self.create_product('Malt')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['inventory']['total_products'], 1)
+        self.assertEqual(response.data['sales']['today']['total_transactions'], 0)
+        self.assertEqual(response.data['loans']['total_loans'], 0)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_changes_rebuild_only_their_section(self):
+        etag = self.client.get(self.url)['ETag']
+        self.create_product('Zobo')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['inventory']['total_products'], 1)
+
+    def test_rebuilt_snapshot_with_same_content_keeps_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        DashboardService.invalidate(self.user.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_dashboard_quick_stats_use_snapshot(self):
+        self.create_product('Malt')
+        category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        for number, transaction_type in enumerate(('sale', 'sale', 'purchase', 'return')):
+            Transaction.objects.create(
+                user=self.user, transaction_category=category, transaction_type=transaction_type,
+                total_amount=Decimal('100.00'), amount_paid=Decimal('100.00'), payment_method='cash',
+                transaction_number=f'TXN-DASH-{number}'
+            )
+        data = self.client.get('/api/analytics/metrics/dashboard/').data
+        self.assertEqual(data['quick_stats']['total_products'], 1)
+        self.assertEqual(data['quick_stats']['low_stock_products'], 0)
+        self.assertEqual(data['quick_stats']['today_transactions'], 2)
+        self.assertEqual(data['quick_stats']['today_sales'], Decimal('200.00'))
+
+
+class MetricsRollupTests(TestCase):
+    """Daily metrics follow transactions and roll up into weeks and months"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='rollup@example.com', username='rollup', password='pass',
+            phone_number='08030000011', first_name='Ada', last_name='Obi'
+        )
+        cls.sales = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        cls.product = Product.objects.create(
+            user=cls.user, category=ProductCategory.objects.create(name='Snacks', category_type='food_beverages'),
+            name='Chin chin', cost_price=Decimal('150.00'), selling_price=Decimal('200.00'),
+            current_stock=Decimal('100')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def daily(self, day=None):
+        return BusinessMetrics.objects.get(
+            user=self.user, period_type='daily', period_start=day or timezone.localdate()
+        )
+
+    def record(self, day, amount, transaction_type='sale', phone='', cost=Decimal('0')):
+        transaction = Transaction.objects.create(
+            user=self.user, transaction_category=self.sales, transaction_type=transaction_type,
+            flow_direction='inward' if transaction_type == 'sale' else 'outward',
+            total_amount=Decimal(amount), amount_paid=Decimal(amount), cost_of_goods=cost,
+            payment_method='cash', counterparty_phone=phone,
+            transaction_number=f'TXN-TEST-{Transaction.objects.count() + 1}'
+        )
+        moment = timezone.make_aware(datetime.combine(day, time(10)))
+        Transaction.objects.filter(pk=transaction.pk).update(transaction_date=moment)
+        return transaction
+
+    def test_sales_update_daily_row(self):
+        for quantity in (2, 1):
+            response = self.client.post('/api/transactions/transactions/', {
+                'transaction_category': self.sales.id,
+                'transaction_type': 'sale',
+                'payment_method': 'cash',
+                'items': [{'product_id': str(self.product.id), 'quantity': quantity}],
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+
+        daily = self.daily()
+        self.assertEqual((daily.total_sales_amount, daily.total_sales_count), (Decimal('600.00'), 2))
+        self.assertEqual(daily.total_cost_of_goods, Decimal('450.00'))
+        self.assertEqual(daily.gross_profit, Decimal('150.00'))
+        self.assertEqual(daily.gross_profit_margin, Decimal('25.00'))
+        self.assertEqual(daily.average_transaction_value, Decimal('300.00'))
+        self.assertEqual((daily.cash_flow, daily.days_active), (Decimal('600.00'), 1))
+
+        Transaction.objects.filter(transaction_type='sale').first().delete()
+        self.assertEqual(self.daily().total_sales_count, 1)
+
+    def test_edits_to_closed_days_roll_up_again(self):
+        day = date(2026, 9, 8)
+        sale = self.record(day, '100')
+        MetricsRollupService.rebuild([self.user.id], day, day)
+
+        sale = Transaction.objects.get(pk=sale.pk)
+        sale.total_amount = Decimal('250.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.save()
+        month = BusinessMetrics.objects.get(user=self.user, period_type='monthly', period_start=date(2026, 9, 1))
+        self.assertEqual(month.total_sales_amount, Decimal('250.00'))
+
+    def test_edits_move_transaction_between_days(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        sale = self.record(today, '500', cost=Decimal('300'))
+        self.assertEqual(self.daily().total_sales_amount, Decimal('500.00'))
+
+        sale = Transaction.objects.get(pk=sale.pk)
+        sale.total_amount = Decimal('400.00')
+        sale.transaction_date = timezone.make_aware(datetime.combine(yesterday, time(10)))
+        sale.save()
+        self.assertEqual((self.daily().total_sales_amount, self.daily().total_sales_count), (0, 0))
+        moved = self.daily(yesterday)
+        self.assertEqual((moved.total_sales_amount, moved.gross_profit), (Decimal('400.00'), Decimal('100.00')))
+
+        sale.status = 'cancelled'
+        sale.save()
+        self.assertEqual(self.daily(yesterday).total_sales_count, 0)
+        sale.status = 'completed'
+        sale.save()
+        self.assertEqual(self.daily(yesterday).total_sales_count, 1)
+
+    def test_rebuild_rolls_up_weeks_and_months(self):
+        monday = date(2026, 9, 7)
+        self.record(monday, '100', phone='08011111111')
+        self.record(monday + timedelta(days=2), '300', phone='08011111111')
+        self.record(monday + timedelta(days=2), '50', transaction_type='expense')
+        self.record(monday + timedelta(days=8), '200', phone='08022222222')
+
+        MetricsRollupService.rebuild([self.user.id], date(2026, 9, 1), date(2026, 9, 30))
+
+        self.assertEqual(self.daily(monday).total_sales_amount, Decimal('100.00'))
+        wednesday = self.daily(monday + timedelta(days=2))
+        self.assertEqual((wednesday.cash_flow, wednesday.peak_sales_hour), (Decimal('250.00'), time(10)))
+
+        first, second = BusinessMetrics.objects.filter(user=self.user, period_type='weekly').order_by('period_start')
+        self.assertEqual((first.period_start, first.period_end), (monday, monday + timedelta(days=6)))
+        self.assertEqual((first.total_sales_amount, first.total_sales_count), (Decimal('400.00'), 2))
+        self.assertEqual((first.days_active, first.unique_customers), (2, 1))
+        self.assertEqual(first.cash_flow, Decimal('350.00'))
+        self.assertEqual(second.growth_rate, Decimal('-50.00'))
+        self.assertGreater(second.performance_score, 0)
+
+        month = BusinessMetrics.objects.get(user=self.user, period_type='monthly')
+        self.assertEqual((month.period_start, month.period_end), (date(2026, 9, 1), date(2026, 9, 30)))
+        self.assertEqual((month.total_sales_amount, month.days_active, month.unique_customers), (Decimal('600.00'), 3, 2))
+
+    def test_close_matches_incremental_totals(self):
+        today = timezone.localdate()
+        self.record(today, '120', cost=Decimal('100'))
+        self.record(today, '30', transaction_type='expense')
+        incremental = self.daily()
+        self.assertEqual(MetricsRollupService.close(today), 1)
+
+        closed = self.daily()
+        for field in ('total_sales_amount', 'total_cost_of_goods', 'gross_profit', 'cash_flow', 'gross_profit_margin'):
+            self.assertEqual(getattr(closed, field), getattr(incremental, field), field)
+        self.assertEqual(
+            BusinessMetrics.objects.get(user=self.user, period_type='monthly').total_sales_amount,
+            Decimal('120.00')
+        )
+
+    def test_generate_metrics_refreshes_existing_rows(self):
+        day = date(2026, 9, 7)
+        self.record(day, '100')
+        for _ in range(2):
+            response = self.client.post('/api/analytics/metrics/generate_metrics/', {
+                'period_type': 'weekly', 'start_date': '2026-09-07', 'end_date': '2026-09-13'
+            }, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([row['total_sales_amount'] for row in response.data], ['100.00'])
+
+
+class CashFlowGenerationTests(TestCase):
+    """Cash flow rows are generated in batches and never twice"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cashflow@example.com', username='cashflow', password='pass',
+            phone_number='08030000012', first_name='Funke', last_name='Ade'
+        )
+        cls.category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        cls.start = date(2026, 1, 1)
+        for index in range(5):
+            transaction_type = 'sale' if index % 2 == 0 else 'purchase'
+            Transaction.objects.create(
+                user=cls.user, transaction_category=cls.category, transaction_type=transaction_type,
+                total_amount=Decimal('100.00'), amount_paid=Decimal('100.00'), payment_method='cash',
+                transaction_number=f'TXN-CF-{index}'
+            )
+        Transaction.objects.filter(user=cls.user).update(
+            transaction_date=timezone.make_aware(datetime.combine(cls.start, time(9)))
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_generation(self, batch_size=2):
+        generation = CashFlowGeneration.objects.create(
+            user=self.user, start_date=self.start, end_date=self.start
+        )
+        return CashFlowGenerationService(generation, batch_size=batch_size).run()
+
+    def test_generates_missing_rows_once(self):
+        first = self.run_generation()
+        self.assertEqual(first.status, 'completed')
+        self.assertEqual((first.total_transactions, first.processed_count, first.created_count), (5, 5, 5))
+        self.assertEqual(first.progress_percentage, 100)
+
+        flows = CashFlowData.objects.filter(user=self.user)
+        self.assertEqual(flows.filter(category='sales_revenue').count(), 3)
+        purchase = flows.get(category='inventory_purchase', reference_id=str(
+            Transaction.objects.filter(transaction_type='purchase').first().id
+        ))
+        self.assertEqual((purchase.outflow_amount, purchase.net_flow), (Decimal('100.00'), Decimal('-100.00')))
+
+        flows.first().delete()
+        second = self.run_generation()
+        self.assertEqual(second.created_count, 1)
+        self.assertEqual(flows.count(), 5)
+
+    def test_batch_queries_do_not_grow_with_transactions(self):
+        generation = CashFlowGeneration.objects.create(
+            user=self.user, start_date=self.start, end_date=self.start
+        )
+        service = CashFlowGenerationService(generation)
+        pks = list(service.transactions().values_list('pk', flat=True))
+        with self.assertNumQueries(3):
+            self.assertEqual(service.run_batch(pks), 5)
+
+    def test_endpoint_queues_generation(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/analytics/cash-flow/generate_from_transactions/', {
+                'start_date': '2026-01-01', 'end_date': '2026-01-31'
+            }, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(len(callbacks), 1)
+
+        status = self.client.get(f"/api/analytics/cash-flow-generations/{response.data['id']}/")
+        self.assertEqual(status.data['end_date'], '2026-01-31')
+
+        invalid = self.client.post('/api/analytics/cash-flow/generate_from_transactions/', {
+            'start_date': '2026-02-01', 'end_date': '2026-01-01'
+        }, format='json')
+        self.assertEqual(invalid.status_code, 400)
+
+
+class CashFlowForecastTests(TestCase):
+    """Forecasts learn weekly patterns and blend into the summary"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='forecast@example.com', username='forecast', password='pass',
+            phone_number='08030000013', first_name='Kemi', last_name='Bello'
+        )
+        cls.newcomer = User.objects.create_user(
+            email='newcomer@example.com', username='newcomer', password='pass',
+            phone_number='08030000014', first_name='Tayo', last_name='Eze'
+        )
+        cls.today = timezone.localdate()
+        flows = []
+        for offset in range(1, 121):
+            day = cls.today - timedelta(days=offset)
+            inflow = Decimal('300.00') if day.weekday() == 5 else Decimal('100.00')
+            flows.append(CashFlowData(
+                user=cls.user, flow_type='operating', category='sales_revenue', flow_date=day,
+                inflow_amount=inflow, net_flow=inflow
+            ))
+            flows.append(CashFlowData(
+                user=cls.user, flow_type='operating', category='inventory_purchase', flow_date=day,
+                outflow_amount=Decimal('50.00'), net_flow=Decimal('-50.00')
+            ))
+        flows += [
+            CashFlowData(
+                user=cls.newcomer, flow_type='operating', category='sales_revenue',
+                flow_date=cls.today - timedelta(days=offset), inflow_amount=Decimal('80.00'),
+                net_flow=Decimal('80.00')
+            )
+            for offset in range(1, 6)
+        ]
+        CashFlowData.objects.bulk_create(flows)
+
+    def predictions(self, user=None):
+        return CashFlowData.objects.filter(user=user or self.user, is_predicted=True).order_by('flow_date')
+
+    def test_forecast_follows_weekday_pattern(self):
+        self.assertEqual(CashFlowForecastService(horizon_days=30).run(), 1)
+        CashFlowForecastService(horizon_days=30).run()
+
+        predictions = list(self.predictions())
+        self.assertEqual(len(predictions), 30)
+        self.assertFalse(self.predictions(self.newcomer).exists())
+        self.assertEqual(predictions[0].flow_date, self.today + timedelta(days=1))
+
+        saturday = next(row for row in predictions if row.flow_date.weekday() == 5)
+        monday = next(row for row in predictions if row.flow_date.weekday() == 0)
+        self.assertGreater(saturday.inflow_amount, monday.inflow_amount * 2)
+        self.assertAlmostEqual(float(monday.outflow_amount), 50, delta=5)
+        for row in predictions:
+            self.assertLessEqual(row.net_flow_lower, row.net_flow)
+            self.assertGreaterEqual(row.net_flow_upper, row.net_flow)
+            self.assertTrue(0 < row.confidence_score <= 1)
+
+        with self.assertRaises(ValueError):
+            CashFlowForecastService(horizon_days=120)
+
+    def test_summary_blends_actuals_and_forecast(self):
+        CashFlowForecastService(horizon_days=30).run()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.assertNumQueries(1):
+            response = client.get('/api/analytics/cash-flow/summary/', {'days': 7, 'forecast_days': 14})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(len(data['daily_breakdown']), 7)
+        self.assertEqual(data['total_outflows'], Decimal('350.00'))
+        self.assertEqual(data['by_category']['inventory_purchase']['outflows'], Decimal('350.00'))
 
-# Create your tests here.
+        forecast = data['forecast']
+        self.assertEqual(len(forecast['daily_breakdown']), 14)
+        self.assertEqual(
+            forecast['net_cash_flow'], sum(row.net_flow for row in self.predictions()[:14])
+        )
+        self.assertNotIn('forecast', client.get('/api/analytics/cash-flow/summary/').data)
@@ -5,11 +5,15 @@ URL configuration for analytics and reporting
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BusinessMetricsViewSet, CashFlowDataViewSet, BusinessInsightViewSet, AlertRuleViewSet
+from .views import (
+    BusinessMetricsViewSet, CashFlowDataViewSet, CashFlowGenerationViewSet,
+    BusinessInsightViewSet, AlertRuleViewSet
+)
 
 router = DefaultRouter()
 router.register(r'metrics', BusinessMetricsViewSet)
 router.register(r'cash-flow', CashFlowDataViewSet)
+router.register(r'cash-flow-generations', CashFlowGenerationViewSet)
 router.register(r'insights', BusinessInsightViewSet)
 router.register(r'alerts', AlertRuleViewSet)
 
@@ -6,30 +6,40 @@ Analytics and reporting API views for business intelligence
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django.db.models import Q, Sum, Count, Avg, F
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from django.db import transaction as db_transaction
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
-from .models import BusinessMetrics, CashFlowData, BusinessInsight, AlertRule
+from .models import BusinessMetrics, CashFlowData, CashFlowGeneration, BusinessInsight, AlertRule
 from .serializers import (
     BusinessMetricsSerializer,
     CashFlowDataSerializer,
+    CashFlowGenerationSerializer,
     BusinessInsightSerializer,
     AlertRuleSerializer
 )
+from .services import ALERT_METRICS, ROLLUP_PERIODS, DashboardService, MetricsRollupService
+from .tasks import generate_cash_flow
+from utils.pagination import PaginatedActionsMixin, StandardResultsSetPagination
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for analytics views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+def etag_matches(request, etag):
+    """Whether the request's If-None-Match already names ``etag``"""
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or quote_etag(etag) in etags
 
 
-class BusinessMetricsViewSet(viewsets.ModelViewSet):
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = quote_etag(etag)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class BusinessMetricsViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing business metrics and performance data
     """
@@ -72,74 +82,67 @@ class BusinessMetricsViewSet(viewsets.ModelViewSet):
         return Response(dashboard_data)
     
     def _get_quick_stats(self, user):
-        """Get quick statistics for dashboard"""
-        try:
-            from apps.transactions.models import Transaction
-            from apps.inventory.models import Product
-            from apps.savings.models import SavingsAccount
-            
-            # Sales stats
-            today_transactions = Transaction.objects.filter(
-                user=user,
-                transaction_date__date=timezone.now().date(),
-                transaction_type='sale'
-            )
-            
-            # Inventory stats
-            products = Product.objects.filter(user=user)
-            
-            # Savings stats
-            savings_accounts = SavingsAccount.objects.filter(user=user)
-            
-            return {
-                'today_sales': sum(t.total_amount for t in today_transactions),
-                'today_transactions': today_transactions.count(),
-                'total_products': products.count(),
-                'low_stock_products': products.filter(is_low_stock=True).count(),
-                'total_savings': sum(sa.current_balance for sa in savings_accounts),
-                'active_savings_accounts': savings_accounts.filter(status='active').count()
-            }
-        except ImportError:
-            return {}
+        """Get quick statistics for dashboard, from the cached snapshot"""
+        data, _ = DashboardService.snapshot(user.id)
+        return {
+            'today_sales': data['sales']['today']['sales_amount'],
+            'today_transactions': data['sales']['today']['sales_count'],
+            'total_products': data['inventory']['total_products'],
+            'low_stock_products': data['inventory']['low_stock_products'],
+            'total_savings': data['savings']['total_balance'],
+            'active_savings_accounts': data['savings']['active_accounts'],
+        }
+    
+    @action(detail=False, methods=['get'])
+    def overview(self, request):
+        """
+        Composite dashboard (sales, inventory, savings and loans) served
+        from the per-user cached snapshot. Clients send the ETag back in
+        If-None-Match and get a 304 while nothing has changed.
+        """
+        etag = DashboardService.cached_etag(request.user.id)
+        if etag and etag_matches(request, etag):
+            return not_modified(etag)
+        
+        data, etag = DashboardService.snapshot(request.user.id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = Response(data)
+        response['ETag'] = quote_etag(etag)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
     @action(detail=False, methods=['post'])
     def generate_metrics(self, request):
-        """Generate metrics for a specific period"""
+        """
+        Recompute metrics for a date range from transactions and return the
+        ``period_type`` rows covering it. Metrics are kept current
+        automatically; this refreshes a range on demand.
+        """
         period_type = request.data.get('period_type', 'daily')
-        start_date = request.data.get('start_date')
-        end_date = request.data.get('end_date')
-        
-        if not start_date or not end_date:
+        try:
+            start_date = date.fromisoformat(request.data.get('start_date', ''))
+            end_date = date.fromisoformat(request.data.get('end_date', ''))
+        except (TypeError, ValueError):
             return Response(
-                {'error': 'Start date and end date are required'}, 
+                {'error': 'Start date and end date are required (YYYY-MM-DD)'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if metrics already exist
-        existing_metrics = BusinessMetrics.objects.filter(
-            user=request.user,
-            period_type=period_type,
-            period_start=start_date
-        ).first()
-        
-        if existing_metrics:
+        if period_type not in ('daily', *ROLLUP_PERIODS) or start_date > end_date:
             return Response(
-                {'error': 'Metrics for this period already exist'}, 
+                {'error': 'Invalid period type or date range'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create new metrics
-        metrics = BusinessMetrics.objects.create(
-            user=request.user,
+        MetricsRollupService.rebuild([request.user.id], start_date, end_date)
+        metrics = self.get_queryset().filter(
             period_type=period_type,
-            period_start=start_date,
-            period_end=end_date
-        )
-        
-        # Calculate metrics
-        metrics.calculate_metrics()
+            period_start__lte=end_date,
+            period_end__gte=start_date
+        ).order_by('period_start')
         
-        serializer = self.get_serializer(metrics)
+        serializer = self.get_serializer(metrics, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -171,7 +174,7 @@ class BusinessMetricsViewSet(viewsets.ModelViewSet):
         return Response(trends)
 
 
-class CashFlowDataViewSet(viewsets.ModelViewSet):
+class CashFlowDataViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing cash flow data
     """
@@ -190,121 +193,126 @@ class CashFlowDataViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Get cash flow summary"""
+        """
+        Cash flow summary for the last ``days`` days and, with
+        ``forecast_days``, the forecast for the days after today. Actual
+        and predicted rows are grouped in one query.
+        """
         days = int(request.query_params.get('days', 30))
-        since_date = timezone.now() - timedelta(days=days)
+        forecast_days = int(request.query_params.get('forecast_days', 0))
+        today = timezone.localdate()
+        
+        rows = self.get_queryset().filter(
+            Q(is_predicted=False, flow_date__gte=today - timedelta(days=days))
+            | Q(is_predicted=True, flow_date__gt=today, flow_date__lte=today + timedelta(days=forecast_days))
+        ).order_by().values('is_predicted', 'flow_date', 'flow_type', 'category').annotate(
+            inflows=Sum('inflow_amount'),
+            outflows=Sum('outflow_amount'),
+            net=Sum('net_flow'),
+            net_lower=Sum('net_flow_lower'),
+            net_upper=Sum('net_flow_upper'),
+            confidence=Avg('confidence_score'),
+        )
         
-        cash_flow_data = self.get_queryset().filter(flow_date__gte=since_date.date())
+        def totals():
+            return {'inflows': Decimal('0'), 'outflows': Decimal('0'), 'net': Decimal('0')}
+        
+        def add(bucket, row, fields=('inflows', 'outflows', 'net')):
+            for field in fields:
+                bucket[field] += row[field] or 0
+        
+        actual = totals()
+        by_category = {category: totals() for category, _ in CashFlowData.FLOW_CATEGORIES}
+        by_type = {flow_type: totals() for flow_type, _ in CashFlowData.CASH_FLOW_TYPES}
+        daily = {}
+        predicted = totals()
+        forecast_daily = {}
+        for row in rows:
+            if row['is_predicted']:
+                add(predicted, row)
+                day = forecast_daily.setdefault(
+                    row['flow_date'], {**totals(), 'net_lower': Decimal('0'), 'net_upper': Decimal('0')}
+                )
+                add(day, row, ('inflows', 'outflows', 'net', 'net_lower', 'net_upper'))
+                day['confidence_score'] = row['confidence']
+                continue
+            for bucket in (actual, by_category[row['category']], by_type[row['flow_type']]):
+                add(bucket, row)
+            add(daily.setdefault(row['flow_date'], totals()), row)
         
         summary = {
-            'total_inflows': sum(cf.inflow_amount for cf in cash_flow_data),
-            'total_outflows': sum(cf.outflow_amount for cf in cash_flow_data),
-            'net_cash_flow': sum(cf.net_flow for cf in cash_flow_data),
-            'by_category': {},
-            'by_type': {},
-            'daily_breakdown': []
+            'total_inflows': actual['inflows'],
+            'total_outflows': actual['outflows'],
+            'net_cash_flow': actual['net'],
+            'by_category': by_category,
+            'by_type': by_type,
+            'daily_breakdown': [
+                {'date': day, **daily.get(day, totals())}
+                for day in (today - timedelta(days=i) for i in range(days))
+            ]
         }
         
-        # By category
-        for category, _ in CashFlowData.FLOW_CATEGORIES:
-            category_data = cash_flow_data.filter(category=category)
-            summary['by_category'][category] = {
-                'inflows': sum(cf.inflow_amount for cf in category_data),
-                'outflows': sum(cf.outflow_amount for cf in category_data),
-                'net': sum(cf.net_flow for cf in category_data)
-            }
-        
-        # By type
-        for flow_type, _ in CashFlowData.CASH_FLOW_TYPES:
-            type_data = cash_flow_data.filter(flow_type=flow_type)
-            summary['by_type'][flow_type] = {
-                'inflows': sum(cf.inflow_amount for cf in type_data),
-                'outflows': sum(cf.outflow_amount for cf in type_data),
-                'net': sum(cf.net_flow for cf in type_data)
-            }
-        
-        # Daily breakdown
-        for i in range(days):
-            date = (timezone.now() - timedelta(days=i)).date()
-            day_data = cash_flow_data.filter(flow_date=date)
-            
-            daily_summary = {
-                'date': date,
-                'inflows': sum(cf.inflow_amount for cf in day_data),
-                'outflows': sum(cf.outflow_amount for cf in day_data),
-                'net': sum(cf.net_flow for cf in day_data)
+        if forecast_days > 0:
+            summary['forecast'] = {
+                'total_inflows': predicted['inflows'],
+                'total_outflows': predicted['outflows'],
+                'net_cash_flow': predicted['net'],
+                'daily_breakdown': [
+                    {'date': day, **forecast_daily[day]}
+                    for day in sorted(forecast_daily)
+                ]
             }
-            summary['daily_breakdown'].append(daily_summary)
         
         return Response(summary)
     
     @action(detail=False, methods=['post'])
     def generate_from_transactions(self, request):
-        """Generate cash flow data from transactions"""
-        start_date = request.data.get('start_date')
-        end_date = request.data.get('end_date')
-        
-        if not start_date or not end_date:
+        """
+        Queue cash flow generation from transactions in a date range.
+        Follow the run at ``cash-flow-generations/<id>/``; rows that
+        already exist are left alone, so a range can be generated again.
+        """
+        try:
+            start_date = date.fromisoformat(request.data.get('start_date', ''))
+            end_date = date.fromisoformat(request.data.get('end_date', ''))
+        except (TypeError, ValueError):
             return Response(
-                {'error': 'Start date and end date are required'}, 
+                {'error': 'Start date and end date are required (YYYY-MM-DD)'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            from apps.transactions.models import Transaction
-            
-            transactions = Transaction.objects.filter(
-                user=request.user,
-                transaction_date__date__gte=start_date,
-                transaction_date__date__lte=end_date,
-                status='completed'
-            )
-            
-            generated_count = 0
-            
-            for transaction in transactions:
-                # Determine flow type and category
-                if transaction.transaction_type == 'sale':
-                    flow_type = 'operating'
-                    category = 'sales_revenue'
-                    inflow_amount = transaction.total_amount
-                    outflow_amount = 0
-                elif transaction.transaction_type == 'purchase':
-                    flow_type = 'operating'
-                    category = 'inventory_purchase'
-                    inflow_amount = 0
-                    outflow_amount = transaction.total_amount
-                else:
-                    continue
-                
-                # Create cash flow data
-                CashFlowData.objects.get_or_create(
-                    user=request.user,
-                    flow_type=flow_type,
-                    category=category,
-                    flow_date=transaction.transaction_date.date(),
-                    reference_id=str(transaction.id),
-                    defaults={
-                        'inflow_amount': inflow_amount,
-                        'outflow_amount': outflow_amount,
-                        'description': f"{transaction.get_transaction_type_display()} - {transaction.transaction_number}"
-                    }
-                )
-                generated_count += 1
-            
-            return Response({
-                'message': f'Generated {generated_count} cash flow records',
-                'generated_count': generated_count
-            })
-            
-        except ImportError:
+        if start_date > end_date:
             return Response(
-                {'error': 'Transaction model not available'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'Start date must not be after end date'}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        generation = CashFlowGeneration.objects.create(
+            user=request.user, start_date=start_date, end_date=end_date
+        )
+        
+        # Generate in the background once the run is committed
+        db_transaction.on_commit(lambda: generate_cash_flow.delay(str(generation.id)))
+        
+        serializer = CashFlowGenerationSerializer(generation)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class BusinessInsightViewSet(viewsets.ModelViewSet):
+class CashFlowGenerationViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for following cash flow generation runs
+    """
+    queryset = CashFlowGeneration.objects.all()
+    serializer_class = CashFlowGenerationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    
+    def get_queryset(self):
+        """Filter runs by user"""
+        return CashFlowGeneration.objects.filter(user=self.request.user).order_by('-created_at')
+
+
+class BusinessInsightViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing AI-generated business insights
     """
@@ -325,15 +333,13 @@ class BusinessInsightViewSet(viewsets.ModelViewSet):
     def unread(self, request):
         """Get unread insights"""
         insights = self.get_queryset().filter(is_viewed=False)
-        serializer = self.get_serializer(insights, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(insights)
     
     @action(detail=False, methods=['get'])
     def high_priority(self, request):
         """Get high priority insights"""
         insights = self.get_queryset().filter(priority__in=['high', 'critical'])
-        serializer = self.get_serializer(insights, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(insights)
     
     @action(detail=True, methods=['post'])
     def mark_viewed(self, request, pk=None):
@@ -376,7 +382,7 @@ class BusinessInsightViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class AlertRuleViewSet(viewsets.ModelViewSet):
+class AlertRuleViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing custom alert rules
     """
@@ -397,8 +403,15 @@ class AlertRuleViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get active alert rules"""
         rules = self.get_queryset().filter(is_active=True)
-        serializer = self.get_serializer(rules, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(rules)
+    
+    @action(detail=False, methods=['get'])
+    def metrics(self, request):
+        """Metrics that alert rules can watch"""
+        return Response([
+            {'metric_field': metric, 'description': description}
+            for metric, description in ALERT_METRICS.items()
+        ])
     
     @action(detail=True, methods=['post'])
     def test(self, request, pk=None):
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["created_at", "id"], name="stock_movem_created_226182_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_summaries(apps, schema_editor):
+    Product = apps.get_model("inventory", "Product")
+    InventorySummary = apps.get_model("inventory", "InventorySummary")
+
+    stock_value = models.ExpressionWrapper(
+        models.F("current_stock") * models.F("cost_price"),
+        output_field=models.DecimalField(max_digits=18, decimal_places=2),
+    )
+    rows = Product.objects.values("user_id").annotate(
+        product_count=models.Count("id"),
+        active_product_count=models.Count("id", filter=models.Q(is_active=True)),
+        low_stock_count=models.Count(
+            "id", filter=models.Q(current_stock__lte=models.F("minimum_stock_level"))
+        ),
+        out_of_stock_count=models.Count("id", filter=models.Q(current_stock__lte=0)),
+        total_inventory_value=models.Sum(stock_value),
+    )
+    InventorySummary.objects.bulk_create(
+        [InventorySummary(**row) for row in rows], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_stockmovement_stock_movem_created_226182_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventorySummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_count", models.IntegerField(default=0)),
+                ("active_product_count", models.IntegerField(default=0)),
+                ("low_stock_count", models.IntegerField(default=0)),
+                ("out_of_stock_count", models.IntegerField(default=0)),
+                (
+                    "total_inventory_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Inventory Summary",
+                "verbose_name_plural": "Inventory Summaries",
+                "db_table": "inventory_summaries",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(
+                    ("current_stock__lte", models.F("minimum_stock_level"))
+                ),
+                fields=["user"],
+                name="products_low_stock_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("current_stock__lte", 0)),
+                fields=["user"],
+                name="products_out_of_stock_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="inventorysummary",
+            name="user",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="inventory_summary",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0004_inventory_summary_and_stock_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DemandForecast",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "method",
+                    models.CharField(
+                        choices=[
+                            ("none", "No sales"),
+                            ("ses", "Exponential smoothing"),
+                            ("croston", "Croston (intermittent demand)"),
+                        ],
+                        default="none",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "daily_demand",
+                    models.DecimalField(decimal_places=3, default=0, max_digits=12),
+                ),
+                (
+                    "demand_std",
+                    models.DecimalField(
+                        decimal_places=3,
+                        default=0,
+                        help_text="Standard deviation of daily unit sales",
+                        max_digits=12,
+                    ),
+                ),
+                (
+                    "sales_days",
+                    models.IntegerField(
+                        default=0, help_text="Days with sales in the history window"
+                    ),
+                ),
+                ("history_days", models.IntegerField(default=0)),
+                (
+                    "safety_stock",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "reorder_point",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "reorder_quantity",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "days_of_cover",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=1,
+                        help_text="Days the stock lasted at forecast demand when computed",
+                        max_digits=10,
+                        null=True,
+                    ),
+                ),
+                ("forecast_date", models.DateField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="forecast",
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Demand Forecast",
+                "verbose_name_plural": "Demand Forecasts",
+                "db_table": "demand_forecasts",
+            },
+        ),
+    ]
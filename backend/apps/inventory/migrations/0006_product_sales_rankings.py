@@ -0,0 +1,146 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0005_demand_forecast"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSalesDay",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "quantity",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                ("sale_count", models.IntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_days",
+                        to="inventory.product",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_sales_days",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Product Sales Day",
+                "verbose_name_plural": "Product Sales Days",
+                "db_table": "product_sales_days",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "date"], name="product_sal_user_id_233940_idx"
+                    ),
+                    models.Index(fields=["date"], name="product_sal_date_30990e_idx"),
+                ],
+                "unique_together": {("product", "date")},
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductSalesRanking",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "units_7d",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "units_30d",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "units_90d",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "revenue_7d",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "revenue_30d",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                (
+                    "revenue_90d",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=15),
+                ),
+                ("sales_7d", models.IntegerField(default=0)),
+                ("sales_30d", models.IntegerField(default=0)),
+                ("sales_90d", models.IntegerField(default=0)),
+                ("rolled_on", models.DateField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_ranking",
+                        to="inventory.product",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_sales_rankings",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Product Sales Ranking",
+                "verbose_name_plural": "Product Sales Rankings",
+                "db_table": "product_sales_rankings",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "units_7d"],
+                        name="product_sal_user_id_af9a33_idx",
+                    ),
+                    models.Index(
+                        fields=["user", "units_30d"],
+                        name="product_sal_user_id_0bde3e_idx",
+                    ),
+                    models.Index(
+                        fields=["user", "units_90d"],
+                        name="product_sal_user_id_8ca630_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
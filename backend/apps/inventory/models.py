@@ -7,6 +7,7 @@ Handles products, categories, and stock management
 import uuid
 from decimal import Decimal
 from django.db import models
+from django.db.models import F, Q
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from apps.users.models import User
@@ -77,6 +78,26 @@ class ProductCategory(models.Model):
         return self.products.filter(is_active=True).count()
 
 
+# Stock status as database expressions, mirroring the Product properties
+LOW_STOCK = Q(current_stock__lte=F('minimum_stock_level'))
+OUT_OF_STOCK = Q(current_stock__lte=0)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Stock status filters that run in the database
+    """
+    
+    def low_stock(self):
+        return self.filter(LOW_STOCK)
+    
+    def out_of_stock(self):
+        return self.filter(OUT_OF_STOCK)
+    
+    def in_stock(self):
+        return self.exclude(LOW_STOCK | OUT_OF_STOCK)
+
+
 class Product(models.Model):
     """
     Product model with Nigerian context
@@ -211,6 +232,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         db_table = 'products'
         verbose_name = _('Product')
@@ -224,6 +247,9 @@ class Product(models.Model):
             models.Index(fields=['is_active']),
             models.Index(fields=['current_stock']),
             models.Index(fields=['minimum_stock_level']),
+            # Partial indexes for the low / out of stock lists
+            models.Index(fields=['user'], condition=LOW_STOCK, name='products_low_stock_idx'),
+            models.Index(fields=['user'], condition=OUT_OF_STOCK, name='products_out_of_stock_idx'),
         ]
     
     def __str__(self):
@@ -237,7 +263,47 @@ class Product(models.Model):
             category_code = self.category.category_type[:3].upper()
             user_code = str(self.user.id)[:8].upper()
             self.sku = f"{category_code}-{user_code}-{user_product_count:03d}"
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        
+        # Keep the owner's inventory summary in step with this row
+        from .services import InventoryValuationService
+        snapshot = self.stock_snapshot()
+        if adding or self._stock_snapshot is not None:
+            InventoryValuationService.apply_change(self.user_id, self._stock_snapshot, snapshot)
+        else:
+            # Loaded with deferred fields: the old values are unknown
+            InventoryValuationService.rebuild(self.user_id)
+        self._stock_snapshot = snapshot
+    
+    def delete(self, *args, **kwargs):
+        from .services import InventoryValuationService
+        user_id, snapshot = self.user_id, self._stock_snapshot
+        result = super().delete(*args, **kwargs)
+        if snapshot is not None:
+            InventoryValuationService.apply_change(user_id, snapshot, None)
+        else:
+            InventoryValuationService.rebuild(user_id)
+        return result
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            instance._stock_snapshot = instance.stock_snapshot()
+        return instance
+    
+    _stock_snapshot = None
+    
+    def stock_snapshot(self):
+        """This product's contribution to the inventory summary"""
+        return {
+            'product_count': 1,
+            'active_product_count': int(self.is_active),
+            'low_stock_count': int(self.is_low_stock),
+            'out_of_stock_count': int(self.is_out_of_stock),
+            'total_inventory_value': self.current_stock * self.cost_price,
+        }
     
     @property
     def profit_margin(self):
@@ -353,6 +419,7 @@ class StockMovement(models.Model):
         indexes = [
             models.Index(fields=['product', 'movement_type']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['created_at', 'id']),
             models.Index(fields=['reference_number']),
         ]
     
@@ -360,3 +427,169 @@ class StockMovement(models.Model):
         return f"{self.movement_type.title()} - {self.product.name} - {self.quantity}"
 
 
+class InventorySummary(models.Model):
+    """
+    Running inventory totals per user, updated with F() deltas whenever a
+    product is saved or deleted so dashboards never scan the product table.
+    Bulk ``QuerySet.update()`` calls bypass this; use
+    ``InventoryValuationService.rebuild`` after them. Every summary is also
+    rebuilt nightly to correct any drift.
+    """
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='inventory_summary'
+    )
+    product_count = models.IntegerField(default=0)
+    active_product_count = models.IntegerField(default=0)
+    low_stock_count = models.IntegerField(default=0)
+    out_of_stock_count = models.IntegerField(default=0)
+    total_inventory_value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'inventory_summaries'
+        verbose_name = _('Inventory Summary')
+        verbose_name_plural = _('Inventory Summaries')
+    
+    def __str__(self):
+        return f"Inventory summary - {self.user.username}"
+
+
+class DemandForecast(models.Model):
+    """
+    Forecast daily demand and suggested reorder levels for a product,
+    recomputed nightly by ``DemandForecastService`` from its sales history
+    """
+    
+    METHODS = [
+        ('none', 'No sales'),
+        ('ses', 'Exponential smoothing'),
+        ('croston', 'Croston (intermittent demand)'),
+    ]
+    
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='forecast'
+    )
+    method = models.CharField(max_length=10, choices=METHODS, default='none')
+    daily_demand = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    demand_std = models.DecimalField(
+        max_digits=12,
+        decimal_places=3,
+        default=0,
+        help_text='Standard deviation of daily unit sales'
+    )
+    sales_days = models.IntegerField(default=0, help_text='Days with sales in the history window')
+    history_days = models.IntegerField(default=0)
+    
+    # Suggestions
+    safety_stock = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    reorder_point = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    reorder_quantity = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    days_of_cover = models.DecimalField(
+        max_digits=10,
+        decimal_places=1,
+        null=True,
+        blank=True,
+        help_text='Days the stock lasted at forecast demand when computed'
+    )
+    
+    forecast_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'demand_forecasts'
+        verbose_name = _('Demand Forecast')
+        verbose_name_plural = _('Demand Forecasts')
+    
+    def __str__(self):
+        return f"Forecast - {self.product.name} - {self.daily_demand}/day"
+
+
+# Rolling windows (in days) kept on ProductSalesRanking
+RANKING_WINDOWS = (7, 30, 90)
+
+
+class ProductSalesDay(models.Model):
+    """
+    Units and revenue sold per product per day: the buckets the rolling
+    sales rankings and period product rankings are built from
+    """
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='sales_days'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='product_sales_days'
+    )
+    date = models.DateField()
+    quantity = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    sale_count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'product_sales_days'
+        verbose_name = _('Product Sales Day')
+        verbose_name_plural = _('Product Sales Days')
+        unique_together = ['product', 'date']
+        indexes = [
+            models.Index(fields=['user', 'date']),
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.date} - {self.quantity}"
+
+
+class ProductSalesRanking(models.Model):
+    """
+    Rolling 7, 30 and 90 day sales per product. Sales are added to every
+    window they fall in as they happen and the nightly roll recomputes the
+    windows from the ``ProductSalesDay`` buckets, so days that left a
+    window drop out. Top and bottom lists are read from the indexed window
+    columns (see ``SalesRankingService``).
+    """
+    
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='sales_ranking'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='product_sales_rankings'
+    )
+    units_7d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units_30d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units_90d = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_7d = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    revenue_30d = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    revenue_90d = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    sales_7d = models.IntegerField(default=0)
+    sales_30d = models.IntegerField(default=0)
+    sales_90d = models.IntegerField(default=0)
+    
+    rolled_on = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'product_sales_rankings'
+        verbose_name = _('Product Sales Ranking')
+        verbose_name_plural = _('Product Sales Rankings')
+        indexes = [
+            models.Index(fields=['user', 'units_7d']),
+            models.Index(fields=['user', 'units_30d']),
+            models.Index(fields=['user', 'units_90d']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.units_30d} in 30 days"
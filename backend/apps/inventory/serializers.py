@@ -4,14 +4,15 @@ Inventory serializers for products and categories
 """
 
 from rest_framework import serializers
-from .models import ProductCategory, Product, StockMovement
+from .models import DemandForecast, ProductCategory, Product, StockMovement
+from utils.serializers import SparseFieldsetMixin
 
 
 class ProductCategorySerializer(serializers.ModelSerializer):
     """
     Serializer for product categories
     """
-    product_count = serializers.ReadOnlyField(source='get_product_count')
+    product_count = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductCategory
@@ -20,9 +21,30 @@ class ProductCategorySerializer(serializers.ModelSerializer):
             'local_names', 'is_active', 'product_count', 'created_at'
         ]
         read_only_fields = ['id', 'product_count', 'created_at']
+    
+    def get_product_count(self, obj):
+        # Annotated by the viewset queryset; fall back to a count query
+        if hasattr(obj, 'product_count'):
+            return obj.product_count
+        return obj.get_product_count()
+
+
+class DemandForecastSerializer(serializers.ModelSerializer):
+    """
+    Nightly demand forecast and reorder suggestions (read only)
+    """
+    
+    class Meta:
+        model = DemandForecast
+        fields = [
+            'method', 'daily_demand', 'demand_std', 'sales_days', 'history_days',
+            'safety_stock', 'reorder_point', 'reorder_quantity', 'days_of_cover',
+            'forecast_date'
+        ]
+        read_only_fields = fields
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for products with inventory tracking
     """
@@ -32,6 +54,7 @@ class ProductSerializer(serializers.ModelSerializer):
     is_out_of_stock = serializers.ReadOnlyField()
     stock_status = serializers.ReadOnlyField()
     category_name = serializers.ReadOnlyField(source='category.name')
+    forecast = DemandForecastSerializer(read_only=True, allow_null=True)
     
     class Meta:
         model = Product
@@ -44,7 +67,7 @@ class ProductSerializer(serializers.ModelSerializer):
             'total_sold', 'total_revenue', 'last_sold_date', 'last_restocked_date',
             'is_active', 'track_inventory', 'allow_negative_stock',
             'profit_margin', 'profit_per_unit', 'is_low_stock', 
-            'is_out_of_stock', 'stock_status', 'created_at'
+            'is_out_of_stock', 'stock_status', 'forecast', 'created_at'
         ]
         read_only_fields = [
             'id', 'sku', 'total_sold', 'total_revenue', 'last_sold_date',
@@ -57,7 +80,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class StockMovementSerializer(serializers.ModelSerializer):
+class StockMovementSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for stock movements
     """
@@ -0,0 +1,497 @@
+# backend/apps/inventory/services.py
+"""
+Inventory services
+Maintains the per-user inventory summary used by the dashboards and
+computes stock movement summaries and analytics in the database, and
+fits nightly demand forecasts with reorder suggestions and keeps the
+rolling product sales rankings
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from utils.retention import keyset_batches, purge_in_batches
+
+from .models import (
+    DemandForecast, Product, InventorySummary, ProductSalesDay, ProductSalesRanking, StockMovement,
+    LOW_STOCK, OUT_OF_STOCK, RANKING_WINDOWS,
+)
+
+
+SUMMARY_FIELDS = [
+    'product_count', 'active_product_count', 'low_stock_count',
+    'out_of_stock_count', 'total_inventory_value',
+]
+
+STOCK_VALUE = ExpressionWrapper(
+    F('current_stock') * F('cost_price'),
+    output_field=DecimalField(max_digits=18, decimal_places=2)
+)
+
+
+def summary_expressions():
+    """Aggregate expressions for each of ``SUMMARY_FIELDS``"""
+    return {
+        'product_count': Count('id'),
+        'active_product_count': Count('id', filter=Q(is_active=True)),
+        'low_stock_count': Count('id', filter=LOW_STOCK),
+        'out_of_stock_count': Count('id', filter=OUT_OF_STOCK),
+        'total_inventory_value': Coalesce(
+            Sum(STOCK_VALUE), Decimal('0.00'), output_field=STOCK_VALUE.output_field
+        ),
+    }
+
+
+def inventory_aggregates(queryset):
+    """Summary totals for a product queryset, computed in one query"""
+    return queryset.aggregate(**summary_expressions())
+
+
+def sales_today(queryset):
+    """Units sold (``total_sold``) of the products last sold today"""
+    return queryset.filter(
+        last_sold_date__date=timezone.now().date()
+    ).aggregate(total=Coalesce(Sum('total_sold'), Decimal('0.00')))['total']
+
+
+class InventoryValuationService:
+    """
+    Incrementally maintained inventory valuation
+    """
+    
+    @classmethod
+    def apply_change(cls, user_id, before, after):
+        """
+        Apply the difference between two product snapshots (None for a
+        product that did not / no longer exists) to the user's summary
+        """
+        before = before or {}
+        after = after or {}
+        delta = {
+            field: after.get(field, 0) - before.get(field, 0)
+            for field in SUMMARY_FIELDS
+        }
+        delta = {field: value for field, value in delta.items() if value}
+        if not delta:
+            return
+        
+        updated = InventorySummary.objects.filter(user_id=user_id).update(
+            **{field: F(field) + value for field, value in delta.items()}
+        )
+        if not updated:
+            # First product for this user (or summary missing): build it
+            cls.rebuild(user_id)
+    
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recompute a user's summary from the product table"""
+        totals = inventory_aggregates(Product.objects.filter(user_id=user_id))
+        summary, _ = InventorySummary.objects.update_or_create(user_id=user_id, defaults=totals)
+        return summary
+    
+    @classmethod
+    def rebuild_all(cls):
+        """
+        Recompute every user's summary in one grouped query, correcting
+        drift from bulk updates that bypassed the product signals
+        """
+        rows = Product.objects.order_by().values('user_id').annotate(**summary_expressions())
+        with transaction.atomic():
+            InventorySummary.objects.exclude(
+                user_id__in=Product.objects.values('user_id')
+            ).update(**{field: 0 for field in SUMMARY_FIELDS}, updated_at=timezone.now())
+            InventorySummary.objects.bulk_create(
+                [InventorySummary(**row) for row in rows],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=SUMMARY_FIELDS + ['updated_at'],
+            )
+    
+    @classmethod
+    def get_summary(cls, user_id):
+        """The user's summary, building it on first access"""
+        try:
+            return InventorySummary.objects.get(user_id=user_id)
+        except InventorySummary.DoesNotExist:
+            return cls.rebuild(user_id)
+
+
+# Movement types counted as stock in / out in movement summaries
+MOVEMENT_IN = ['purchase', 'return']
+MOVEMENT_OUT = ['sale', 'damage']
+
+QUANTITY = DecimalField(max_digits=12, decimal_places=2)
+AMOUNT = DecimalField(max_digits=15, decimal_places=2)
+# Signed change in stock, which also covers adjustments and transfers
+STOCK_CHANGE = ExpressionWrapper(F('stock_after') - F('stock_before'), output_field=QUANTITY)
+
+
+def movement_totals(queryset):
+    """Count and quantity per movement type, in one grouped query"""
+    rows = queryset.order_by().values('movement_type').annotate(
+        count=Count('id'), quantity=Sum('quantity')
+    )
+    return {row['movement_type']: row for row in rows}
+
+
+def _quantity(movement_type):
+    return Coalesce(Sum('quantity', filter=Q(movement_type=movement_type)), Decimal('0.00'), output_field=QUANTITY)
+
+
+def movement_analytics(queryset, days):
+    """
+    Per-product movement analytics over a ``days`` window of ``queryset``:
+    quantities by type, net movement, shrinkage rate (damage and downward
+    adjustments as a share of everything that left the shelf) and days of
+    cover at the window's average daily sales, plus the daily net movement
+    per product. Two grouped queries.
+    """
+    zero = Decimal('0.00')
+    queryset = queryset.order_by()
+    rows = queryset.values('product_id', 'product__name', 'product__current_stock').annotate(
+        purchased=_quantity('purchase'),
+        sold=_quantity('sale'),
+        returned=_quantity('return'),
+        damaged=_quantity('damage'),
+        adjusted_out=Coalesce(Sum(
+            -STOCK_CHANGE, filter=Q(movement_type='adjustment', stock_after__lt=F('stock_before'))
+        ), zero, output_field=QUANTITY),
+        net_movement=Coalesce(Sum(STOCK_CHANGE), zero, output_field=QUANTITY),
+    ).order_by('product__name')
+    
+    products = []
+    for row in rows:
+        lost = row['damaged'] + row['adjusted_out']
+        outflow = row['sold'] + lost
+        daily_sales = row['sold'] / days if days else zero
+        stock = row['product__current_stock']
+        products.append({
+            'product': row['product_id'],
+            'name': row['product__name'],
+            'current_stock': stock,
+            'purchased': row['purchased'],
+            'sold': row['sold'],
+            'returned': row['returned'],
+            'damaged': row['damaged'],
+            'adjusted_out': row['adjusted_out'],
+            'net_movement': row['net_movement'],
+            'shrinkage_rate': round(lost / outflow * 100, 2) if outflow else zero,
+            'average_daily_sales': round(daily_sales, 2),
+            'days_of_cover': round(max(stock, 0) / daily_sales, 1) if daily_sales else None,
+        })
+    
+    daily = queryset.annotate(date=TruncDate('created_at')).values('date', 'product_id').annotate(
+        net_movement=Sum(STOCK_CHANGE)
+    ).order_by('date', 'product_id')
+    return {'products': products, 'daily_net_movement': list(daily)}
+
+
+def _decimal(value, places=2):
+    return Decimal(str(round(float(value), places)))
+
+
+def _round_up(values):
+    return np.ceil(np.round(values * 100, 6)) / 100
+
+
+class DemandForecastService:
+    """
+    Nightly demand forecasts and reorder suggestions for every active product.
+    
+    Daily unit sales come from ``sale`` stock movements (one per POS line
+    item) over the ``history_days`` before ``today``, read with one grouped
+    query per batch of products and laid out as a products x days numpy
+    matrix. Days before a product was created are left out of its history.
+    Every row of the batch is fitted at once: simple exponential smoothing,
+    or Croston's method (sale sizes and the gaps between sales smoothed
+    separately, with the SBA bias correction) when most days have no sales.
+    
+    The reorder point is forecast demand over ``lead_time_days`` plus
+    ``service_z`` standard deviations of demand over the lead time. The
+    suggested quantity tops stock up to the demand over lead time plus
+    ``review_days``, capped at ``maximum_stock_level`` when one is set.
+    Results are upserted into ``DemandForecast`` (``product.forecast``).
+    """
+    
+    INTERMITTENT_SHARE = 0.5
+    UPDATE_FIELDS = [
+        'method', 'daily_demand', 'demand_std', 'sales_days', 'history_days', 'safety_stock',
+        'reorder_point', 'reorder_quantity', 'days_of_cover', 'forecast_date', 'updated_at',
+    ]
+    
+    def __init__(self, history_days=90, lead_time_days=7, review_days=14, service_z=1.65,
+                 alpha=0.2, batch_size=1000, today=None):
+        self.history_days = history_days
+        self.lead_time_days = lead_time_days
+        self.review_days = review_days
+        self.service_z = service_z
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.today = today or timezone.localdate()
+        self.start = self.today - timedelta(days=history_days)
+    
+    def products(self):
+        return Product.objects.filter(is_active=True)
+    
+    def sales_matrix(self, product_ids):
+        """Units sold per product (rows) and day (columns) in the history window"""
+        start_at = timezone.make_aware(datetime.combine(self.start, time.min))
+        end_at = timezone.make_aware(datetime.combine(self.today, time.min))
+        rows = StockMovement.objects.filter(
+            product_id__in=product_ids, movement_type='sale',
+            created_at__gte=start_at, created_at__lt=end_at,
+        ).order_by().annotate(date=TruncDate('created_at')).values('product_id', 'date').annotate(
+            quantity=Sum('quantity')
+        ).values_list('product_id', 'date', 'quantity')
+        
+        matrix = np.zeros((len(product_ids), self.history_days))
+        index = {pk: i for i, pk in enumerate(product_ids)}
+        cells = [(index[pk], (date - self.start).days, float(quantity)) for pk, date, quantity in rows]
+        if cells:
+            products, days, quantities = zip(*cells)
+            np.add.at(matrix, (np.array(products), np.array(days)), quantities)
+        return matrix
+    
+    def fit(self, sales, first_day):
+        """
+        Forecast daily demand, its standard deviation, the number of sale
+        days and whether Croston's method was used, for each row of
+        ``sales`` (history starting at column ``first_day``)
+        """
+        alpha = self.alpha
+        active = np.arange(sales.shape[1]) >= first_day[:, None]
+        history = np.where(active, sales, np.nan)
+        observed = active.sum(axis=1)
+        sale_days = (sales > 0).sum(axis=1)
+        mean = np.nansum(history, axis=1) / observed
+        std = np.sqrt(np.nansum((history - mean[:, None]) ** 2, axis=1) / observed)
+        
+        level = mean.copy()
+        size = np.where(sale_days > 0, sales.sum(axis=1) / np.maximum(sale_days, 1), 0)
+        interval = observed / np.maximum(sale_days, 1)
+        since = np.zeros(len(sales))
+        for day in range(sales.shape[1]):
+            demand, on = sales[:, day], active[:, day]
+            level = np.where(on, alpha * demand + (1 - alpha) * level, level)
+            since += on
+            hit = demand > 0
+            size = np.where(hit, alpha * demand + (1 - alpha) * size, size)
+            interval = np.where(hit, alpha * since + (1 - alpha) * interval, interval)
+            since = np.where(hit, 0, since)
+        croston = (1 - alpha / 2) * size / interval
+        
+        intermittent = (observed - sale_days) / observed > self.INTERMITTENT_SHARE
+        demand = np.where(sale_days == 0, 0, np.where(intermittent, croston, level))
+        return demand, std, sale_days, intermittent
+    
+    def suggest(self, demand, std, stock, maximum):
+        """Safety stock, reorder point and order quantity, rounded up to 0.01 unit"""
+        safety = self.service_z * std * np.sqrt(self.lead_time_days)
+        reorder_point = demand * self.lead_time_days + safety
+        target = demand * (self.lead_time_days + self.review_days) + safety
+        target = np.where(np.isnan(maximum), target, np.minimum(target, maximum))
+        quantity = np.maximum(target - stock, 0)
+        return _round_up(safety), _round_up(reorder_point), _round_up(quantity)
+    
+    def run_batch(self, pks):
+        rows = list(Product.objects.filter(pk__in=pks).values_list(
+            'id', 'current_stock', 'maximum_stock_level', 'created_at'
+        ))
+        if not rows:
+            return 0
+        ids, stock, maximum, created = zip(*rows)
+        stock = np.maximum(np.array(stock, dtype=float), 0)
+        maximum = np.array([np.nan if value is None else float(value) for value in maximum])
+        first_day = np.clip(
+            [(timezone.localdate(moment) - self.start).days for moment in created],
+            0, self.history_days - 1
+        )
+        
+        demand, std, sale_days, intermittent = self.fit(self.sales_matrix(ids), first_day)
+        safety, reorder_point, quantity = self.suggest(demand, std, stock, maximum)
+        
+        forecasts = []
+        for i, product_id in enumerate(ids):
+            sold = sale_days[i] > 0
+            forecasts.append(DemandForecast(
+                product_id=product_id,
+                method=('croston' if intermittent[i] else 'ses') if sold else 'none',
+                daily_demand=_decimal(demand[i], 3),
+                demand_std=_decimal(std[i], 3),
+                sales_days=int(sale_days[i]),
+                history_days=int(self.history_days - first_day[i]),
+                safety_stock=_decimal(safety[i]) if sold else Decimal('0.00'),
+                reorder_point=_decimal(reorder_point[i]) if sold else Decimal('0.00'),
+                reorder_quantity=_decimal(quantity[i]) if sold else Decimal('0.00'),
+                days_of_cover=_decimal(stock[i] / demand[i], 1) if demand[i] > 0 else None,
+                forecast_date=self.today,
+            ))
+        DemandForecast.objects.bulk_create(
+            forecasts,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=self.UPDATE_FIELDS,
+        )
+        return len(forecasts)
+    
+    def run(self):
+        forecast = 0
+        for pks in keyset_batches(self.products(), ('id',), self.batch_size):
+            forecast += self.run_batch(pks)
+        return forecast
+
+
+class SalesRankingService:
+    """
+    Incrementally maintained product sales rankings per merchant.
+    
+    Every sale adds its lines to the product's ``ProductSalesDay`` bucket
+    for the day and to each ``ProductSalesRanking`` window the day falls in,
+    with F() increments. The nightly ``roll`` recomputes the windows from
+    the buckets so expired days drop out, gives every active product a
+    ranking row (so bottom lists include products that never sold) and
+    purges buckets older than ``PRODUCT_SALES_RETENTION_DAYS``. Top and
+    bottom lists are an ordered read of an indexed window column.
+    """
+    
+    @staticmethod
+    def window_field(days, measure='units'):
+        """Ranking column for a window, e.g. ``units_30d``; ValueError for other windows"""
+        if int(days) not in RANKING_WINDOWS:
+            raise ValueError(f'Ranking window must be one of {", ".join(map(str, RANKING_WINDOWS))} days')
+        return f'{measure}_{int(days)}d'
+    
+    @classmethod
+    def record(cls, user_id, lines, sold_at=None, sales=1):
+        """
+        Add ``lines`` of ``(product_id, quantity, revenue)`` sold at
+        ``sold_at``; refunds pass negative amounts and ``sales=0``
+        """
+        totals = {}
+        for product_id, quantity, revenue in lines:
+            if product_id is not None:
+                units, amount = totals.get(product_id, (0, 0))
+                totals[product_id] = (units + quantity, amount + revenue)
+        if not totals:
+            return
+        date = timezone.localdate(sold_at) if sold_at else timezone.localdate()
+        windows = [days for days in RANKING_WINDOWS if (timezone.localdate() - date).days < days]
+        
+        with transaction.atomic():
+            ProductSalesDay.objects.bulk_create([
+                ProductSalesDay(product_id=product_id, user_id=user_id, date=date) for product_id in totals
+            ], ignore_conflicts=True)
+            ProductSalesRanking.objects.bulk_create([
+                ProductSalesRanking(product_id=product_id, user_id=user_id) for product_id in totals
+            ], ignore_conflicts=True)
+            for product_id, (quantity, revenue) in totals.items():
+                ProductSalesDay.objects.filter(product_id=product_id, date=date).update(
+                    quantity=F('quantity') + quantity,
+                    revenue=F('revenue') + revenue,
+                    sale_count=F('sale_count') + sales,
+                )
+                if windows:
+                    increments = {}
+                    for days in windows:
+                        increments[f'units_{days}d'] = F(f'units_{days}d') + quantity
+                        increments[f'revenue_{days}d'] = F(f'revenue_{days}d') + revenue
+                        increments[f'sales_{days}d'] = F(f'sales_{days}d') + sales
+                    ProductSalesRanking.objects.filter(product_id=product_id).update(**increments)
+    
+    @classmethod
+    def roll(cls, today=None, batch_size=1000):
+        """Nightly maintenance: recompute the windows as of ``today``"""
+        today = today or timezone.localdate()
+        
+        missing = Product.objects.filter(is_active=True, sales_ranking__isnull=True)
+        for pks in keyset_batches(missing, ('id',), batch_size):
+            ProductSalesRanking.objects.bulk_create([
+                ProductSalesRanking(product_id=product_id, user_id=user_id)
+                for product_id, user_id in Product.objects.filter(pk__in=pks).values_list('id', 'user_id')
+            ], ignore_conflicts=True)
+        
+        fields = [f'{measure}_{days}d' for days in RANKING_WINDOWS for measure in ('units', 'revenue', 'sales')]
+        nonzero = Q()
+        for field in fields:
+            nonzero |= ~Q(**{field: 0})
+        changed = ProductSalesRanking.objects.filter(nonzero)
+        rolled = 0
+        for pks in keyset_batches(changed, ('id',), batch_size):
+            rolled += cls.roll_batch(pks, today, fields)
+        
+        retention = getattr(settings, 'PRODUCT_SALES_RETENTION_DAYS', 400)
+        purge_in_batches(ProductSalesDay.objects.filter(date__lt=today - timedelta(days=retention)))
+        return rolled
+    
+    @classmethod
+    def roll_batch(cls, pks, today, fields):
+        rankings = list(ProductSalesRanking.objects.filter(pk__in=pks).only('id', 'product_id'))
+        windows = {}
+        for days in RANKING_WINDOWS:
+            recent = Q(date__gt=today - timedelta(days=days))
+            windows[f'units_{days}d'] = Coalesce(Sum('quantity', filter=recent), Decimal('0.00'), output_field=QUANTITY)
+            windows[f'revenue_{days}d'] = Coalesce(Sum('revenue', filter=recent), Decimal('0.00'), output_field=AMOUNT)
+            windows[f'sales_{days}d'] = Coalesce(Sum('sale_count', filter=recent), 0)
+        rows = ProductSalesDay.objects.filter(
+            product_id__in=[ranking.product_id for ranking in rankings],
+            date__gt=today - timedelta(days=max(RANKING_WINDOWS)),
+            date__lte=today,
+        ).order_by().values('product_id').annotate(**windows)
+        totals = {row.pop('product_id'): row for row in rows}
+        
+        for ranking in rankings:
+            values = totals.get(ranking.product_id, {})
+            for field in fields:
+                setattr(ranking, field, values.get(field, 0))
+            ranking.rolled_on = today
+        ProductSalesRanking.objects.bulk_update(rankings, [*fields, 'rolled_on'], batch_size=len(rankings))
+        return len(rankings)
+    
+    @classmethod
+    def top(cls, user_id, days=30, limit=10):
+        field = cls.window_field(days)
+        return ProductSalesRanking.objects.filter(
+            user_id=user_id, **{f'{field}__gt': 0}
+        ).select_related('product').order_by(f'-{field}', 'product__name')[:limit]
+    
+    @classmethod
+    def bottom(cls, user_id, days=30, limit=10):
+        field = cls.window_field(days)
+        return ProductSalesRanking.objects.filter(
+            user_id=user_id, product__is_active=True
+        ).select_related('product').order_by(field, 'product__name')[:limit]
+    
+    @staticmethod
+    def period_rankings(user_id, start, end, limit=10):
+        """
+        ``(top_selling, slow_moving)`` product lists for a date range from the
+        day buckets, for ``BusinessMetrics``. Slow movers include active
+        products that did not sell at all.
+        """
+        def entry(product_id, name, quantity, revenue):
+            return {'product_id': str(product_id), 'name': name, 'quantity': float(quantity), 'revenue': float(revenue)}
+        
+        top = ProductSalesDay.objects.filter(
+            user_id=user_id, date__range=(start, end)
+        ).order_by().values('product_id', 'product__name').annotate(
+            units=Sum('quantity'), amount=Sum('revenue')
+        ).filter(units__gt=0).order_by('-units', 'product__name')[:limit]
+        
+        in_period = Q(sales_days__date__range=(start, end))
+        slow = Product.objects.filter(user_id=user_id, is_active=True).annotate(
+            units=Coalesce(Sum('sales_days__quantity', filter=in_period), Decimal('0.00'), output_field=QUANTITY),
+            amount=Coalesce(Sum('sales_days__revenue', filter=in_period), Decimal('0.00'), output_field=AMOUNT),
+        ).order_by('units', 'name').values_list('id', 'name', 'units', 'amount')[:limit]
+        
+        return (
+            [entry(row['product_id'], row['product__name'], row['units'], row['amount']) for row in top],
+            [entry(*row) for row in slow],
+        )
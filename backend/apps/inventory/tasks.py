@@ -0,0 +1,26 @@
+# backend/apps/inventory/tasks.py
+"""
+Background tasks for inventory
+"""
+
+from celery import shared_task
+
+from .services import DemandForecastService, InventoryValuationService, SalesRankingService
+
+
+@shared_task
+def forecast_demand():
+    """Refit every active product's demand forecast and reorder levels (run nightly by beat)"""
+    return DemandForecastService().run()
+
+
+@shared_task
+def roll_sales_rankings():
+    """Drop expired days from the product sales rankings (run nightly by beat)"""
+    return SalesRankingService.roll()
+
+
+@shared_task
+def rebuild_inventory_summaries():
+    """Recompute every user's inventory summary from the product table (run nightly by beat)"""
+    InventoryValuationService.rebuild_all()
@@ -1,3 +1,461 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.transactions.models import Transaction, TransactionCategory
+from apps.users.models import User
+from .models import (
+    DemandForecast, InventorySummary, Product, ProductCategory, ProductSalesDay, ProductSalesRanking,
+    StockMovement,
+)
+from .services import DemandForecastService, SalesRankingService, inventory_aggregates
+from .tasks import rebuild_inventory_summaries
+
+
+class InventoryQueryCountTests(TestCase):
+    """List endpoints must not issue a query per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='shop@example.com', username='shop', password='pass',
+            phone_number='08030000002', first_name='Bola', last_name='Ade'
+        )
+        cls.category = ProductCategory.objects.create(name='Provisions', category_type='food_beverages')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.created = 0
+
+    def create_products(self, count):
+        for _ in range(count):
+            self.created += 1
+            product = Product.objects.create(
+                user=self.user, category=self.category, name=f'Product {self.created}',
+                cost_price=Decimal('100.00'), selling_price=Decimal('150.00'),
+                current_stock=Decimal('10')
+            )
+            StockMovement.objects.create(
+                product=product, movement_type='purchase', quantity=Decimal('10'),
+                unit_cost=Decimal('100.00'), stock_before=Decimal('0'),
+                stock_after=Decimal('10'), created_by=self.user
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.create_products(2)
+        small = self.count_queries(url)
+        self.create_products(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_product_list(self):
+        self.assertConstantQueries('/api/inventory/products/')
+
+    def test_slow_moving_action(self):
+        self.assertConstantQueries('/api/inventory/products/slow_moving/')
+
+    def test_category_list(self):
+        self.assertConstantQueries('/api/inventory/categories/')
+
+    def test_category_products_action(self):
+        self.assertConstantQueries(f'/api/inventory/categories/{self.category.id}/products/')
+
+    def test_stock_movement_list(self):
+        self.assertConstantQueries('/api/inventory/stock-movements/')
+
+    def test_category_product_count(self):
+        self.create_products(3)
+        response = self.client.get('/api/inventory/categories/')
+        self.assertEqual(response.data['results'][0]['product_count'], 3)
+
+    def test_sparse_fieldset(self):
+        self.create_products(1)
+        response = self.client.get('/api/inventory/products/?fields=id,name,stock_status')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'stock_status'})
+
+
+class InventorySummaryTests(TestCase):
+    """The maintained summary must match a full recount"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='summary@example.com', username='summary', password='pass',
+            phone_number='08030000006', first_name='Funmi', last_name='Bello'
+        )
+        cls.category = ProductCategory.objects.create(name='Drinks', category_type='food_beverages')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_product(self, name, stock, minimum=Decimal('5')):
+        return Product.objects.create(
+            user=self.user, category=self.category, name=name,
+            cost_price=Decimal('200.00'), selling_price=Decimal('250.00'),
+            current_stock=stock, minimum_stock_level=minimum
+        )
+
+    def assertSummaryMatchesRecount(self):
+        summary = InventorySummary.objects.get(user=self.user)
+        totals = inventory_aggregates(Product.objects.filter(user=self.user))
+        for field, value in totals.items():
+            self.assertEqual(getattr(summary, field), value, field)
+
+    def test_summary_follows_product_changes(self):
+        coke = self.create_product('Coke', Decimal('20'))
+        malt = self.create_product('Malt', Decimal('3'))
+        self.create_product('Fanta', Decimal('0'))
+        self.assertSummaryMatchesRecount()
+
+        coke = Product.objects.get(pk=coke.pk)
+        coke.current_stock = Decimal('2')
+        coke.save()
+        self.assertSummaryMatchesRecount()
+
+        malt.delete()
+        self.assertSummaryMatchesRecount()
+
+        summary = InventorySummary.objects.get(user=self.user)
+        self.assertEqual(summary.product_count, 2)
+        self.assertEqual(summary.low_stock_count, 2)
+        self.assertEqual(summary.out_of_stock_count, 1)
+        self.assertEqual(summary.total_inventory_value, Decimal('400.00'))
+
+    def test_deferred_loads_skip_the_snapshot(self):
+        for name in ('Coke', 'Malt', 'Fanta'):
+            self.create_product(name, Decimal('20'))
+        with self.assertNumQueries(1):
+            names = [product.name for product in Product.objects.only('id', 'name')]
+        self.assertEqual(sorted(names), ['Coke', 'Fanta', 'Malt'])
+
+        product = Product.objects.only('id', 'name', 'user_id').get(name='Coke')
+        product.current_stock = Decimal('2')
+        product.save()
+        self.assertSummaryMatchesRecount()
+        Product.objects.only('id', 'user_id').get(name='Malt').delete()
+        self.assertSummaryMatchesRecount()
+
+    def test_nightly_rebuild_corrects_bulk_updates(self):
+        self.create_product('Coke', Decimal('20'))
+        self.create_product('Malt', Decimal('3'))
+        other = User.objects.create_user(
+            email='gone@example.com', username='gone', password='pass',
+            phone_number='08030000007', first_name='Kemi', last_name='Ade'
+        )
+        Product.objects.create(
+            user=other, category=self.category, name='Zobo', cost_price=Decimal('100.00'),
+            selling_price=Decimal('150.00'), current_stock=Decimal('10')
+        )
+        # Bulk updates and deletes bypass the product signals
+        Product.objects.filter(user=self.user).update(current_stock=Decimal('1'))
+        Product.objects.filter(user=other).delete()
+        self.assertEqual(InventorySummary.objects.get(user=self.user).low_stock_count, 1)
+
+        rebuild_inventory_summaries()
+        self.assertSummaryMatchesRecount()
+        self.assertEqual(InventorySummary.objects.get(user=self.user).low_stock_count, 2)
+        summary = InventorySummary.objects.get(user=other)
+        self.assertEqual((summary.product_count, summary.total_inventory_value), (0, Decimal('0.00')))
+
+    def test_adjust_stock_updates_dashboard(self):
+        product = self.create_product('Milo', Decimal('10'))
+        self.client.post(
+            f'/api/inventory/products/{product.id}/adjust_stock/', {'quantity_change': '-8'}
+        )
+        with self.assertNumQueries(3):
+            # Summary row, sales today and category count
+            response = self.client.get('/api/inventory/products/dashboard_stats/')
+        self.assertEqual(response.data['low_stock_products'], 1)
+        self.assertEqual(response.data['total_inventory_value'], Decimal('400.00'))
+
+    def test_stock_status_filters_run_in_database(self):
+        self.create_product('Coke', Decimal('20'))
+        self.create_product('Malt', Decimal('3'))
+        self.create_product('Fanta', Decimal('0'))
+        response = self.client.get('/api/inventory/products/low_stock/')
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get('/api/inventory/products/?stock_status=in_stock')
+        self.assertEqual([row['name'] for row in response.data['results']], ['Coke'])
+
+
+class StockMovementAnalyticsTests(TestCase):
+    """Movement summary and analytics are grouped aggregates"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='movements@example.com', username='movements', password='pass',
+            phone_number='08030000007', first_name='Tunde', last_name='Ade'
+        )
+        category = ProductCategory.objects.create(name='Drinks', category_type='food_beverages')
+        cls.milo = Product.objects.create(
+            user=cls.user, category=category, name='Milo',
+            cost_price=Decimal('200.00'), selling_price=Decimal('250.00'), current_stock=Decimal('60')
+        )
+        cls.peak = Product.objects.create(
+            user=cls.user, category=category, name='Peak',
+            cost_price=Decimal('100.00'), selling_price=Decimal('150.00'), current_stock=Decimal('10')
+        )
+        stock = {cls.milo: Decimal('0'), cls.peak: Decimal('10')}
+        for product, movement_type, quantity, sign in [
+            (cls.milo, 'purchase', '100', 1),
+            (cls.milo, 'sale', '30', -1),
+            (cls.milo, 'damage', '6', -1),
+            (cls.milo, 'adjustment', '4', -1),
+            (cls.milo, 'return', '0.5', 1),
+            (cls.peak, 'adjustment', '2', 1),
+        ]:
+            before = stock[product]
+            stock[product] += sign * Decimal(quantity)
+            StockMovement.objects.create(
+                product=product, movement_type=movement_type, quantity=Decimal(quantity),
+                stock_before=before, stock_after=stock[product]
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_summary(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/inventory/stock-movements/summary/').data
+        self.assertEqual(data['total_movements'], 6)
+        self.assertEqual(data['movements_by_type'], {
+            'purchase': 1, 'sale': 1, 'damage': 1, 'adjustment': 2, 'return': 1
+        })
+        self.assertEqual(data['total_quantity_in'], Decimal('100.50'))
+        self.assertEqual(data['total_quantity_out'], Decimal('36.00'))
+        self.assertEqual(data['net_movement'], Decimal('64.50'))
+
+    def test_analytics(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/inventory/stock-movements/analytics/?days=30').data
+        milo, peak = data['products']
+        self.assertEqual(milo['name'], 'Milo')
+        self.assertEqual(milo['net_movement'], Decimal('60.50'))
+        self.assertEqual(milo['adjusted_out'], Decimal('4.00'))
+        # 10 of the 40 units that left were lost
+        self.assertEqual(milo['shrinkage_rate'], Decimal('25.00'))
+        self.assertEqual(milo['average_daily_sales'], Decimal('1.00'))
+        self.assertEqual(milo['days_of_cover'], Decimal('60.0'))
+        self.assertIsNone(peak['days_of_cover'])
+        self.assertEqual(peak['net_movement'], Decimal('2.00'))
+
+        today = timezone.localdate()
+        self.assertEqual(
+            [(row['date'], row['net_movement']) for row in data['daily_net_movement']
+             if row['product_id'] == self.milo.id],
+            [(today, Decimal('60.50'))]
+        )
+
+
+class DemandForecastTests(TestCase):
+    """Nightly forecasts are fitted per batch and read by the stock endpoints"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='forecast@example.com', username='forecast', password='pass',
+            phone_number='08030000008', first_name='Ngozi', last_name='Eze'
+        )
+        category = ProductCategory.objects.create(name='Groceries', category_type='food_beverages')
+        cls.today = timezone.localdate()
+
+        def product(name, stock, age, **kwargs):
+            item = Product.objects.create(
+                user=cls.user, category=category, name=name, cost_price=Decimal('100.00'),
+                selling_price=Decimal('150.00'), current_stock=Decimal(stock), **kwargs
+            )
+            Product.objects.filter(pk=item.pk).update(created_at=cls.at(age))
+            return item
+
+        cls.rice = product('Rice', '10', 120)
+        cls.capped = product('Beans', '10', 120, maximum_stock_level=Decimal('50'))
+        cls.oil = product('Oil', '5', 120)
+        cls.salt = product('Salt', '20', 1)
+        for days_ago in range(1, 91):
+            cls.sell(cls.rice, '4', days_ago)
+            cls.sell(cls.capped, '4', days_ago)
+            if (90 - days_ago) % 3 == 2:
+                cls.sell(cls.oil, '6', days_ago)
+        # Today's sales are left for tomorrow's run
+        cls.sell(cls.rice, '40', 0)
+
+    @classmethod
+    def at(cls, days_ago):
+        return timezone.make_aware(datetime.combine(cls.today - timedelta(days=days_ago), time(12)))
+
+    @classmethod
+    def sell(cls, product, quantity, days_ago):
+        movement = StockMovement.objects.create(
+            product=product, movement_type='sale', quantity=Decimal(quantity),
+            stock_before=Decimal('100'), stock_after=Decimal('100') - Decimal(quantity)
+        )
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=cls.at(days_ago))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_forecasts(self):
+        with self.assertNumQueries(4):
+            self.assertEqual(DemandForecastService(batch_size=10).run(), 4)
+
+    def test_forecasts_and_suggestions(self):
+        self.run_forecasts()
+        rice = DemandForecast.objects.get(product=self.rice)
+        self.assertEqual(rice.method, 'ses')
+        self.assertEqual(rice.daily_demand, Decimal('4.000'))
+        self.assertEqual(rice.demand_std, Decimal('0.000'))
+        self.assertEqual(rice.sales_days, 90)
+        self.assertEqual(rice.reorder_point, Decimal('28.00'))
+        # Topped up to 21 days of demand
+        self.assertEqual(rice.reorder_quantity, Decimal('74.00'))
+        self.assertEqual(rice.days_of_cover, Decimal('2.5'))
+
+        self.assertEqual(DemandForecast.objects.get(product=self.capped).reorder_quantity, Decimal('40.00'))
+
+        # 6 units every third day: Croston with the SBA correction
+        oil = DemandForecast.objects.get(product=self.oil)
+        self.assertEqual(oil.method, 'croston')
+        self.assertEqual(oil.sales_days, 30)
+        self.assertEqual(oil.daily_demand, Decimal('1.800'))
+        self.assertGreater(oil.safety_stock, 0)
+        self.assertEqual(oil.reorder_point, Decimal('12.60') + oil.safety_stock)
+
+        salt = DemandForecast.objects.get(product=self.salt)
+        self.assertEqual((salt.method, salt.history_days), ('none', 1))
+        self.assertEqual(salt.reorder_point, Decimal('0.00'))
+        self.assertIsNone(salt.days_of_cover)
+
+    def test_rerun_updates_in_place(self):
+        self.run_forecasts()
+        Product.objects.filter(pk=self.rice.pk).update(current_stock=Decimal('50'))
+        self.run_forecasts()
+        self.assertEqual(DemandForecast.objects.count(), 4)
+        self.assertEqual(DemandForecast.objects.get(product=self.rice).reorder_quantity, Decimal('34.00'))
+
+    def test_endpoints_use_forecasts(self):
+        self.run_forecasts()
+        response = self.client.get('/api/inventory/products/low_stock/?basis=forecast')
+        self.assertEqual(
+            {row['name'] for row in response.data['results']}, {'Rice', 'Beans', 'Oil'}
+        )
+        self.assertEqual(response.data['results'][0]['forecast']['method'], 'ses')
+
+        response = self.client.get('/api/inventory/products/slow_moving/?basis=forecast&days=30')
+        self.assertEqual([row['name'] for row in response.data['results']], ['Salt'])
+
+
+class SalesRankingTests(TestCase):
+    """Sales rankings are kept per sale and rolled nightly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='ranking@example.com', username='ranking', password='pass',
+            phone_number='08030000009', first_name='Kemi', last_name='Bello'
+        )
+        category = ProductCategory.objects.create(name='Staples', category_type='food_beverages')
+        cls.sales = TransactionCategory.objects.create(name='Sales', category_type='sales')
+
+        def product(name):
+            return Product.objects.create(
+                user=cls.user, category=category, name=name, cost_price=Decimal('100.00'),
+                selling_price=Decimal('150.00'), current_stock=Decimal('100')
+            )
+
+        cls.rice, cls.beans, cls.salt = product('Rice'), product('Beans'), product('Salt')
+        cls.today = timezone.localdate()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sell(self, *lines):
+        response = self.client.post('/api/transactions/transactions/', {
+            'transaction_category': self.sales.id,
+            'transaction_type': 'sale',
+            'payment_method': 'cash',
+            'items': [{'product_id': str(product.id), 'quantity': quantity} for product, quantity in lines],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Transaction.objects.latest('transaction_date')
+
+    def ranking(self, product):
+        return ProductSalesRanking.objects.get(product=product)
+
+    def test_sales_and_refunds_update_rankings(self):
+        self.sell((self.rice, 3), (self.beans, 1))
+        sale = self.sell((self.rice, 3))
+
+        rice = self.ranking(self.rice)
+        self.assertEqual((rice.units_7d, rice.units_90d), (Decimal('6.00'), Decimal('6.00')))
+        self.assertEqual((rice.revenue_30d, rice.sales_30d), (Decimal('900.00'), 2))
+        self.assertEqual(ProductSalesDay.objects.get(product=self.rice, date=self.today).sale_count, 2)
+
+        data = self.client.get('/api/transactions/items/top_selling/?days=7').data
+        self.assertEqual(
+            [(row['item_name'], row['total_quantity'], row['transaction_count']) for row in data],
+            [('Rice', Decimal('6.00'), 2), ('Beans', Decimal('1.00'), 1)]
+        )
+
+        response = self.client.post(f'/api/transactions/transactions/{sale.id}/refund/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        rice = self.ranking(self.rice)
+        self.assertEqual((rice.units_7d, rice.revenue_7d, rice.sales_7d), (Decimal('3.00'), Decimal('450.00'), 2))
+
+    def test_record_queries(self):
+        lines = [(self.rice.id, Decimal('2'), Decimal('300')), (self.beans.id, Decimal('1'), Decimal('150'))]
+        # Savepoint and release, two bulk inserts, then an UPDATE per product and table
+        with self.assertNumQueries(2 + 2 + 2 * 2):
+            SalesRankingService.record(self.user.id, lines)
+
+    def test_roll_drops_expired_days(self):
+        ten_days_ago = timezone.now() - timedelta(days=10)
+        SalesRankingService.record(self.user.id, [(self.rice.id, Decimal('5'), Decimal('750'))], ten_days_ago)
+        SalesRankingService.record(self.user.id, [(self.rice.id, Decimal('2'), Decimal('300'))])
+        rice = self.ranking(self.rice)
+        self.assertEqual((rice.units_7d, rice.units_30d), (Decimal('2.00'), Decimal('7.00')))
+
+        SalesRankingService.roll(today=self.today + timedelta(days=25))
+        rice = self.ranking(self.rice)
+        self.assertEqual(
+            (rice.units_7d, rice.units_30d, rice.units_90d, rice.sales_30d),
+            (Decimal('0.00'), Decimal('2.00'), Decimal('7.00'), 1)
+        )
+        # Every active product now has a ranking row
+        self.assertEqual(ProductSalesRanking.objects.filter(user=self.user).count(), 3)
+
+    def test_product_endpoints(self):
+        self.sell((self.rice, 1), (self.beans, 4))
+        SalesRankingService.roll()
+
+        data = self.client.get('/api/inventory/products/top_selling/?days=7').data
+        self.assertEqual([row['name'] for row in data], ['Beans', 'Rice'])
+        response = self.client.get('/api/inventory/products/top_selling/?days=14')
+        self.assertEqual(response.status_code, 400)
+
+        data = self.client.get('/api/inventory/products/slow_moving/?basis=ranking&days=30').data
+        self.assertEqual([row['name'] for row in data['results']], ['Salt', 'Rice', 'Beans'])
 
-# Create your tests here.
+    def test_period_rankings(self):
+        self.sell((self.rice, 1), (self.beans, 4))
+        top, slow = SalesRankingService.period_rankings(self.user.id, self.today, self.today, limit=2)
+        self.assertEqual([(row['name'], row['quantity']) for row in top], [('Beans', 4.0), ('Rice', 1.0)])
+        self.assertEqual(top[0]['revenue'], 600.0)
+        self.assertEqual([row['name'] for row in slow], ['Salt', 'Rice'])
@@ -7,8 +7,7 @@ Handles products, categories, and stock movements
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q, Sum, Count
+from django.db.models import F, Q, Sum, Count
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -19,16 +18,15 @@ from .serializers import (
     ProductSerializer, 
     StockMovementSerializer
 )
+from .services import (
+    MOVEMENT_IN, MOVEMENT_OUT, InventoryValuationService, SalesRankingService, inventory_aggregates,
+    movement_analytics, movement_totals, sales_today
+)
+from utils.export import StreamingExportMixin
+from utils.pagination import PaginatedActionsMixin, StandardResultsSetPagination
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for inventory views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing product categories
     """
@@ -41,14 +39,15 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
         """Filter categories by user's products"""
         return ProductCategory.objects.filter(
             products__user=self.request.user
-        ).distinct().order_by('name')
+        ).annotate(
+            product_count=Count('products', filter=Q(products__is_active=True))
+        ).order_by('name')
     
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get only active categories"""
         categories = self.get_queryset().filter(is_active=True)
-        serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(categories)
     
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
@@ -58,10 +57,9 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
             category=category,
             user=request.user,
             is_active=True
-        ).order_by('name')
+        ).select_related('category', 'forecast').order_by('name')
         
-        serializer = ProductSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self.paginated_response(products, ProductSerializer)
     
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
@@ -72,22 +70,20 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
             user=request.user
         )
         
+        totals = inventory_aggregates(products)
         stats = {
-            'total_products': products.count(),
-            'active_products': products.filter(is_active=True).count(),
-            'low_stock_products': products.filter(is_low_stock=True).count(),
-            'out_of_stock_products': products.filter(is_out_of_stock=True).count(),
-            'total_inventory_value': sum(p.current_stock * p.cost_price for p in products),
-            'total_sales_today': sum(
-                p.total_sold for p in products 
-                if p.last_sold_date and p.last_sold_date.date() == timezone.now().date()
-            )
+            'total_products': totals['product_count'],
+            'active_products': totals['active_product_count'],
+            'low_stock_products': totals['low_stock_count'],
+            'out_of_stock_products': totals['out_of_stock_count'],
+            'total_inventory_value': totals['total_inventory_value'],
+            'total_sales_today': sales_today(products),
         }
         
         return Response(stats)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing products with inventory tracking
     """
@@ -98,7 +94,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter products by user"""
-        queryset = Product.objects.filter(user=self.request.user)
+        queryset = Product.objects.filter(user=self.request.user).select_related('category', 'forecast')
         
         # Filter by category if provided
         category_id = self.request.query_params.get('category', None)
@@ -108,11 +104,11 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Filter by stock status
         stock_status = self.request.query_params.get('stock_status', None)
         if stock_status == 'low':
-            queryset = queryset.filter(is_low_stock=True)
+            queryset = queryset.low_stock()
         elif stock_status == 'out':
-            queryset = queryset.filter(is_out_of_stock=True)
+            queryset = queryset.out_of_stock()
         elif stock_status == 'in_stock':
-            queryset = queryset.filter(is_out_of_stock=False, is_low_stock=False)
+            queryset = queryset.in_stock()
         
         # Filter by product type
         product_type = self.request.query_params.get('product_type', None)
@@ -137,44 +133,74 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
-        """Get products with low stock"""
-        products = self.get_queryset().filter(is_low_stock=True)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        """
+        Get products with low stock: at or below their minimum stock level,
+        or with ``?basis=forecast`` at or below the forecast reorder point
+        """
+        if request.query_params.get('basis') == 'forecast':
+            products = self.get_queryset().filter(
+                current_stock__lte=F('forecast__reorder_point'),
+                forecast__method__in=['ses', 'croston']
+            )
+        else:
+            products = self.get_queryset().low_stock()
+        return self.paginated_response(products)
     
     @action(detail=False, methods=['get'])
     def out_of_stock(self, request):
         """Get out of stock products"""
-        products = self.get_queryset().filter(is_out_of_stock=True)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        products = self.get_queryset().out_of_stock()
+        return self.paginated_response(products)
     
     @action(detail=False, methods=['get'])
     def top_selling(self, request):
-        """Get top selling products"""
-        days = int(request.query_params.get('days', 30))
-        since_date = timezone.now() - timedelta(days=days)
+        """Get the top selling products over the last 7, 30 or 90 days"""
+        try:
+            field = SalesRankingService.window_field(request.query_params.get('days', 30))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
         products = self.get_queryset().filter(
-            last_sold_date__gte=since_date
-        ).order_by('-total_sold')[:10]
+            **{f'sales_ranking__{field}__gt': 0}
+        ).order_by(f'-sales_ranking__{field}', 'name')[:10]
         
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def slow_moving(self, request):
-        """Get slow moving products"""
+        """
+        Get slow moving products: not sold in ``days``, with
+        ``?basis=forecast`` holding more than ``days`` of forecast demand, or
+        with ``?basis=ranking`` the fewest units sold in the last 7, 30 or 90 days
+        """
         days = int(request.query_params.get('days', 90))
         since_date = timezone.now() - timedelta(days=days)
         
+        if request.query_params.get('basis') == 'ranking':
+            try:
+                field = SalesRankingService.window_field(days)
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            products = self.get_queryset().filter(
+                sales_ranking__isnull=False,
+                is_active=True
+            ).order_by(f'sales_ranking__{field}', 'name')
+            return self.paginated_response(products)
+        
+        if request.query_params.get('basis') == 'forecast':
+            products = self.get_queryset().filter(
+                current_stock__gt=F('forecast__daily_demand') * days,
+                is_active=True
+            ).order_by('forecast__daily_demand', 'name')
+            return self.paginated_response(products)
+        
         products = self.get_queryset().filter(
             Q(last_sold_date__lt=since_date) | Q(last_sold_date__isnull=True),
             is_active=True
         ).order_by('last_sold_date')
         
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(products)
     
     @action(detail=True, methods=['post'])
     def adjust_stock(self, request, pk=None):
@@ -256,26 +282,24 @@ class ProductViewSet(viewsets.ModelViewSet):
     def stock_history(self, request, pk=None):
         """Get stock movement history for product"""
         product = self.get_object()
-        movements = StockMovement.objects.filter(product=product).order_by('-created_at')
+        movements = StockMovement.objects.filter(
+            product=product
+        ).select_related('product').order_by('-created_at')
         
-        serializer = StockMovementSerializer(movements, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(movements, StockMovementSerializer)
     
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
         """Get inventory dashboard statistics"""
-        products = self.get_queryset()
+        summary = InventoryValuationService.get_summary(request.user.id)
         
         stats = {
-            'total_products': products.count(),
-            'active_products': products.filter(is_active=True).count(),
-            'low_stock_products': products.filter(is_low_stock=True).count(),
-            'out_of_stock_products': products.filter(is_out_of_stock=True).count(),
-            'total_inventory_value': sum(p.current_stock * p.cost_price for p in products),
-            'total_sales_today': sum(
-                p.total_sold for p in products 
-                if p.last_sold_date and p.last_sold_date.date() == timezone.now().date()
-            ),
+            'total_products': summary.product_count,
+            'active_products': summary.active_product_count,
+            'low_stock_products': summary.low_stock_count,
+            'out_of_stock_products': summary.out_of_stock_count,
+            'total_inventory_value': summary.total_inventory_value,
+            'total_sales_today': sales_today(Product.objects.filter(user=request.user)),
             'categories_count': ProductCategory.objects.filter(
                 products__user=request.user
             ).distinct().count()
@@ -284,7 +308,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response(stats)
 
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(PaginatedActionsMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing stock movements
     """
@@ -292,12 +316,46 @@ class StockMovementViewSet(viewsets.ModelViewSet):
     serializer_class = StockMovementSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
+    
+    export_ordering = ('created_at', 'id')
+    export_filename = 'stock-movements'
+    export_columns = [
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('product_id', 'product_id'),
+        ('product_name', 'product__name'),
+        ('sku', 'product__sku'),
+        ('movement_type', 'movement_type'),
+        ('quantity', 'quantity'),
+        ('unit_cost', 'unit_cost'),
+        ('stock_before', 'stock_before'),
+        ('stock_after', 'stock_after'),
+        ('reference_number', 'reference_number'),
+        ('notes', 'notes'),
+    ]
     
     def get_queryset(self):
         """Filter stock movements by user's products"""
         return StockMovement.objects.filter(
             product__user=self.request.user
-        ).order_by('-created_at')
+        ).select_related('product').order_by('-created_at')
+    
+    def get_export_queryset(self):
+        """Apply export filters: date range, movement type and product"""
+        queryset = self.get_queryset()
+        params = self.request.query_params
+        
+        if params.get('start_date'):
+            queryset = queryset.filter(created_at__date__gte=params['start_date'])
+        if params.get('end_date'):
+            queryset = queryset.filter(created_at__date__lte=params['end_date'])
+        if params.get('type'):
+            queryset = queryset.filter(movement_type=params['type'])
+        if params.get('product'):
+            queryset = queryset.filter(product_id=params['product'])
+        
+        return queryset
     
     def perform_create(self, serializer):
         """Set created_by when creating stock movement"""
@@ -308,8 +366,7 @@ class StockMovementViewSet(viewsets.ModelViewSet):
         """Get today's stock movements"""
         today = timezone.now().date()
         movements = self.get_queryset().filter(created_at__date=today)
-        serializer = self.get_serializer(movements, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(movements)
     
     @action(detail=False, methods=['get'])
     def by_type(self, request):
@@ -322,8 +379,7 @@ class StockMovementViewSet(viewsets.ModelViewSet):
             )
         
         movements = self.get_queryset().filter(movement_type=movement_type)
-        serializer = self.get_serializer(movements, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(movements)
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
@@ -331,27 +387,41 @@ class StockMovementViewSet(viewsets.ModelViewSet):
         days = int(request.query_params.get('days', 30))
         since_date = timezone.now() - timedelta(days=days)
         
-        movements = self.get_queryset().filter(created_at__gte=since_date)
+        totals = movement_totals(self.get_queryset().filter(created_at__gte=since_date))
         
         summary = {
-            'total_movements': movements.count(),
-            'movements_by_type': {},
-            'total_quantity_in': 0,
-            'total_quantity_out': 0,
-            'net_movement': 0
+            'total_movements': sum(row['count'] for row in totals.values()),
+            'movements_by_type': {
+                movement_type: row['count'] for movement_type, row in totals.items()
+            },
+            'total_quantity_in': sum(
+                (totals[t]['quantity'] for t in MOVEMENT_IN if t in totals), Decimal('0.00')
+            ),
+            'total_quantity_out': sum(
+                (totals[t]['quantity'] for t in MOVEMENT_OUT if t in totals), Decimal('0.00')
+            ),
         }
+        summary['net_movement'] = summary['total_quantity_in'] - summary['total_quantity_out']
         
-        for movement in movements:
-            movement_type = movement.movement_type
-            if movement_type not in summary['movements_by_type']:
-                summary['movements_by_type'][movement_type] = 0
-            summary['movements_by_type'][movement_type] += 1
-            
-            if movement_type in ['purchase', 'return']:
-                summary['total_quantity_in'] += movement.quantity
-            elif movement_type in ['sale', 'damage']:
-                summary['total_quantity_out'] += movement.quantity
+        return Response(summary)
+    
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Per-product movement analytics for the last ``days`` (default 30):
+        net movement, shrinkage rate, days of cover and the daily net
+        movement. ``product`` limits it to one product.
+        """
+        days = int(request.query_params.get('days', 30))
+        since_date = timezone.now() - timedelta(days=days)
         
-        summary['net_movement'] = summary['total_quantity_in'] - summary['total_quantity_out']
+        movements = StockMovement.objects.filter(
+            product__user=request.user, created_at__gte=since_date
+        )
+        product = request.query_params.get('product')
+        if product:
+            movements = movements.filter(product_id=product)
         
-        return Response(summary)
\ No newline at end of file
+        data = movement_analytics(movements, days)
+        data['days'] = days
+        return Response(data)
\ No newline at end of file
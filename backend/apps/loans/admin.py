@@ -30,7 +30,7 @@ class LoanAdmin(admin.ModelAdmin):
             'fields': ('principal_amount', 'interest_rate', 'tenure_days', 'processing_fee', 'total_interest', 'total_amount', 'monthly_installment')
         }),
         ('Repayment Tracking', {
-            'fields': ('amount_paid', 'outstanding_balance', 'days_past_due', 'risk_level')
+            'fields': ('amount_paid', 'outstanding_balance', 'days_past_due', 'arrears_amount', 'risk_level')
         }),
         ('Important Dates', {
             'fields': ('approved_date', 'disbursed_date', 'first_repayment_date', 'final_repayment_date')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loan",
+            name="arrears_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                help_text="Scheduled amount due so far that has not been paid",
+                max_digits=15,
+            ),
+        ),
+    ]
@@ -0,0 +1,191 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def build_portfolio(apps, schema_editor):
+    Loan = apps.get_model("loans", "Loan")
+    LoanRepayment = apps.get_model("loans", "LoanRepayment")
+    LoanPortfolioSummary = apps.get_model("loans", "LoanPortfolioSummary")
+    LoanPortfolioDaily = apps.get_model("loans", "LoanPortfolioDaily")
+
+    bucket = models.Case(
+        models.When(days_past_due__gt=90, then=models.Value("over_90")),
+        models.When(days_past_due__gt=30, then=models.Value("31_90")),
+        models.When(days_past_due__gt=0, then=models.Value("1_30")),
+        default=models.Value("current"),
+    )
+    rows = Loan.objects.order_by().annotate(dpd_bucket=bucket).values(
+        "loan_product_id", "status", "risk_level", "dpd_bucket"
+    ).annotate(
+        loan_count=models.Count("id"),
+        principal_amount=models.Sum("principal_amount"),
+        outstanding_balance=models.Sum("outstanding_balance"),
+        amount_paid=models.Sum("amount_paid"),
+        arrears_amount=models.Sum("arrears_amount"),
+    )
+    LoanPortfolioSummary.objects.bulk_create(
+        [LoanPortfolioSummary(**row) for row in rows], batch_size=500
+    )
+
+    days = {}
+    disbursed = Loan.objects.filter(disbursed_date__isnull=False).order_by().annotate(
+        date=TruncDate("disbursed_date")
+    ).values("date", "loan_product_id").annotate(
+        disbursed_count=models.Count("id"), disbursed_amount=models.Sum("principal_amount")
+    )
+    for row in disbursed:
+        days[(row.pop("date"), row.pop("loan_product_id"))] = row
+    collected = LoanRepayment.objects.filter(status="completed").order_by().annotate(
+        date=TruncDate("payment_date")
+    ).values("date", "loan__loan_product_id").annotate(
+        repayment_count=models.Count("id"), collected_amount=models.Sum("paid_amount")
+    )
+    for row in collected:
+        key = (row.pop("date"), row.pop("loan__loan_product_id"))
+        days.setdefault(key, {}).update(row)
+    LoanPortfolioDaily.objects.bulk_create(
+        [
+            LoanPortfolioDaily(date=date, loan_product_id=product_id, **values)
+            for (date, product_id), values in days.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0003_loan_arrears_amount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoanPortfolioDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("disbursed_count", models.IntegerField(default=0)),
+                (
+                    "disbursed_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                ("repayment_count", models.IntegerField(default=0)),
+                (
+                    "collected_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                (
+                    "loan_product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="portfolio_daily",
+                        to="loans.loanproduct",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Loan Portfolio Day",
+                "verbose_name_plural": "Loan Portfolio Days",
+                "db_table": "loan_portfolio_daily",
+                "ordering": ["date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "loan_product"), name="unique_portfolio_day"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="LoanPortfolioSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("applied", "Applied"),
+                            ("under_review", "Under Review"),
+                            ("approved", "Approved"),
+                            ("rejected", "Rejected"),
+                            ("disbursed", "Disbursed"),
+                            ("active", "Active"),
+                            ("completed", "Completed"),
+                            ("defaulted", "Defaulted"),
+                            ("written_off", "Written Off"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("risk_level", models.CharField(max_length=20)),
+                (
+                    "dpd_bucket",
+                    models.CharField(
+                        choices=[
+                            ("current", "Current"),
+                            ("1_30", "1-30 Days"),
+                            ("31_90", "31-90 Days"),
+                            ("over_90", "Over 90 Days"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("loan_count", models.IntegerField(default=0)),
+                (
+                    "principal_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                (
+                    "outstanding_balance",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                (
+                    "amount_paid",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                (
+                    "arrears_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "loan_product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="portfolio_summaries",
+                        to="loans.loanproduct",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Loan Portfolio Summary",
+                "verbose_name_plural": "Loan Portfolio Summaries",
+                "db_table": "loan_portfolio_summaries",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("loan_product", "status", "risk_level", "dpd_bucket"),
+                        name="unique_portfolio_summary_group",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_portfolio, migrations.RunPython.noop),
+    ]
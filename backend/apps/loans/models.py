@@ -7,7 +7,7 @@ Handles loan applications, disbursements, and repayments
 import uuid
 from decimal import Decimal
 from datetime import datetime, timedelta
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from apps.users.models import User
@@ -112,6 +112,29 @@ class LoanProduct(models.Model):
     
     def __str__(self):
         return f"{self.name} - {self.interest_rate}% p.a."
+    
+    # Changing any of these reprices the product's loans that are not yet disbursed
+    PRICING_FIELDS = ['interest_rate', 'interest_type', 'processing_fee_rate', 'repayment_frequency']
+    
+    def save(self, *args, **kwargs):
+        repriced = self._pricing_snapshot is not None and self._pricing_snapshot != self.pricing_snapshot()
+        super().save(*args, **kwargs)
+        self._pricing_snapshot = self.pricing_snapshot()
+        if repriced:
+            from .tasks import reprice_product_loans
+            product_id = str(self.pk)
+            transaction.on_commit(lambda: reprice_product_loans.delay(product_id))
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._pricing_snapshot = instance.pricing_snapshot()
+        return instance
+    
+    _pricing_snapshot = None
+    
+    def pricing_snapshot(self):
+        return tuple(getattr(self, field) for field in self.PRICING_FIELDS)
 
 
 class Loan(models.Model):
@@ -213,6 +236,12 @@ class Loan(models.Model):
     # Status and Risk
     status = models.CharField(max_length=20, choices=LOAN_STATUS, default='applied')
     days_past_due = models.PositiveIntegerField(default=0)
+    arrears_amount = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        help_text='Scheduled amount due so far that has not been paid'
+    )
     risk_level = models.CharField(
         max_length=20,
         choices=[
@@ -290,27 +319,87 @@ class Loan(models.Model):
             loan_count = Loan.objects.filter(borrower=self.borrower).count() + 1
             self.loan_number = f"LOAN-{date_str}-{user_id}-{loan_count:03d}"
         
-        # Calculate total amounts
-        self.processing_fee = (self.principal_amount * self.loan_product.processing_fee_rate) / 100
-        
-        if self.loan_product.interest_type == 'flat':
-            self.total_interest = (self.principal_amount * self.interest_rate * self.tenure_days) / (365 * 100)
-        else:  # reducing balance
-            monthly_rate = self.interest_rate / (12 * 100)
-            months = self.tenure_days / 30
-            if monthly_rate > 0:
-                self.monthly_installment = (self.principal_amount * monthly_rate * ((1 + monthly_rate) ** months)) / (((1 + monthly_rate) ** months) - 1)
-                self.total_interest = (self.monthly_installment * months) - self.principal_amount
-            else:
-                self.monthly_installment = self.principal_amount / months
-                self.total_interest = 0
+        # Terms are only recomputed when their inputs change; a loan being
+        # repaid also gets the pending part of its schedule rebuilt
+        terms_changed = self._terms_snapshot != self.terms_snapshot()
+        reschedule = (
+            terms_changed and self._terms_snapshot is not None
+            and self.status in ('disbursed', 'active')
+        )
+        if terms_changed:
+            from .services import AmortizationService
+            AmortizationService.apply_terms([self])
+            if not self.amount_paid or reschedule:
+                self.outstanding_balance = self.total_amount - self.amount_paid
         
-        self.total_amount = self.principal_amount + self.total_interest + self.processing_fee
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            if reschedule:
+                remaining = AmortizationService.rebuild_schedules([self])
+                if remaining:
+                    self.final_repayment_date = remaining[-1].due_date
+                    Loan.objects.filter(pk=self.pk).update(final_repayment_date=self.final_repayment_date)
+            
+            # Keep the lender portfolio summary in step with this row
+            from .services import PortfolioService
+            snapshot = self.portfolio_snapshot()
+            PortfolioService.apply_change(self._portfolio_snapshot, snapshot)
+            if self.disbursed_date and not (self._portfolio_snapshot or {}).get('disbursed_date'):
+                PortfolioService.record_disbursement(self)
         
-        if not self.outstanding_balance:
-            self.outstanding_balance = self.total_amount
+        # Sales read the borrower's deduction terms from the cache
+        if self._deduction_snapshot != self.deduction_snapshot():
+            from .services import AutoDeductionService
+            AutoDeductionService.invalidate(self.borrower_id)
         
-        super().save(*args, **kwargs)
+        self._terms_snapshot = self.terms_snapshot()
+        self._portfolio_snapshot = snapshot
+        self._deduction_snapshot = self.deduction_snapshot()
+    
+    def delete(self, *args, **kwargs):
+        from .services import AutoDeductionService, PortfolioService
+        snapshot = self._portfolio_snapshot
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            PortfolioService.apply_change(snapshot, None)
+        AutoDeductionService.invalidate(self.borrower_id)
+        return result
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._terms_snapshot = instance.terms_snapshot()
+        instance._portfolio_snapshot = instance.portfolio_snapshot()
+        instance._deduction_snapshot = instance.deduction_snapshot()
+        return instance
+    
+    _terms_snapshot = None
+    _portfolio_snapshot = None
+    _deduction_snapshot = None
+    
+    def portfolio_snapshot(self):
+        """This loan's contribution to the portfolio summary"""
+        return {
+            'key': (self.loan_product_id, self.status, self.risk_level, dpd_bucket(self.days_past_due)),
+            'disbursed_date': self.disbursed_date,
+            'loan_count': 1,
+            'principal_amount': self.principal_amount,
+            'outstanding_balance': self.outstanding_balance,
+            'amount_paid': self.amount_paid,
+            'arrears_amount': self.arrears_amount,
+        }
+    
+    def terms_snapshot(self):
+        """Inputs of the loan's terms"""
+        return (self.principal_amount, self.interest_rate, self.tenure_days, self.loan_product_id)
+    
+    def deduction_snapshot(self):
+        """Fields that decide whether and how much POS sales repay this loan"""
+        return (
+            self.status, self.enable_auto_deduction, self.auto_deduction_percentage,
+            self.outstanding_balance > 0
+        )
     
     @property
     def is_overdue(self):
@@ -330,11 +419,15 @@ class Loan(models.Model):
         if not self.first_repayment_date:
             return None
         
-        # Find the most recent payment
-        latest_payment = self.repayments.filter(status='completed').order_by('-payment_date').first()
+        # Find the most recent payment (list querysets annotate it up front)
+        if hasattr(self, 'last_completed_payment_date'):
+            latest_payment_date = self.last_completed_payment_date
+        else:
+            latest_payment = self.repayments.filter(status='completed').order_by('-payment_date').first()
+            latest_payment_date = latest_payment.payment_date if latest_payment else None
         
-        if latest_payment:
-            base_date = latest_payment.payment_date.date()
+        if latest_payment_date:
+            base_date = latest_payment_date.date()
         else:
             base_date = self.first_repayment_date
         
@@ -474,6 +567,111 @@ class LoanRepayment(models.Model):
         if self.payment_date.date() > self.due_date:
             self.days_late = (self.payment_date.date() - self.due_date).days
         
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Count the payment in the collection series once it completes
+            if self.status == 'completed' and self._loaded_status != 'completed':
+                from .services import PortfolioService
+                PortfolioService.record_collection(self)
+        self._loaded_status = self.status
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.status
+        return instance
+    
+    _loaded_status = None
+
+
+# Days-past-due buckets of the portfolio summary; PAR30 and PAR90 are the
+# outstanding balance in the buckets past 30 and 90 days
+DPD_BUCKETS = [
+    ('current', 'Current'),
+    ('1_30', '1-30 Days'),
+    ('31_90', '31-90 Days'),
+    ('over_90', 'Over 90 Days'),
+]
+
+
+def dpd_bucket(days_past_due):
+    if days_past_due > 90:
+        return 'over_90'
+    if days_past_due > 30:
+        return '31_90'
+    if days_past_due > 0:
+        return '1_30'
+    return 'current'
+
+
+class LoanPortfolioSummary(models.Model):
+    """
+    Loan book totals per product, status, risk level and days-past-due
+    bucket, updated with F() deltas as loans are saved so portfolio
+    analytics never scan the loans table. ``PortfolioService.rebuild``
+    recomputes it from scratch.
+    """
+    
+    loan_product = models.ForeignKey(
+        LoanProduct,
+        on_delete=models.CASCADE,
+        related_name='portfolio_summaries'
+    )
+    status = models.CharField(max_length=20, choices=Loan.LOAN_STATUS)
+    risk_level = models.CharField(max_length=20)
+    dpd_bucket = models.CharField(max_length=10, choices=DPD_BUCKETS)
+    
+    loan_count = models.IntegerField(default=0)
+    principal_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    outstanding_balance = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    arrears_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'loan_portfolio_summaries'
+        verbose_name = _('Loan Portfolio Summary')
+        verbose_name_plural = _('Loan Portfolio Summaries')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['loan_product', 'status', 'risk_level', 'dpd_bucket'],
+                name='unique_portfolio_summary_group'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.loan_product_id} {self.status}/{self.risk_level}/{self.dpd_bucket}"
+
+
+class LoanPortfolioDaily(models.Model):
+    """
+    Disbursements and collections per day and product, incremented as
+    loans are disbursed and repayments complete
+    """
+    
+    date = models.DateField()
+    loan_product = models.ForeignKey(
+        LoanProduct,
+        on_delete=models.CASCADE,
+        related_name='portfolio_daily'
+    )
+    disbursed_count = models.IntegerField(default=0)
+    disbursed_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    repayment_count = models.IntegerField(default=0)
+    collected_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'loan_portfolio_daily'
+        verbose_name = _('Loan Portfolio Day')
+        verbose_name_plural = _('Loan Portfolio Days')
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'loan_product'], name='unique_portfolio_day'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.loan_product_id}"
 
 
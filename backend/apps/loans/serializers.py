@@ -5,6 +5,7 @@ Loan serializers for loan management
 
 from rest_framework import serializers
 from .models import LoanProduct, Loan, LoanRepayment
+from utils.serializers import SparseFieldsetMixin
 
 
 class LoanProductSerializer(serializers.ModelSerializer):
@@ -24,7 +25,7 @@ class LoanProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class LoanSerializer(serializers.ModelSerializer):
+class LoanSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for loan applications and management
     """
@@ -43,7 +44,7 @@ class LoanSerializer(serializers.ModelSerializer):
             'total_amount', 'monthly_installment', 'amount_paid',
             'outstanding_balance', 'approved_date', 'disbursed_date',
             'first_repayment_date', 'final_repayment_date', 'status',
-            'days_past_due', 'risk_level', 'collateral_type', 'collateral_value',
+            'days_past_due', 'arrears_amount', 'risk_level', 'collateral_type', 'collateral_value',
             'collateral_description', 'purpose', 'business_plan',
             'approval_notes', 'rejection_reason', 'enable_auto_deduction',
             'auto_deduction_percentage', 'is_overdue', 'completion_percentage',
@@ -52,7 +53,7 @@ class LoanSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'loan_number', 'borrower_name', 'loan_product_name',
             'processing_fee', 'total_interest', 'total_amount', 'monthly_installment',
-            'amount_paid', 'outstanding_balance', 'days_past_due',
+            'amount_paid', 'outstanding_balance', 'days_past_due', 'arrears_amount', 'risk_level',
             'is_overdue', 'completion_percentage', 'next_payment_date',
             'application_date', 'created_at'
         ]
@@ -62,7 +63,7 @@ class LoanSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class LoanRepaymentSerializer(serializers.ModelSerializer):
+class LoanRepaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for loan repayments
     """
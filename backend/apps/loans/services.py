@@ -0,0 +1,705 @@
+# backend/apps/loans/services.py
+"""
+Loan services
+Amortization engine (loan terms and full repayment schedules, computed
+with numpy over batches of loans), delinquency, portfolio analytics and
+auto-deduction from POS sales
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import ROUND_DOWN, Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Loan, LoanPortfolioDaily, LoanPortfolioSummary, LoanRepayment
+
+# Days between installments for each repayment frequency
+FREQUENCY_DAYS = {
+    'daily': 1,
+    'weekly': 7,
+    'bi_weekly': 14,
+    'monthly': 30,
+    'quarterly': 90,
+}
+
+# Loans whose terms follow the product until they are disbursed
+PIPELINE_STATUSES = ['applied', 'under_review', 'approved']
+
+TERM_FIELDS = ['interest_rate', 'processing_fee', 'total_interest', 'total_amount', 'monthly_installment']
+
+
+def to_cents(values):
+    return np.rint(np.asarray(values, dtype=float) * 100).astype(np.int64)
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def amortize(principal, annual_rate, tenure_days, period_days, flat):
+    """
+    Terms for many loans at once. Every argument is array-like with one
+    entry per loan; ``flat`` marks flat-rate loans, the others amortize on
+    a reducing balance.
+
+    Returns ``(installments, period_rate, installment, total_interest)``
+    arrays; amounts are floats in Naira, rounded by the caller.
+    """
+    principal = np.asarray(principal, dtype=float)
+    rate = np.asarray(annual_rate, dtype=float) / 100
+    tenure_days = np.asarray(tenure_days, dtype=float)
+    period_days = np.asarray(period_days, dtype=float)
+    flat = np.asarray(flat, dtype=bool)
+
+    installments = np.maximum(1, np.ceil(tenure_days / period_days)).astype(np.int64)
+    period_rate = rate * period_days / 365
+
+    flat_interest = principal * rate * tenure_days / 365
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(
+            period_rate > 0,
+            principal * period_rate / (1 - (1 + period_rate) ** -installments),
+            principal / installments,
+        )
+    installment = np.where(flat, (principal + flat_interest) / installments, annuity)
+    total_interest = np.where(flat, flat_interest, annuity * installments - principal)
+    return installments, period_rate, installment, total_interest
+
+
+def schedule_matrix(principal, period_rate, installments, installment, total_interest, flat):
+    """
+    Principal and interest of every installment, as ``(loans x periods)``
+    integer matrices in kobo. Rounding differences are absorbed by each
+    loan's last installment so the rows add up exactly.
+    """
+    principal = np.asarray(principal, dtype=float)
+    count = int(installments.max())
+    period = np.arange(1, count + 1)
+    mask = period <= installments[:, None]
+
+    # Balance before each period of a reducing-balance annuity
+    rate = period_rate[:, None]
+    growth = (1 + rate) ** (period - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance = np.where(
+            rate > 0,
+            principal[:, None] * growth - installment[:, None] * (growth - 1) / rate,
+            principal[:, None] - installment[:, None] * (period - 1),
+        )
+    interest = np.where(flat[:, None], (total_interest / installments)[:, None], balance * rate)
+    principal_part = np.where(flat[:, None], (principal / installments)[:, None], installment[:, None] - interest)
+
+    principal_cents = np.where(mask, to_cents(principal_part), 0)
+    interest_cents = np.where(mask, to_cents(interest), 0)
+
+    rows = np.arange(len(installments))
+    last = installments - 1
+    principal_cents[rows, last] += to_cents(principal) - principal_cents.sum(axis=1)
+    interest_cents[rows, last] += to_cents(total_interest) - interest_cents.sum(axis=1)
+    return principal_cents, interest_cents
+
+
+def loan_terms(principal, interest_rate, tenure_days, product):
+    """Quote for a single loan on ``product``"""
+    loan = Loan(
+        principal_amount=Decimal(principal), interest_rate=interest_rate,
+        tenure_days=tenure_days, loan_product=product
+    )
+    AmortizationService.apply_terms([loan])
+    return {field: getattr(loan, field) for field in TERM_FIELDS}
+
+
+class AmortizationService:
+    """
+    Computes loan terms and repayment schedules for batches of loans in a
+    single numpy pass, and writes them with bulk_update / bulk_create
+    """
+
+    @staticmethod
+    def inputs(loans):
+        products = [loan.loan_product for loan in loans]
+        return (
+            [loan.principal_amount for loan in loans],
+            [loan.interest_rate for loan in loans],
+            [loan.tenure_days for loan in loans],
+            [FREQUENCY_DAYS.get(product.repayment_frequency, 7) for product in products],
+            [product.interest_type == 'flat' for product in products],
+        )
+
+    @classmethod
+    def apply_terms(cls, loans):
+        """Set fee, interest, total and installment on each loan (not saved)"""
+        if not loans:
+            return loans
+        principal, rate, tenure, period, flat = cls.inputs(loans)
+        _, _, installment, total_interest = amortize(principal, rate, tenure, period, flat)
+
+        fee_rates = [loan.loan_product.processing_fee_rate for loan in loans]
+        fees = to_cents(np.asarray(principal, dtype=float) * np.asarray(fee_rates, dtype=float) / 100)
+        interest = to_cents(total_interest)
+        installment = to_cents(installment)
+        principal = to_cents(principal)
+
+        for index, loan in enumerate(loans):
+            loan.processing_fee = from_cents(fees[index])
+            loan.total_interest = from_cents(interest[index])
+            loan.total_amount = from_cents(principal[index] + interest[index] + fees[index])
+            loan.monthly_installment = from_cents(installment[index])
+        return loans
+
+    @classmethod
+    def build_schedules(cls, loans, start=None):
+        """
+        Unsaved LoanRepayment rows for the full schedule of each loan, due
+        every repayment period after ``start`` (default: disbursement date).
+        The processing fee is collected with the first installment.
+        """
+        if not loans:
+            return []
+        principal, rate, tenure, period, flat = cls.inputs(loans)
+        installments, period_rate, installment, total_interest = amortize(
+            principal, rate, tenure, period, flat
+        )
+        principal_cents, interest_cents = schedule_matrix(
+            principal, period_rate, installments, installment, total_interest, np.asarray(flat)
+        )
+
+        repayments = []
+        for index, loan in enumerate(loans):
+            first_day = start or timezone.localdate(loan.disbursed_date or timezone.now())
+            loan_code = str(loan.id)[:8].upper()
+            fee = loan.processing_fee or Decimal('0')
+            for number in range(int(installments[index])):
+                due_date = first_day + timedelta(days=period[index] * (number + 1))
+                principal_part = from_cents(principal_cents[index, number])
+                interest_part = from_cents(interest_cents[index, number])
+                repayments.append(LoanRepayment(
+                    loan=loan,
+                    payment_reference=f"PAY-{due_date:%Y%m%d}-{loan_code}-S{number + 1:03d}",
+                    repayment_type='scheduled',
+                    scheduled_amount=principal_part + interest_part + (fee if number == 0 else 0),
+                    paid_amount=Decimal('0'),
+                    principal_amount=principal_part,
+                    interest_amount=interest_part,
+                    due_date=due_date,
+                    payment_date=timezone.make_aware(datetime.combine(due_date, time.min)),
+                    status='pending',
+                ))
+        return repayments
+
+    @classmethod
+    def create_schedule(cls, loan):
+        """Create a disbursed loan's full schedule and set its repayment dates"""
+        repayments = cls.build_schedules([loan])
+        with transaction.atomic():
+            LoanRepayment.objects.bulk_create(repayments, batch_size=500)
+            loan.first_repayment_date = repayments[0].due_date
+            loan.final_repayment_date = repayments[-1].due_date
+            Loan.objects.filter(pk=loan.pk).update(
+                first_repayment_date=loan.first_repayment_date,
+                final_repayment_date=loan.final_repayment_date,
+            )
+        return repayments
+
+    @classmethod
+    def rebuild_schedules(cls, loans):
+        """
+        Regenerate the pending part of the schedule for a batch of disbursed
+        loans. Installments already settled (completed scheduled rows) are
+        kept; the pending ones are replaced.
+        """
+        loans = list(loans)
+        if not loans:
+            return []
+        loan_ids = [loan.id for loan in loans]
+        settled = dict(
+            LoanRepayment.objects.filter(
+                loan_id__in=loan_ids, repayment_type='scheduled', status='completed'
+            ).order_by().values('loan_id').annotate(count=Count('id')).values_list('loan_id', 'count')
+        )
+
+        repayments = cls.build_schedules(loans)
+        position = {}
+        remaining = []
+        for repayment in repayments:
+            number = position[repayment.loan_id] = position.get(repayment.loan_id, 0) + 1
+            if number > settled.get(repayment.loan_id, 0):
+                remaining.append(repayment)
+
+        with transaction.atomic():
+            LoanRepayment.objects.filter(
+                loan_id__in=loan_ids, repayment_type='scheduled', status='pending'
+            ).delete()
+            LoanRepayment.objects.bulk_create(remaining, batch_size=500)
+        return remaining
+
+    @classmethod
+    def reprice_product(cls, product, batch_size=1000):
+        """
+        Apply a product's current rates to its loans that are not yet
+        disbursed, ``batch_size`` loans per numpy pass and bulk_update,
+        moving the portfolio summary with them. Disbursed loans keep the
+        rate they were approved at.
+        """
+        queryset = Loan.objects.filter(loan_product=product, status__in=PIPELINE_STATUSES).order_by('pk')
+        updated = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            loans = list(batch[:batch_size])
+            if not loans:
+                return updated
+            for loan in loans:
+                loan.loan_product = product
+                loan.interest_rate = product.interest_rate
+            cls.apply_terms(loans)
+            changes = []
+            for loan in loans:
+                loan.outstanding_balance = loan.total_amount - loan.amount_paid
+                snapshot = loan.portfolio_snapshot()
+                changes.append((loan._portfolio_snapshot, snapshot))
+                loan._portfolio_snapshot = snapshot
+            with transaction.atomic():
+                Loan.objects.bulk_update(loans, [*TERM_FIELDS, 'outstanding_balance'], batch_size=batch_size)
+                PortfolioService.apply_changes(changes)
+            updated += len(loans)
+            last_pk = loans[-1].pk
+
+
+# Lowest days past due for each risk level, checked from the top
+RISK_BANDS = [(91, 'critical'), (31, 'high'), (1, 'medium'), (0, 'low')]
+
+# Loans that are being repaid
+REPAYING_STATUSES = ['disbursed', 'active']
+
+
+def risk_level_for(days_past_due):
+    for threshold, level in RISK_BANDS:
+        if days_past_due >= threshold:
+            return level
+    return 'low'
+
+
+class DelinquencyService:
+    """
+    Nightly delinquency run over every loan being repaid.
+
+    Loans are walked in primary-key batches. For each batch one query loads
+    the scheduled installments due before today; payments are applied to
+    them oldest first (``amount_paid`` covers installments in due-date
+    order), which gives the arrears and the days past due of the oldest
+    unpaid installment. Installments that are covered in full but still
+    pending (paid through manual payments or auto-deductions) are marked
+    completed. Only loans whose values changed are written, with one
+    bulk_update per batch (and one portfolio summary update per group they
+    move between), so the run is linear in active loans.
+    """
+    
+    FIELDS = ['days_past_due', 'arrears_amount', 'risk_level']
+    
+    def __init__(self, batch_size=2000, today=None):
+        self.batch_size = batch_size
+        self.today = today or timezone.localdate()
+    
+    def evaluate(self, amount_paid, installments):
+        """
+        ``(days_past_due, arrears, covered)`` for installments
+        ``[(due_date, amount)]`` in due order; the first ``covered`` of them
+        are paid in full
+        """
+        remaining = amount_paid
+        oldest_unpaid = None
+        arrears = Decimal('0')
+        covered_count = 0
+        for due_date, amount in installments:
+            covered = min(remaining, amount)
+            remaining -= covered
+            if covered < amount:
+                arrears += amount - covered
+                if oldest_unpaid is None:
+                    oldest_unpaid = due_date
+            elif oldest_unpaid is None:
+                covered_count += 1
+        days_past_due = (self.today - oldest_unpaid).days if oldest_unpaid else 0
+        return days_past_due, arrears, covered_count
+    
+    def run_batch(self, loans):
+        due = {}
+        installments = {}
+        rows = LoanRepayment.objects.filter(
+            loan_id__in=[loan.pk for loan in loans],
+            repayment_type='scheduled',
+            due_date__lt=self.today,
+        ).order_by('loan_id', 'due_date').values_list(
+            'loan_id', 'id', 'status', 'due_date', 'scheduled_amount'
+        )
+        for loan_id, pk, status, due_date, amount in rows:
+            due.setdefault(loan_id, []).append((due_date, amount))
+            installments.setdefault(loan_id, []).append((pk, status))
+        
+        changed = []
+        changes = []
+        settled = []
+        for loan in loans:
+            days_past_due, arrears, covered = self.evaluate(loan.amount_paid, due.get(loan.pk, []))
+            settled.extend(
+                pk for pk, status in installments.get(loan.pk, [])[:covered] if status == 'pending'
+            )
+            if loan.outstanding_balance <= 0:
+                days_past_due, arrears = 0, Decimal('0')
+            values = (days_past_due, arrears, risk_level_for(days_past_due))
+            if values != (loan.days_past_due, loan.arrears_amount, loan.risk_level):
+                loan.days_past_due, loan.arrears_amount, loan.risk_level = values
+                snapshot = loan.portfolio_snapshot()
+                changes.append((loan._portfolio_snapshot, snapshot))
+                loan._portfolio_snapshot = snapshot
+                changed.append(loan)
+        
+        if changed or settled:
+            with transaction.atomic():
+                if settled:
+                    LoanRepayment.objects.filter(pk__in=settled).update(status='completed')
+                if changed:
+                    Loan.objects.bulk_update(changed, self.FIELDS, batch_size=self.batch_size)
+                    PortfolioService.apply_changes(changes)
+        return len(changed)
+    
+    def run(self):
+        queryset = Loan.objects.filter(status__in=REPAYING_STATUSES).order_by('pk')
+        checked = updated = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            loans = list(batch[:self.batch_size])
+            if not loans:
+                break
+            updated += self.run_batch(loans)
+            checked += len(loans)
+            last_pk = loans[-1].pk
+        return {'checked': checked, 'updated': updated}
+
+
+SUMMARY_AMOUNTS = ['loan_count', 'principal_amount', 'outstanding_balance', 'amount_paid', 'arrears_amount']
+SUMMARY_KEY = ['loan_product_id', 'status', 'risk_level', 'dpd_bucket']
+
+# Loans that count as disbursed / still owing in portfolio totals
+DISBURSED_STATUSES = ['disbursed', 'active', 'completed', 'defaulted', 'written_off']
+OUTSTANDING_STATUSES = ['disbursed', 'active', 'defaulted']
+# The narrower definitions dashboard_stats has always used, for lenders
+# and borrowers alike
+DASHBOARD_DISBURSED_STATUSES = ['disbursed', 'active', 'completed']
+DASHBOARD_OUTSTANDING_STATUSES = ['disbursed', 'active']
+
+DPD_BUCKET_CASE = Case(
+    When(days_past_due__gt=90, then=Value('over_90')),
+    When(days_past_due__gt=30, then=Value('31_90')),
+    When(days_past_due__gt=0, then=Value('1_30')),
+    default=Value('current'),
+)
+
+SERIES_INTERVALS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+class PortfolioService:
+    """
+    Lender portfolio analytics, read from the incrementally maintained
+    LoanPortfolioSummary and LoanPortfolioDaily tables
+    """
+    
+    @classmethod
+    def apply_change(cls, before, after):
+        """Move one loan's snapshot between summary groups"""
+        cls.apply_changes([(before, after)])
+    
+    @classmethod
+    def apply_changes(cls, changes):
+        """Apply many ``(before, after)`` loan snapshots, one UPDATE per group touched"""
+        deltas = defaultdict(lambda: defaultdict(int))
+        for before, after in changes:
+            for snapshot, sign in ((before, -1), (after, 1)):
+                if snapshot:
+                    for field in SUMMARY_AMOUNTS:
+                        deltas[snapshot['key']][field] += sign * snapshot[field]
+        
+        deltas = {
+            key: {field: value for field, value in delta.items() if value}
+            for key, delta in deltas.items()
+        }
+        groups = [dict(zip(SUMMARY_KEY, key)) for key, delta in deltas.items() if delta]
+        if not groups:
+            return
+        LoanPortfolioSummary.objects.bulk_create(
+            [LoanPortfolioSummary(**group) for group in groups], ignore_conflicts=True
+        )
+        now = timezone.now()
+        for group in groups:
+            delta = deltas[tuple(group[field] for field in SUMMARY_KEY)]
+            LoanPortfolioSummary.objects.filter(**group).update(
+                updated_at=now, **{field: F(field) + value for field, value in delta.items()}
+            )
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute the summary from the loans table in one grouped query"""
+        rows = Loan.objects.order_by().annotate(dpd_bucket=DPD_BUCKET_CASE).values(
+            'loan_product_id', 'status', 'risk_level', 'dpd_bucket'
+        ).annotate(
+            loan_count=Count('id'),
+            principal_amount=Sum('principal_amount'),
+            outstanding_balance=Sum('outstanding_balance'),
+            amount_paid=Sum('amount_paid'),
+            arrears_amount=Sum('arrears_amount'),
+        )
+        with transaction.atomic():
+            LoanPortfolioSummary.objects.all().delete()
+            LoanPortfolioSummary.objects.bulk_create(
+                [LoanPortfolioSummary(**row) for row in rows], batch_size=500
+            )
+    
+    @classmethod
+    def add_to_day(cls, day, product_id, **increments):
+        LoanPortfolioDaily.objects.bulk_create(
+            [LoanPortfolioDaily(date=day, loan_product_id=product_id)], ignore_conflicts=True
+        )
+        LoanPortfolioDaily.objects.filter(date=day, loan_product_id=product_id).update(
+            **{field: F(field) + value for field, value in increments.items()}
+        )
+    
+    @classmethod
+    def record_disbursement(cls, loan):
+        cls.add_to_day(
+            timezone.localdate(loan.disbursed_date), loan.loan_product_id,
+            disbursed_count=1, disbursed_amount=loan.principal_amount,
+        )
+    
+    @classmethod
+    def record_collection(cls, repayment):
+        cls.add_to_day(
+            timezone.localdate(repayment.payment_date), repayment.loan.loan_product_id,
+            repayment_count=1, collected_amount=repayment.paid_amount,
+        )
+    
+    @staticmethod
+    def group_totals(rows, field):
+        totals = defaultdict(lambda: dict.fromkeys(SUMMARY_AMOUNTS, 0))
+        for row in rows:
+            for amount in SUMMARY_AMOUNTS:
+                totals[row[field]][amount] += row[amount]
+        return dict(totals)
+    
+    @classmethod
+    def portfolio(cls):
+        """Totals by status, product and risk level with PAR30 / PAR90"""
+        rows = list(LoanPortfolioSummary.objects.filter(loan_count__gt=0).values(
+            'loan_product_id', 'loan_product__name', 'status', 'risk_level', 'dpd_bucket',
+            *SUMMARY_AMOUNTS
+        ))
+        owing = [row for row in rows if row['status'] in OUTSTANDING_STATUSES]
+        outstanding = sum(row['outstanding_balance'] for row in owing)
+        par30 = sum(row['outstanding_balance'] for row in owing if row['dpd_bucket'] in ('31_90', 'over_90'))
+        par90 = sum(row['outstanding_balance'] for row in owing if row['dpd_bucket'] == 'over_90')
+        
+        by_product = cls.group_totals(rows, 'loan_product_id')
+        names = {row['loan_product_id']: row['loan_product__name'] for row in rows}
+        return {
+            'total_loans': sum(row['loan_count'] for row in rows),
+            'total_disbursed': sum(
+                row['principal_amount'] for row in rows if row['status'] in DISBURSED_STATUSES
+            ),
+            'total_outstanding': outstanding,
+            'total_repaid': sum(row['amount_paid'] for row in rows),
+            'total_arrears': sum(row['arrears_amount'] for row in owing),
+            'by_status': cls.group_totals(rows, 'status'),
+            'by_product': [
+                {'loan_product': product_id, 'name': names[product_id], **totals}
+                for product_id, totals in by_product.items()
+            ],
+            'by_risk_level': cls.group_totals(owing, 'risk_level'),
+            'by_days_past_due': cls.group_totals(owing, 'dpd_bucket'),
+            'par30': {
+                'balance': par30,
+                'ratio': round(par30 / outstanding * 100, 2) if outstanding else 0,
+            },
+            'par90': {
+                'balance': par90,
+                'ratio': round(par90 / outstanding * 100, 2) if outstanding else 0,
+            },
+        }
+    
+    @classmethod
+    def dashboard(cls):
+        """Totals for the lender dashboard, defined as in ``borrower_summary``"""
+        rows = list(LoanPortfolioSummary.objects.filter(loan_count__gt=0).values(
+            'status', 'dpd_bucket', *SUMMARY_AMOUNTS
+        ))
+        
+        def total(field, statuses):
+            return sum(row[field] for row in rows if row['status'] in statuses)
+        
+        return {
+            'total_loans': sum(row['loan_count'] for row in rows),
+            'active_loans': total('loan_count', ['active']),
+            'overdue_loans': sum(
+                row['loan_count'] for row in rows
+                if row['dpd_bucket'] != 'current' and row['outstanding_balance'] > 0
+            ),
+            'total_disbursed': total('principal_amount', DASHBOARD_DISBURSED_STATUSES),
+            'total_outstanding': total('outstanding_balance', DASHBOARD_OUTSTANDING_STATUSES),
+            'total_repaid': total('amount_paid', DASHBOARD_DISBURSED_STATUSES),
+            'recent_applications': total('loan_count', ['applied']),
+        }
+    
+    @classmethod
+    def time_series(cls, start, end, interval='day'):
+        """Disbursements and collections per ``interval`` between two dates"""
+        trunc = SERIES_INTERVALS[interval]
+        return list(
+            LoanPortfolioDaily.objects.filter(date__gte=start, date__lte=end)
+            .annotate(period=trunc('date'))
+            .values('period')
+            .annotate(
+                disbursed_count=Sum('disbursed_count'),
+                disbursed_amount=Sum('disbursed_amount'),
+                repayment_count=Sum('repayment_count'),
+                collected_amount=Sum('collected_amount'),
+            )
+            .order_by('period')
+        )
+
+
+def borrower_summary(user_id):
+    """A borrower's loan totals, in one aggregate query"""
+    disbursed = Q(status__in=DASHBOARD_DISBURSED_STATUSES)
+    return Loan.objects.filter(borrower_id=user_id).aggregate(
+        total_loans=Count('id'),
+        active_loans=Count('id', filter=Q(status='active')),
+        overdue_loans=Count('id', filter=Q(days_past_due__gt=0, outstanding_balance__gt=0)),
+        total_disbursed=Coalesce(Sum('principal_amount', filter=disbursed), Decimal('0')),
+        total_outstanding=Coalesce(
+            Sum('outstanding_balance', filter=Q(status__in=DASHBOARD_OUTSTANDING_STATUSES)), Decimal('0')
+        ),
+        total_repaid=Coalesce(Sum('amount_paid', filter=disbursed), Decimal('0')),
+        recent_applications=Count('id', filter=Q(status='applied')),
+    )
+
+
+class AutoDeductionService:
+    """
+    Loan repayments deducted from POS sales.
+
+    A sale only records its share in ``Transaction.loan_deduction_amount``
+    as part of the row it already inserts: the loan row is neither read
+    nor locked, so a merchant's terminals never wait on each other. The
+    merchant's deduction terms are cached. Once an hour ``settle_all``
+    sums each merchant's unsettled deductions into one LoanRepayment,
+    locking only the loan being repaid.
+    """
+    
+    CACHE_TIMEOUT = 60 * 60
+    
+    @staticmethod
+    def _cache_key(user_id):
+        return f'loan_auto_deduction:{user_id}'
+    
+    @staticmethod
+    def deduction_loans(user_id):
+        """Loans of a borrower that take auto-deductions, oldest first"""
+        return Loan.objects.filter(
+            borrower_id=user_id,
+            status__in=REPAYING_STATUSES,
+            enable_auto_deduction=True,
+            outstanding_balance__gt=0,
+        ).order_by('disbursed_date', 'id')
+    
+    @classmethod
+    def terms(cls, user_id):
+        """``{'loan_id', 'percentage'}`` of the loan sales repay, or ``{}``"""
+        key = cls._cache_key(user_id)
+        terms = cache.get(key)
+        if terms is None:
+            loan = cls.deduction_loans(user_id).values('id', 'auto_deduction_percentage').first()
+            terms = {'loan_id': loan['id'], 'percentage': loan['auto_deduction_percentage']} if loan else {}
+            cache.set(key, terms, cls.CACHE_TIMEOUT)
+        return terms
+    
+    @classmethod
+    def invalidate(cls, user_id):
+        cache.delete(cls._cache_key(user_id))
+    
+    @classmethod
+    def deduction_for(cls, user_id, amount):
+        """Share of a sale of ``amount`` that goes to the borrower's loan"""
+        terms = cls.terms(user_id)
+        if not terms or amount <= 0:
+            return Decimal('0.00')
+        return (amount * terms['percentage'] / 100).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    
+    @staticmethod
+    def pending(before):
+        from apps.transactions.models import Transaction
+        return Transaction.objects.filter(
+            loan_deduction_amount__gt=0,
+            loan_repayment__isnull=True,
+            transaction_date__lt=before,
+        )
+    
+    @classmethod
+    def settle(cls, user_id, before):
+        """
+        Turn one merchant's deductions made before ``before`` into a single
+        repayment. Deductions are dropped if no loan takes them any more.
+        """
+        with transaction.atomic():
+            loan = cls.deduction_loans(user_id).select_for_update().first()
+            pending = cls.pending(before).filter(user_id=user_id)
+            rows = list(pending.values_list('id', 'loan_deduction_amount'))
+            if not rows:
+                return None
+            if loan is None:
+                pending.filter(id__in=[pk for pk, _ in rows]).update(loan_deduction_amount=0)
+                return None
+            
+            deducted = sum(amount for _, amount in rows)
+            amount = min(deducted, loan.outstanding_balance)
+            now = timezone.now()
+            repayment = LoanRepayment.objects.create(
+                loan=loan,
+                repayment_type='auto_deduction',
+                scheduled_amount=amount,
+                paid_amount=amount,
+                payment_method='auto_deduction',
+                due_date=timezone.localdate(now),
+                payment_date=now,
+                status='completed',
+                notes=f'Auto-deduction from {len(rows)} sales'
+                      + (f' (₦{deducted} deducted, capped at the balance)' if amount < deducted else ''),
+            )
+            pending.filter(id__in=[pk for pk, _ in rows]).update(loan_repayment=repayment)
+            
+            loan.amount_paid += amount
+            loan.outstanding_balance -= amount
+            if loan.outstanding_balance <= 0:
+                loan.status = 'completed'
+            loan.save()
+        return repayment
+    
+    @classmethod
+    def settle_all(cls, before=None):
+        """Settle every merchant with deductions from before the current hour"""
+        before = before or timezone.now().replace(minute=0, second=0, microsecond=0)
+        user_ids = cls.pending(before).order_by().values_list('user_id', flat=True).distinct()
+        settled = 0
+        for user_id in list(user_ids):
+            if cls.settle(user_id, before):
+                settled += 1
+        return settled
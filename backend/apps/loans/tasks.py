@@ -0,0 +1,36 @@
+# backend/apps/loans/tasks.py
+"""
+Background tasks for loans
+"""
+
+from celery import shared_task
+
+from .models import LoanProduct
+from .services import AmortizationService, AutoDeductionService, DelinquencyService, PortfolioService
+
+
+@shared_task
+def reprice_product_loans(product_id):
+    """Recompute the terms of a product's undisbursed loans after a rate change"""
+    product = LoanProduct.objects.filter(id=product_id).first()
+    if product is None:
+        return 0
+    return AmortizationService.reprice_product(product)
+
+
+@shared_task
+def update_delinquency():
+    """Recompute days past due, arrears and risk level (run nightly by beat)"""
+    return DelinquencyService().run()
+
+
+@shared_task
+def rebuild_loan_portfolio():
+    """Recompute the portfolio summary from the loans table (run nightly by beat)"""
+    PortfolioService.rebuild()
+
+
+@shared_task
+def settle_loan_deductions():
+    """Turn the last hours' sale deductions into one repayment per merchant (run hourly by beat)"""
+    return AutoDeductionService.settle_all()
@@ -1,3 +1,568 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Product, ProductCategory
+from apps.transactions.models import Transaction, TransactionCategory
+from apps.users.models import User
+from .models import Loan, LoanPortfolioSummary, LoanProduct, LoanRepayment
+from .services import AmortizationService, AutoDeductionService, DelinquencyService, PortfolioService
+from .tasks import reprice_product_loans
+from .views import LoanRepaymentViewSet, LoanViewSet
+
+
+class LoanQueryCountTests(TestCase):
+    """List endpoints must not issue a query per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = User.objects.create_user(
+            email='borrower@example.com', username='borrower', password='pass',
+            phone_number='08030000003', first_name='Chidi', last_name='Eze'
+        )
+        cls.lender = User.objects.create_user(
+            email='lender@example.com', username='lender', password='pass',
+            phone_number='08030000004', first_name='Dayo', last_name='Lawal',
+            user_type='lender'
+        )
+        cls.loan_product = LoanProduct.objects.create(
+            name='Market Women Loan', description='Short term working capital',
+            min_amount=Decimal('10000'), max_amount=Decimal('500000'),
+            interest_rate=Decimal('5.00'), interest_type='flat',
+            processing_fee_rate=Decimal('1.00'), min_tenure_days=30, max_tenure_days=180,
+            min_monthly_revenue=Decimal('0')
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.borrower)
+
+    def create_loans(self, count):
+        for _ in range(count):
+            loan = Loan.objects.create(
+                borrower=self.borrower, loan_product=self.loan_product,
+                principal_amount=Decimal('50000'), interest_rate=Decimal('5.00'),
+                tenure_days=90, monthly_installment=Decimal('17500'),
+                status='active', purpose='Restock',
+                first_repayment_date=timezone.now().date()
+            )
+            LoanRepayment.objects.create(
+                loan=loan, repayment_type='manual', scheduled_amount=Decimal('5000'),
+                paid_amount=Decimal('5000'), due_date=timezone.now().date(),
+                payment_date=timezone.now() - timedelta(days=1), status='completed'
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.create_loans(2)
+        small = self.count_queries(url)
+        self.create_loans(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_loan_list(self):
+        self.assertConstantQueries('/api/loans/loans/')
+
+    def test_loan_list_as_lender(self):
+        self.client.force_authenticate(self.lender)
+        self.assertConstantQueries('/api/loans/loans/')
+
+    def test_active_action(self):
+        self.assertConstantQueries('/api/loans/loans/active/')
+
+    def test_repayment_list(self):
+        self.assertConstantQueries('/api/loans/repayments/')
+
+    def test_next_payment_date_uses_latest_repayment(self):
+        self.create_loans(1)
+        response = self.client.get('/api/loans/loans/')
+        expected = (timezone.now() - timedelta(days=1)).date() + timedelta(weeks=1)
+        self.assertEqual(response.data['results'][0]['next_payment_date'], expected)
+
+
+class AmortizationTests(TestCase):
+    """Terms and full schedules come from the vectorized engine"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = User.objects.create_user(
+            email='borrower@example.com', username='borrower', password='pass',
+            phone_number='08030000003', first_name='Chidi', last_name='Eze'
+        )
+        cls.lender = User.objects.create_user(
+            email='lender@example.com', username='lender', password='pass',
+            phone_number='08030000004', first_name='Dayo', last_name='Lawal',
+            user_type='lender'
+        )
+        cls.reducing = LoanProduct.objects.create(
+            name='Shop Expansion', description='Reducing balance',
+            min_amount=Decimal('10000'), max_amount=Decimal('500000'),
+            interest_rate=Decimal('24.00'), interest_type='reducing',
+            processing_fee_rate=Decimal('1.00'), repayment_frequency='monthly',
+            min_tenure_days=30, max_tenure_days=365
+        )
+        cls.flat = LoanProduct.objects.create(
+            name='Market Days', description='Flat rate',
+            min_amount=Decimal('10000'), max_amount=Decimal('500000'),
+            interest_rate=Decimal('24.00'), interest_type='flat',
+            repayment_frequency='weekly', min_tenure_days=30, max_tenure_days=180
+        )
+
+    def apply(self, product, **kwargs):
+        defaults = {
+            'borrower': self.borrower, 'loan_product': product,
+            'principal_amount': Decimal('100000'), 'interest_rate': product.interest_rate,
+            'tenure_days': 90, 'purpose': 'Restock',
+        }
+        defaults.update(kwargs)
+        return Loan.objects.create(**defaults)
+
+    def disburse(self, loan):
+        Loan.objects.filter(pk=loan.pk).update(status='approved')
+        client = APIClient()
+        client.force_authenticate(self.lender)
+        response = client.post(f'/api/loans/loans/{loan.id}/disburse/')
+        self.assertEqual(response.status_code, 200)
+        loan.refresh_from_db()
+        return loan
+
+    def assertScheduleMatches(self, loan, installments):
+        schedule = loan.repayments.filter(repayment_type='scheduled').order_by('due_date')
+        self.assertEqual(schedule.count(), installments)
+        self.assertEqual(sum(r.principal_amount for r in schedule), loan.principal_amount)
+        self.assertEqual(sum(r.interest_amount for r in schedule), loan.total_interest)
+        self.assertEqual(sum(r.scheduled_amount for r in schedule), loan.total_amount)
+        self.assertEqual(schedule.first().due_date, loan.first_repayment_date)
+        self.assertEqual(schedule.last().due_date, loan.final_repayment_date)
+        return list(schedule)
+
+    def test_reducing_balance_schedule(self):
+        loan = self.apply(self.reducing, tenure_days=360)
+        self.assertEqual(loan.monthly_installment, Decimal('9440.06'))
+        self.assertEqual(loan.total_amount, loan.principal_amount + loan.total_interest + Decimal('1000.00'))
+
+        schedule = self.assertScheduleMatches(self.disburse(loan), 12)
+        # Interest falls and principal rises as the balance is paid down
+        self.assertGreater(schedule[0].interest_amount, schedule[-1].interest_amount)
+        self.assertLess(schedule[0].principal_amount, schedule[-1].principal_amount)
+        self.assertEqual(schedule[1].due_date - schedule[0].due_date, timedelta(days=30))
+
+    def test_flat_weekly_schedule(self):
+        loan = self.apply(self.flat, principal_amount=Decimal('50000'), tenure_days=91)
+        self.assertEqual(loan.total_interest, Decimal('2991.78'))
+        schedule = self.assertScheduleMatches(self.disburse(loan), 13)
+        self.assertEqual(len({r.interest_amount for r in schedule[:-1]}), 1)
+
+    def test_terms_only_recomputed_when_inputs_change(self):
+        loan = self.apply(self.reducing)
+        Loan.objects.filter(pk=loan.pk).update(total_interest=Decimal('1.00'))
+        loan = Loan.objects.get(pk=loan.pk)
+        loan.purpose = 'Buy a freezer'
+        loan.save()
+        loan.refresh_from_db()
+        self.assertEqual(loan.total_interest, Decimal('1.00'))
+
+    def test_changed_terms_rebuild_pending_installments(self):
+        loan = self.disburse(self.apply(self.reducing))
+        before = list(loan.repayments.filter(repayment_type='scheduled').order_by('due_date'))
+        LoanRepayment.objects.filter(pk=before[0].pk).update(status='completed')
+
+        loan = Loan.objects.get(pk=loan.pk)
+        loan.interest_rate = Decimal('12.00')
+        loan.save()
+
+        schedule = list(loan.repayments.filter(repayment_type='scheduled').order_by('due_date'))
+        self.assertEqual(len(schedule), 3)
+        self.assertEqual(schedule[0].pk, before[0].pk)
+        self.assertLess(schedule[1].interest_amount, before[1].interest_amount)
+        self.assertEqual(loan.final_repayment_date, schedule[-1].due_date)
+        self.assertEqual(loan.outstanding_balance, loan.total_amount - loan.amount_paid)
+
+    def test_reprice_product_in_batches(self):
+        pending = [self.apply(self.flat) for _ in range(5)]
+        disbursed = self.disburse(self.apply(self.flat))
+        # disburse() moved the loan to approved with update()
+        PortfolioService.rebuild()
+
+        self.flat.interest_rate = Decimal('12.00')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.flat.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(reprice_product_loans(str(self.flat.id)), 5)
+
+        for loan in pending:
+            loan.refresh_from_db()
+            self.assertEqual(loan.interest_rate, Decimal('12.00'))
+            self.assertEqual(loan.total_interest, Decimal('2958.90'))
+            self.assertEqual(loan.outstanding_balance, loan.total_amount)
+        disbursed_interest = disbursed.total_interest
+        disbursed.refresh_from_db()
+        self.assertEqual(disbursed.total_interest, disbursed_interest)
+
+        # The portfolio summary moved with the repriced loans
+        summary = list(LoanPortfolioSummary.objects.filter(loan_count__gt=0).values_list(
+            'status', 'loan_count', 'principal_amount', 'outstanding_balance'
+        ).order_by('status'))
+        PortfolioService.rebuild()
+        self.assertEqual(summary, list(LoanPortfolioSummary.objects.filter(loan_count__gt=0).values_list(
+            'status', 'loan_count', 'principal_amount', 'outstanding_balance'
+        ).order_by('status')))
+
+        # One select, then in a savepoint one bulk update per batch (the
+        # summary is untouched: nothing changed)
+        with self.assertNumQueries(4 * 3 + 1):
+            AmortizationService.reprice_product(self.flat, batch_size=2)
+
+
+class DelinquencyTests(TestCase):
+    """The nightly run derives days past due, arrears and risk from the schedule"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = User.objects.create_user(
+            email='borrower@example.com', username='borrower', password='pass',
+            phone_number='08030000003', first_name='Chidi', last_name='Eze'
+        )
+        cls.product = LoanProduct.objects.create(
+            name='Market Days', description='Flat rate',
+            min_amount=Decimal('10000'), max_amount=Decimal('500000'),
+            interest_rate=Decimal('0.00'), interest_type='flat',
+            repayment_frequency='weekly', min_tenure_days=30, max_tenure_days=180
+        )
+
+    def disbursed_loan(self, weeks_ago, amount_paid=Decimal('0')):
+        loan = Loan.objects.create(
+            borrower=self.borrower, loan_product=self.product,
+            principal_amount=Decimal('10000'), interest_rate=Decimal('0.00'),
+            tenure_days=70, purpose='Restock', status='active',
+            disbursed_date=timezone.now() - timedelta(weeks=weeks_ago),
+        )
+        AmortizationService.create_schedule(loan)
+        if amount_paid:
+            Loan.objects.filter(pk=loan.pk).update(
+                amount_paid=amount_paid, outstanding_balance=loan.total_amount - amount_paid
+            )
+        return loan
+
+    def test_days_past_due_and_risk(self):
+        current = self.disbursed_loan(weeks_ago=0)
+        late = self.disbursed_loan(weeks_ago=3)
+        partly_paid = self.disbursed_loan(weeks_ago=3, amount_paid=Decimal('1500'))
+        very_late = self.disbursed_loan(weeks_ago=15)
+
+        result = DelinquencyService().run()
+        self.assertEqual(result, {'checked': 4, 'updated': 3})
+
+        expected = {
+            current: (0, Decimal('0.00'), 'low'),
+            late: (14, Decimal('2000.00'), 'medium'),
+            partly_paid: (7, Decimal('500.00'), 'medium'),
+            very_late: (98, Decimal('10000.00'), 'critical'),
+        }
+        for loan, values in expected.items():
+            loan.refresh_from_db()
+            self.assertEqual((loan.days_past_due, loan.arrears_amount, loan.risk_level), values)
+            self.assertEqual(loan.is_overdue, values[0] > 0)
+
+        # Nothing changed, nothing written
+        self.assertEqual(DelinquencyService().run()['updated'], 0)
+
+    def test_covered_installments_are_no_longer_overdue(self):
+        partly_paid = self.disbursed_loan(weeks_ago=3, amount_paid=Decimal('1500'))
+        paid_up = self.disbursed_loan(weeks_ago=3, amount_paid=Decimal('2000'))
+        client = APIClient()
+        client.force_authenticate(self.borrower)
+        self.assertEqual(client.get('/api/loans/repayments/overdue/').data['count'], 4)
+
+        DelinquencyService().run()
+        response = client.get('/api/loans/repayments/overdue/')
+        self.assertEqual(
+            [(row['loan'], row['scheduled_amount']) for row in response.data['results']],
+            [(partly_paid.id, '1000.00')]
+        )
+        settled = LoanRepayment.objects.filter(repayment_type='scheduled', status='completed')
+        self.assertEqual(settled.filter(loan=paid_up).count(), 2)
+        self.assertEqual(settled.filter(loan=partly_paid).count(), 1)
+        # Settling does not count as a collection
+        self.assertEqual(set(settled.values_list('paid_amount', flat=True)), {Decimal('0.00')})
+
+    def test_queries_per_batch(self):
+        for _ in range(5):
+            self.disbursed_loan(weeks_ago=3)
+        # Per batch of 2: loans, due installments and one bulk update, then
+        # in a savepoint one summary insert and an UPDATE for each of the
+        # two groups touched; then the final empty batch
+        with self.assertNumQueries(3 * (3 + 2 + 3) + 1):
+            DelinquencyService(batch_size=2).run()
+
+
+class PortfolioTests(TestCase):
+    """Portfolio analytics are read from summary rows kept up to date on writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = User.objects.create_user(
+            email='borrower@example.com', username='borrower', password='pass',
+            phone_number='08030000003', first_name='Chidi', last_name='Eze'
+        )
+        cls.lender = User.objects.create_user(
+            email='lender@example.com', username='lender', password='pass',
+            phone_number='08030000004', first_name='Dayo', last_name='Lawal',
+            user_type='lender'
+        )
+        cls.product = LoanProduct.objects.create(
+            name='Market Days', description='Flat rate',
+            min_amount=Decimal('10000'), max_amount=Decimal('500000'),
+            interest_rate=Decimal('0.00'), interest_type='flat',
+            repayment_frequency='weekly', min_tenure_days=30, max_tenure_days=180
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.lender)
+
+    def create_loan(self, status='approved', **extra):
+        return Loan.objects.create(
+            borrower=self.borrower, loan_product=self.product,
+            principal_amount=Decimal('10000'), interest_rate=Decimal('0.00'),
+            tenure_days=70, purpose='Restock', status=status, **extra
+        )
+
+    def summary(self):
+        return sorted(LoanPortfolioSummary.objects.filter(loan_count__gt=0).values_list(
+            'status', 'risk_level', 'dpd_bucket', 'loan_count',
+            'principal_amount', 'outstanding_balance', 'amount_paid', 'arrears_amount'
+        ))
+
+    def test_summary_matches_rebuild(self):
+        self.create_loan(status='applied')
+        loan = self.create_loan()
+        response = self.client.post(f'/api/loans/loans/{loan.pk}/disburse/')
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_authenticate(self.borrower)
+        response = self.client.post(
+            f'/api/loans/loans/{loan.pk}/make_payment/', {'payment_amount': '1000'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        late = self.create_loan(status='active', disbursed_date=timezone.now() - timedelta(weeks=6))
+        AmortizationService.create_schedule(late)
+        DelinquencyService().run()
+
+        incremental = self.summary()
+        PortfolioService.rebuild()
+        self.assertEqual(incremental, self.summary())
+
+    def test_par_and_time_series(self):
+        loan = self.create_loan()
+        self.client.post(f'/api/loans/loans/{loan.pk}/disburse/')
+        self.client.force_authenticate(self.borrower)
+        self.client.post(f'/api/loans/loans/{loan.pk}/make_payment/', {'payment_amount': '1000'})
+        for weeks_ago in (6, 15):
+            late = self.create_loan(status='active', disbursed_date=timezone.now() - timedelta(weeks=weeks_ago))
+            AmortizationService.create_schedule(late)
+        DelinquencyService().run()
+
+        self.client.force_authenticate(self.lender)
+        response = self.client.get('/api/loans/loans/portfolio/')
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['total_loans'], 3)
+        self.assertEqual(data['total_outstanding'], Decimal('29000.00'))
+        # 35 and 98 days past due
+        self.assertEqual(data['par30']['balance'], Decimal('20000.00'))
+        self.assertEqual(data['par90']['balance'], Decimal('10000.00'))
+        self.assertEqual(data['par30']['ratio'], Decimal('68.97'))
+
+        today = timezone.localdate()
+        point = next(row for row in data['time_series'] if row['period'] == today)
+        self.assertEqual(point['disbursed_count'], 1)
+        self.assertEqual(point['disbursed_amount'], Decimal('10000.00'))
+        self.assertEqual(point['repayment_count'], 1)
+        self.assertEqual(point['collected_amount'], Decimal('1000.00'))
+
+    def test_lender_dashboard_matches_borrower_definitions(self):
+        self.create_loan(status='applied')
+        self.create_loan(status='active', outstanding_balance=Decimal('8000'), amount_paid=Decimal('2000'))
+        self.create_loan(status='completed', amount_paid=Decimal('10000'))
+        self.create_loan(status='defaulted', outstanding_balance=Decimal('6000'), amount_paid=Decimal('4000'))
+        self.create_loan(status='written_off', outstanding_balance=Decimal('9000'), amount_paid=Decimal('1000'))
+
+        stats = self.client.get('/api/loans/loans/dashboard_stats/').data
+        self.assertEqual(stats['total_disbursed'], Decimal('20000.00'))
+        self.assertEqual(stats['total_outstanding'], Decimal('8000.00'))
+        self.assertEqual(stats['total_repaid'], Decimal('12000.00'))
+
+        self.client.force_authenticate(self.borrower)
+        self.assertEqual(self.client.get('/api/loans/loans/dashboard_stats/').data, stats)
+
+    def test_portfolio_restricted_to_lenders(self):
+        self.client.force_authenticate(self.borrower)
+        response = self.client.get('/api/loans/loans/portfolio/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_portfolio_queries_do_not_grow(self):
+        for _ in range(2):
+            self.create_loan(status='active')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/loans/loans/portfolio/?interval=week')
+        for _ in range(8):
+            self.create_loan(status='active')
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.client.get('/api/loans/loans/portfolio/?interval=week')
+        self.assertEqual(response.data['total_loans'], 10)
+
+
+class AutoDeductionTests(TestCase):
+    """Sales record their loan share; an hourly run turns it into one repayment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.merchant = User.objects.create_user(
+            email='merchant@example.com', username='merchant', password='pass',
+            phone_number='08030000005', first_name='Ngozi', last_name='Okafor'
+        )
+        cls.product = LoanProduct.objects.create(
+            name='Market Days', description='Flat rate',
+            min_amount=Decimal('10000'), max_amount=Decimal('500000'),
+            interest_rate=Decimal('0.00'), interest_type='flat',
+            repayment_frequency='weekly', min_tenure_days=30, max_tenure_days=180
+        )
+        cls.category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        cls.item = Product.objects.create(
+            user=cls.merchant, category=ProductCategory.objects.create(
+                name='Provisions', category_type='food_beverages'
+            ),
+            name='Indomie', cost_price=Decimal('150.00'), selling_price=Decimal('200.00'),
+            current_stock=Decimal('1000')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.merchant)
+        self.loan = Loan.objects.create(
+            borrower=self.merchant, loan_product=self.product,
+            principal_amount=Decimal('10000'), interest_rate=Decimal('0.00'),
+            tenure_days=70, purpose='Restock', status='active',
+            disbursed_date=timezone.now(), enable_auto_deduction=True,
+            auto_deduction_percentage=Decimal('10.00')
+        )
+
+    def sell(self, quantity=1):
+        response = self.client.post('/api/transactions/transactions/', {
+            'transaction_category': self.category.id,
+            'transaction_type': 'sale',
+            'payment_method': 'cash',
+            'items': [{'product_id': str(self.item.id), 'quantity': quantity}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Transaction.objects.latest('transaction_date')
+
+    def settle(self):
+        return AutoDeductionService.settle_all(before=timezone.now() + timedelta(minutes=1))
+
+    def test_sale_does_not_touch_the_loan(self):
+        self.sell()
+        with CaptureQueriesContext(connection) as context:
+            sale = self.sell()
+        self.assertEqual(sale.loan_deduction_amount, Decimal('20.00'))
+        tables = ('FROM "loans"', 'UPDATE "loans"', '"loan_repayments"')
+        self.assertFalse([q for q in context.captured_queries if any(t in q['sql'] for t in tables)])
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('0.00'))
+
+    def test_hourly_settlement_makes_one_repayment(self):
+        for quantity in (1, 2, 3):
+            self.sell(quantity)
+        self.assertEqual(self.settle(), 1)
+
+        repayment = LoanRepayment.objects.get(repayment_type='auto_deduction')
+        self.assertEqual(repayment.paid_amount, Decimal('120.00'))
+        self.assertEqual(repayment.deducted_transactions.count(), 3)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('120.00'))
+        self.assertEqual(self.loan.outstanding_balance, Decimal('9880.00'))
+
+        # Already settled
+        self.assertEqual(self.settle(), 0)
+
+    def test_settlement_caps_at_balance_and_completes_loan(self):
+        Loan.objects.filter(pk=self.loan.pk).update(outstanding_balance=Decimal('50.00'))
+        self.sell(5)
+        self.settle()
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, 'completed')
+        self.assertEqual(self.loan.outstanding_balance, Decimal('0.00'))
+
+        # A completed loan takes no more deductions
+        self.assertEqual(self.sell().loan_deduction_amount, Decimal('0.00'))
+
+    def test_disabling_deduction_refreshes_cached_terms(self):
+        self.sell()
+        self.loan.enable_auto_deduction = False
+        self.loan.save()
+        self.assertEqual(self.sell().loan_deduction_amount, Decimal('0.00'))
+
+        # Deductions left without a loan are dropped
+        self.assertEqual(self.settle(), 0)
+        self.assertFalse(Transaction.objects.filter(loan_deduction_amount__gt=0).exists())
+
+    def settle_after(self, viewset):
+        """Patch ``viewset.get_object`` to run a settlement once the view has read its object"""
+        get_object = viewset.get_object
+
+        def read_then_settle(view):
+            obj = get_object(view)
+            self.settle()
+            return obj
+        return mock.patch.object(viewset, 'get_object', read_then_settle)
+
+    def test_manual_payment_interleaved_with_settlement(self):
+        self.sell(5)
+        with self.settle_after(LoanViewSet):
+            response = self.client.post(
+                f'/api/loans/loans/{self.loan.id}/make_payment/', {'payment_amount': '500'}
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('600.00'))
+        self.assertEqual(self.loan.outstanding_balance, Decimal('9400.00'))
+        paid = LoanRepayment.objects.filter(loan=self.loan, status='completed').aggregate(
+            total=Sum('paid_amount')
+        )['total']
+        self.assertEqual(paid, self.loan.amount_paid)
+
+    def test_processed_installment_interleaved_with_settlement(self):
+        lender = User.objects.create_user(
+            email='lender@example.com', username='lender', password='pass',
+            phone_number='08030000006', first_name='Tunde', last_name='Ade', user_type='lender'
+        )
+        installment = LoanRepayment.objects.create(
+            loan=self.loan, repayment_type='scheduled', scheduled_amount=Decimal('1000'),
+            paid_amount=Decimal('0'), due_date=timezone.localdate(), payment_date=timezone.now(),
+            status='pending'
+        )
+        self.sell(5)
+        self.client.force_authenticate(lender)
+        with self.settle_after(LoanRepaymentViewSet):
+            response = self.client.post(f'/api/loans/repayments/{installment.id}/process_payment/')
+        self.assertEqual(response.status_code, 200, response.data)
 
-# Create your tests here.
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('1100.00'))
+        self.assertEqual(self.loan.outstanding_balance, Decimal('8900.00'))
@@ -6,29 +6,23 @@ Loan management API views for loan applications, approvals, and repayments
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q, Sum, Count, F
+from django.db.models import Q, Sum, Count, F, Max
 from django.utils import timezone
 from django.db import transaction as db_transaction
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from .models import LoanProduct, Loan, LoanRepayment
+from .services import SERIES_INTERVALS, AmortizationService, PortfolioService, borrower_summary, loan_terms
 from .serializers import (
     LoanProductSerializer,
     LoanSerializer,
     LoanRepaymentSerializer
 )
+from utils.pagination import PaginatedActionsMixin, StandardResultsSetPagination
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for loan views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class LoanProductViewSet(viewsets.ModelViewSet):
+class LoanProductViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing loan products
     """
@@ -70,8 +64,7 @@ class LoanProductViewSet(viewsets.ModelViewSet):
             # If no business profile, show basic products only
             available_products = available_products.filter(min_credit_score=0)
         
-        serializer = self.get_serializer(available_products, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(available_products)
     
     @action(detail=True, methods=['post'])
     def calculate_loan(self, request, pk=None):
@@ -86,28 +79,16 @@ class LoanProductViewSet(viewsets.ModelViewSet):
             )
         
         # Calculate loan terms
-        processing_fee = (principal_amount * loan_product.processing_fee_rate) / 100
-        
-        if loan_product.interest_type == 'flat':
-            total_interest = (principal_amount * loan_product.interest_rate * loan_product.min_tenure_days) / (365 * 100)
-        else:  # reducing balance
-            monthly_rate = loan_product.interest_rate / (12 * 100)
-            months = loan_product.min_tenure_days / 30
-            if monthly_rate > 0:
-                monthly_installment = (principal_amount * monthly_rate * ((1 + monthly_rate) ** months)) / (((1 + monthly_rate) ** months) - 1)
-                total_interest = (monthly_installment * months) - principal_amount
-            else:
-                monthly_installment = principal_amount / months
-                total_interest = 0
-        
-        total_amount = principal_amount + total_interest + processing_fee
+        terms = loan_terms(
+            principal_amount, loan_product.interest_rate, loan_product.min_tenure_days, loan_product
+        )
         
         calculation = {
             'principal_amount': principal_amount,
-            'processing_fee': processing_fee,
-            'total_interest': total_interest,
-            'total_amount': total_amount,
-            'monthly_installment': monthly_installment,
+            'processing_fee': terms['processing_fee'],
+            'total_interest': terms['total_interest'],
+            'total_amount': terms['total_amount'],
+            'monthly_installment': terms['monthly_installment'],
             'tenure_days': loan_product.min_tenure_days,
             'interest_rate': loan_product.interest_rate,
             'interest_type': loan_product.interest_type
@@ -116,7 +97,7 @@ class LoanProductViewSet(viewsets.ModelViewSet):
         return Response(calculation)
 
 
-class LoanViewSet(viewsets.ModelViewSet):
+class LoanViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing loan applications and loans
     """
@@ -127,11 +108,17 @@ class LoanViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter loans based on user type"""
+        queryset = Loan.objects.select_related('loan_product', 'borrower').annotate(
+            last_completed_payment_date=Max(
+                'repayments__payment_date', filter=Q(repayments__status='completed')
+            )
+        )
+        
         if self.request.user.user_type in ['admin', 'lender']:
-            return Loan.objects.all().order_by('-created_at')
+            return queryset.order_by('-created_at')
         else:
             # Borrowers can only see their own loans
-            return Loan.objects.filter(borrower=self.request.user).order_by('-created_at')
+            return queryset.filter(borrower=self.request.user).order_by('-created_at')
     
     def perform_create(self, serializer):
         """Set borrower when creating loan"""
@@ -141,22 +128,19 @@ class LoanViewSet(viewsets.ModelViewSet):
     def my_loans(self, request):
         """Get current user's loans"""
         loans = self.get_queryset().filter(borrower=request.user)
-        serializer = self.get_serializer(loans, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(loans)
     
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get active loans"""
         loans = self.get_queryset().filter(status='active')
-        serializer = self.get_serializer(loans, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(loans)
     
     @action(detail=False, methods=['get'])
     def overdue(self, request):
         """Get overdue loans"""
         loans = self.get_queryset().filter(days_past_due__gt=0, outstanding_balance__gt=0)
-        serializer = self.get_serializer(loans, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(loans)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -235,37 +219,27 @@ class LoanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        loan.status = 'disbursed'
-        loan.disbursed_date = timezone.now()
-        loan.first_repayment_date = timezone.now().date() + timedelta(days=loan.loan_product.min_tenure_days)
-        loan.final_repayment_date = timezone.now().date() + timedelta(days=loan.tenure_days)
-        loan.save()
-        
-        # Create first repayment schedule
-        self._create_repayment_schedule(loan)
+        with db_transaction.atomic():
+            loan.status = 'disbursed'
+            loan.disbursed_date = timezone.now()
+            loan.save()
+            
+            # Create the full repayment schedule
+            self._create_repayment_schedule(loan)
         
         serializer = self.get_serializer(loan)
         return Response(serializer.data)
     
     def _create_repayment_schedule(self, loan):
-        """Create repayment schedule for loan"""
-        # This is a simplified version - in production, you'd create multiple repayment records
-        LoanRepayment.objects.create(
-            loan=loan,
-            repayment_type='scheduled',
-            scheduled_amount=loan.monthly_installment,
-            due_date=loan.first_repayment_date,
-            payment_date=loan.first_repayment_date,
-            status='pending'
-        )
+        """Create every scheduled repayment and set the repayment dates"""
+        return AmortizationService.create_schedule(loan)
     
     @action(detail=True, methods=['get'])
     def repayments(self, request, pk=None):
         """Get loan repayments"""
         loan = self.get_object()
-        repayments = loan.repayments.all().order_by('-payment_date')
-        serializer = LoanRepaymentSerializer(repayments, many=True)
-        return Response(serializer.data)
+        repayments = loan.repayments.select_related('loan__borrower').order_by('-payment_date')
+        return self.paginated_response(repayments, LoanRepaymentSerializer)
     
     @action(detail=True, methods=['post'])
     def make_payment(self, request, pk=None):
@@ -295,14 +269,28 @@ class LoanViewSet(viewsets.ModelViewSet):
             )
         
         with db_transaction.atomic():
+            # Re-read under a row lock so a concurrent auto-deduction
+            # settlement cannot overwrite (or be overwritten by) this payment
+            loan = Loan.objects.select_for_update().get(pk=loan.pk)
+            if loan.status not in ['disbursed', 'active']:
+                return Response(
+                    {'error': 'Loan is not active'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if payment_amount > loan.outstanding_balance:
+                return Response(
+                    {'error': 'Payment amount exceeds outstanding balance'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
             # Create repayment record
             repayment = LoanRepayment.objects.create(
                 loan=loan,
                 repayment_type='manual',
                 scheduled_amount=loan.monthly_installment,
                 paid_amount=payment_amount,
-                principal_amount=payment_amount * 0.7,  # Simplified allocation
-                interest_amount=payment_amount * 0.3,
+                principal_amount=payment_amount * Decimal('0.7'),  # Simplified allocation
+                interest_amount=payment_amount * Decimal('0.3'),
                 payment_method=payment_method,
                 due_date=timezone.now().date(),
                 payment_date=timezone.now(),
@@ -327,24 +315,50 @@ class LoanViewSet(viewsets.ModelViewSet):
     def dashboard_stats(self, request):
         """Get loan dashboard statistics"""
         if request.user.user_type in ['admin', 'lender']:
-            loans = Loan.objects.all()
-        else:
-            loans = Loan.objects.filter(borrower=request.user)
-        
-        stats = {
-            'total_loans': loans.count(),
-            'active_loans': loans.filter(status='active').count(),
-            'overdue_loans': loans.filter(days_past_due__gt=0, outstanding_balance__gt=0).count(),
-            'total_disbursed': sum(l.principal_amount for l in loans.filter(status__in=['disbursed', 'active', 'completed'])),
-            'total_outstanding': sum(l.outstanding_balance for l in loans.filter(status__in=['disbursed', 'active'])),
-            'total_repaid': sum(l.amount_paid for l in loans.filter(status__in=['disbursed', 'active', 'completed'])),
-            'recent_applications': loans.filter(status='applied').count()
-        }
+            return Response(PortfolioService.dashboard())
+        
+        return Response(borrower_summary(request.user.id))
+    
+    @action(detail=False, methods=['get'])
+    def portfolio(self, request):
+        """
+        Lender portfolio analytics (admin/lender only): totals by status,
+        product and risk level, PAR30/PAR90 and a disbursement and
+        collection series (``interval`` day/week/month, ``start``/``end``
+        dates, default the last 90 days)
+        """
+        if request.user.user_type not in ['admin', 'lender']:
+            return Response(
+                {'error': 'Permission denied'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        interval = request.query_params.get('interval', 'day')
+        if interval not in SERIES_INTERVALS:
+            return Response(
+                {'error': f"interval must be one of: {', '.join(SERIES_INTERVALS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response(stats)
+        try:
+            end = date.fromisoformat(request.query_params['end'])
+        except KeyError:
+            end = timezone.localdate()
+        except ValueError:
+            return Response({'error': 'end must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = date.fromisoformat(request.query_params['start'])
+        except KeyError:
+            start = end - timedelta(days=90)
+        except ValueError:
+            return Response({'error': 'start must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = PortfolioService.portfolio()
+        data['time_series'] = PortfolioService.time_series(start, end, interval)
+        return Response(data)
 
 
-class LoanRepaymentViewSet(viewsets.ModelViewSet):
+class LoanRepaymentViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing loan repayments
     """
@@ -355,11 +369,13 @@ class LoanRepaymentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter repayments based on user type"""
+        queryset = LoanRepayment.objects.select_related('loan__borrower')
+        
         if self.request.user.user_type in ['admin', 'lender']:
-            return LoanRepayment.objects.all().order_by('-payment_date')
+            return queryset.order_by('-payment_date')
         else:
             # Borrowers can only see their own repayments
-            return LoanRepayment.objects.filter(
+            return queryset.filter(
                 loan__borrower=self.request.user
             ).order_by('-payment_date')
     
@@ -367,18 +383,19 @@ class LoanRepaymentViewSet(viewsets.ModelViewSet):
     def pending(self, request):
         """Get pending repayments"""
         repayments = self.get_queryset().filter(status='pending')
-        serializer = self.get_serializer(repayments, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(repayments)
     
     @action(detail=False, methods=['get'])
     def overdue(self, request):
-        """Get overdue repayments"""
+        """
+        Get overdue repayments. Installments covered by manual payments or
+        auto-deductions are marked completed by the nightly delinquency run.
+        """
         repayments = self.get_queryset().filter(
             status='pending',
             due_date__lt=timezone.now().date()
         )
-        serializer = self.get_serializer(repayments, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(repayments)
     
     @action(detail=True, methods=['post'])
     def process_payment(self, request, pk=None):
@@ -401,23 +418,33 @@ class LoanRepaymentViewSet(viewsets.ModelViewSet):
         payment_method = request.data.get('payment_method', 'cash')
         notes = request.data.get('notes', '')
         
-        repayment.paid_amount = paid_amount
-        repayment.payment_method = payment_method
-        repayment.payment_date = timezone.now()
-        repayment.status = 'completed'
-        repayment.notes = notes
-        repayment.processed_by = request.user
-        repayment.save()
-        
-        # Update loan balance
-        loan = repayment.loan
-        loan.amount_paid += paid_amount
-        loan.outstanding_balance -= paid_amount
-        
-        if loan.outstanding_balance <= 0:
-            loan.status = 'completed'
-        
-        loan.save()
+        with db_transaction.atomic():
+            # Lock the loan, then the repayment, so neither a concurrent
+            # settlement nor a second processing request can interleave
+            loan = Loan.objects.select_for_update().get(pk=repayment.loan_id)
+            repayment = LoanRepayment.objects.select_for_update().get(pk=repayment.pk)
+            if repayment.status != 'pending':
+                return Response(
+                    {'error': 'Only pending repayments can be processed'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            repayment.paid_amount = paid_amount
+            repayment.payment_method = payment_method
+            repayment.payment_date = timezone.now()
+            repayment.status = 'completed'
+            repayment.notes = notes
+            repayment.processed_by = request.user
+            repayment.save()
+            
+            # Update loan balance
+            loan.amount_paid += paid_amount
+            loan.outstanding_balance -= paid_amount
+            
+            if loan.outstanding_balance <= 0:
+                loan.status = 'completed'
+            
+            loan.save()
         
         serializer = self.get_serializer(repayment)
         return Response(serializer.data)
\ No newline at end of file
@@ -0,0 +1,128 @@
+# backend/apps/notifications/backends.py
+"""
+Channel backends for notification delivery
+
+Each backend sends a list of ChannelMessage objects in one call so that
+providers with bulk APIs (SMTP connections, bulk SMS) are used once per
+dispatch run instead of once per message. Configure them with the
+NOTIFICATION_CHANNEL_BACKENDS setting.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core import mail
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelMessage:
+    """
+    One outgoing message: a single notification or a digest of several
+    """
+    
+    def __init__(self, channel, user, subject, body, delivery_ids):
+        self.channel = channel
+        self.user = user
+        self.subject = subject
+        self.body = body
+        self.delivery_ids = delivery_ids
+    
+    @property
+    def recipient(self):
+        if self.channel == 'email':
+            return self.user.email
+        if self.channel == 'sms':
+            return self.user.phone_number
+        return str(self.user.id)
+    
+    def __repr__(self):
+        return f"<ChannelMessage {self.channel} to {self.recipient}: {self.subject}>"
+
+
+class BaseChannelBackend:
+    """
+    Send messages for one channel. ``send_messages`` returns the messages
+    that were accepted; anything else is retried on the next run.
+    """
+    
+    def __init__(self, channel):
+        self.channel = channel
+    
+    def send_messages(self, messages):
+        raise NotImplementedError
+
+
+class ConsoleBackend(BaseChannelBackend):
+    """Log messages instead of sending them (development default)"""
+    
+    def send_messages(self, messages):
+        for message in messages:
+            logger.info("%s -> %s: %s", self.channel, message.recipient, message.subject)
+        return list(messages)
+
+
+class LocmemBackend(BaseChannelBackend):
+    """Keep messages in memory, for tests (see ``LocmemBackend.outbox``)"""
+    
+    outbox = []
+    
+    def send_messages(self, messages):
+        LocmemBackend.outbox.extend(messages)
+        return list(messages)
+
+
+class EmailBackend(BaseChannelBackend):
+    """Send through Django's email backend over a single connection"""
+    
+    def send_messages(self, messages):
+        messages = [message for message in messages if message.recipient]
+        emails = [
+            mail.EmailMessage(message.subject, message.body, to=[message.recipient])
+            for message in messages
+        ]
+        with mail.get_connection() as connection:
+            connection.send_messages(emails)
+        return messages
+
+
+class SMSBackend(BaseChannelBackend):
+    """
+    Send through the SMS provider's bulk endpoint (SMS_API_URL), in
+    batches of SMS_BULK_SIZE messages per request
+    """
+    
+    def send_messages(self, messages):
+        import requests
+        
+        messages = [message for message in messages if message.recipient]
+        batch_size = getattr(settings, 'SMS_BULK_SIZE', 100)
+        sent = []
+        for start in range(0, len(messages), batch_size):
+            batch = messages[start:start + batch_size]
+            try:
+                response = requests.post(
+                    settings.SMS_API_URL,
+                    json={
+                        'api_key': settings.SMS_API_KEY,
+                        'messages': [
+                            {'to': message.recipient, 'body': message.body}
+                            for message in batch
+                        ],
+                    },
+                    timeout=10
+                )
+                response.raise_for_status()
+            except requests.RequestException as exc:
+                logger.warning("SMS batch of %s failed: %s", len(batch), exc)
+                continue
+            sent.extend(batch)
+        return sent
+
+
+def get_backend(channel):
+    """Backend configured for a channel"""
+    backends = getattr(settings, 'NOTIFICATION_CHANNEL_BACKENDS', {})
+    path = backends.get(channel, 'apps.notifications.backends.ConsoleBackend')
+    return import_string(path)(channel)
@@ -0,0 +1,40 @@
+# backend/apps/notifications/consumers.py
+"""
+WebSocket consumer for live notifications and dashboard deltas
+"""
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import user_group
+
+
+class LiveUpdatesConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One connection per client. Events published for the user arrive as
+    ``{"event": "...", "data": {...}}``:
+
+    - ``notification.created``: the new notification
+    - ``sales.delta``: a completed sale to add to today's totals
+    - ``stock.low``: a product dropped to or below its minimum level
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Keep-alive from the client
+        if content.get('type') == 'ping':
+            await self.send_json({'event': 'pong'})
+
+    async def live_event(self, message):
+        await self.send_json({'event': message['event'], 'data': message['data']})
@@ -0,0 +1,44 @@
+# backend/apps/notifications/management/commands/partition_tables.py
+"""
+Management command to convert append-mostly tables to monthly partitions
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.partitioning import (
+    ensure_partitions, is_partitioned, partition_table, partitioned_models,
+    supports_partitioning
+)
+
+
+class Command(BaseCommand):
+    help = 'Range-partition the tables in PARTITIONED_MODELS by month (PostgreSQL only)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='Number of future monthly partitions to create',
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias to partition',
+        )
+    
+    def handle(self, *args, **options):
+        using = options['database']
+        if not supports_partitioning(using):
+            raise CommandError('Table partitioning requires PostgreSQL')
+        
+        for model, column in partitioned_models():
+            table = model._meta.db_table
+            if is_partitioned(table, using):
+                ensure_partitions(table, options['months_ahead'], using=using)
+                self.stdout.write(f'{table}: already partitioned, future partitions ensured')
+                continue
+            
+            self.stdout.write(f'Partitioning {table} by {column}...')
+            partition_table(model, column, options['months_ahead'], using=using)
+            self.stdout.write(self.style.SUCCESS(f'{table}: partitioned'))
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+NOTIFICATION_TYPES = [
+    "transaction", "loan_reminder", "low_stock", "savings_goal",
+    "system", "promotion", "warning",
+]
+PRIORITY_LEVELS = ["low", "medium", "high", "urgent"]
+
+
+def build_counters(apps, schema_editor):
+    Notification = apps.get_model("notifications", "Notification")
+    NotificationCounter = apps.get_model("notifications", "NotificationCounter")
+
+    annotations = {
+        "total_count": models.Count("id"),
+        "unread_count": models.Count("id", filter=models.Q(is_read=False)),
+        "urgent_unread_count": models.Count(
+            "id", filter=models.Q(is_read=False, priority="urgent")
+        ),
+    }
+    for value in NOTIFICATION_TYPES:
+        annotations[f"{value}_count"] = models.Count(
+            "id", filter=models.Q(notification_type=value)
+        )
+    for value in PRIORITY_LEVELS:
+        annotations[f"{value}_priority_count"] = models.Count(
+            "id", filter=models.Q(priority=value)
+        )
+    rows = Notification.objects.order_by().values("user_id").annotate(**annotations)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(**row) for row in rows], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0005_notification_delivery"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_count", models.IntegerField(default=0)),
+                ("unread_count", models.IntegerField(default=0)),
+                ("urgent_unread_count", models.IntegerField(default=0)),
+                ("transaction_count", models.IntegerField(default=0)),
+                ("loan_reminder_count", models.IntegerField(default=0)),
+                ("low_stock_count", models.IntegerField(default=0)),
+                ("savings_goal_count", models.IntegerField(default=0)),
+                ("system_count", models.IntegerField(default=0)),
+                ("promotion_count", models.IntegerField(default=0)),
+                ("warning_count", models.IntegerField(default=0)),
+                ("low_priority_count", models.IntegerField(default=0)),
+                ("medium_priority_count", models.IntegerField(default=0)),
+                ("high_priority_count", models.IntegerField(default=0)),
+                ("urgent_priority_count", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notification_counter",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notification Counter",
+                "verbose_name_plural": "Notification Counters",
+                "db_table": "notification_counters",
+            },
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0006_notification_counters"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notificationdelivery",
+            name="notification",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="deliveries",
+                to="notifications.notification",
+            ),
+        ),
+    ]
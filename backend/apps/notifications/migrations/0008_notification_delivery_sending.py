@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0007_delivery_notification_no_db_constraint"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notificationdelivery",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("sending", "Sending"),
+                    ("sent", "Sent"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=10,
+            ),
+        ),
+    ]
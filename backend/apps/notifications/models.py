@@ -4,7 +4,10 @@ Notification models for user alerts and reminders
 """
 
 import uuid
-from django.db import models
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from apps.users.models import User
 
@@ -58,10 +61,127 @@ class Notification(models.Model):
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['notification_type']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at', 'id']),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.user.get_full_name()}"
+    
+    def save(self, *args, **kwargs):
+        # Keep the owner's counters in step with this row
+        from .services import NotificationCounterService
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            snapshot = self.counter_snapshot()
+            NotificationCounterService.apply_change(self.user_id, self._counter_snapshot, snapshot)
+        self._counter_snapshot = snapshot
+    
+    def delete(self, *args, **kwargs):
+        from .services import NotificationCounterService
+        user_id, snapshot = self.user_id, self._counter_snapshot
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            NotificationCounterService.apply_change(user_id, snapshot, None)
+        return result
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counter_snapshot = instance.counter_snapshot()
+        return instance
+    
+    _counter_snapshot = None
+    
+    def counter_snapshot(self):
+        """This notification's contribution to the owner's counters"""
+        unread = int(not self.is_read)
+        return {
+            'total_count': 1,
+            'unread_count': unread,
+            'urgent_unread_count': unread if self.priority == 'urgent' else 0,
+            NotificationCounter.type_field(self.notification_type): 1,
+            NotificationCounter.priority_field(self.priority): 1,
+        }
+
+
+class NotificationCounter(models.Model):
+    """
+    Per-user notification counts for badges and the dashboard, updated
+    with F() deltas as notifications are created, read and deleted so
+    neither has to count the notification table. Drift (e.g. from raw
+    ``QuerySet.update()`` calls) is corrected by the periodic
+    ``reconcile_notification_counters`` task.
+    """
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notification_counter'
+    )
+    total_count = models.IntegerField(default=0)
+    unread_count = models.IntegerField(default=0)
+    urgent_unread_count = models.IntegerField(default=0)
+    
+    # Totals by notification type
+    transaction_count = models.IntegerField(default=0)
+    loan_reminder_count = models.IntegerField(default=0)
+    low_stock_count = models.IntegerField(default=0)
+    savings_goal_count = models.IntegerField(default=0)
+    system_count = models.IntegerField(default=0)
+    promotion_count = models.IntegerField(default=0)
+    warning_count = models.IntegerField(default=0)
+    
+    # Totals by priority
+    low_priority_count = models.IntegerField(default=0)
+    medium_priority_count = models.IntegerField(default=0)
+    high_priority_count = models.IntegerField(default=0)
+    urgent_priority_count = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'notification_counters'
+        verbose_name = _('Notification Counter')
+        verbose_name_plural = _('Notification Counters')
+    
+    def __str__(self):
+        return f"Notification counters - {self.user.username}"
+    
+    @staticmethod
+    def type_field(notification_type):
+        return f'{notification_type}_count'
+    
+    @staticmethod
+    def priority_field(priority):
+        return f'{priority}_priority_count'
+    
+    @classmethod
+    def counter_fields(cls):
+        return [
+            'total_count', 'unread_count', 'urgent_unread_count',
+            *(cls.type_field(value) for value, _ in Notification.NOTIFICATION_TYPES),
+            *(cls.priority_field(value) for value, _ in Notification.PRIORITY_LEVELS),
+        ]
+    
+    def badge(self):
+        return {
+            'unread_count': self.unread_count,
+            'urgent_count': self.urgent_unread_count,
+        }
+    
+    def stats(self):
+        return {
+            'total_notifications': self.total_count,
+            **self.badge(),
+            'by_type': {
+                value: getattr(self, self.type_field(value))
+                for value, _ in Notification.NOTIFICATION_TYPES
+            },
+            'by_priority': {
+                value: getattr(self, self.priority_field(value))
+                for value, _ in Notification.PRIORITY_LEVELS
+            },
+        }
 
 
 class NotificationPreference(models.Model):
@@ -103,5 +223,168 @@ class NotificationPreference(models.Model):
     
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.notification_type}"
+    
+    @property
+    def wants_in_app(self):
+        """Whether notifications of this type should be stored for the user"""
+        return self.is_active and self.in_app_enabled
+    
+    def delivery_channels(self):
+        """Out-of-app channels this preference turns on"""
+        if not self.is_active:
+            return []
+        enabled = {
+            'push': self.push_enabled,
+            'email': self.email_enabled,
+            'sms': self.sms_enabled,
+        }
+        return [channel for channel, on in enabled.items() if on]
+    
+    def in_quiet_hours(self, moment):
+        """Whether a local time falls inside the quiet hours"""
+        if self.quiet_hours_start is None or self.quiet_hours_end is None:
+            return False
+        current = moment.time()
+        start, end = self.quiet_hours_start, self.quiet_hours_end
+        if start <= end:
+            return start <= current < end
+        # Quiet hours run past midnight, e.g. 22:00 - 07:00
+        return current >= start or current < end
+    
+    def next_delivery_time(self, now=None):
+        """
+        When a notification created at ``now`` should go out: at once, at
+        the next hourly / daily / weekly digest, and never inside quiet hours
+        """
+        moment = timezone.localtime(now or timezone.now())
+        digest_time = time(getattr(settings, 'NOTIFICATION_DIGEST_HOUR', 8))
+        
+        if self.frequency == 'hourly':
+            moment = moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        elif self.frequency in ('daily', 'weekly'):
+            days_ahead = 1
+            if self.frequency == 'weekly':
+                # Weekly digests go out on Mondays
+                days_ahead = 7 - moment.weekday()
+            moment = timezone.make_aware(
+                datetime.combine(moment.date() + timedelta(days=days_ahead), digest_time)
+            )
+        
+        if self.in_quiet_hours(moment):
+            end = timezone.make_aware(datetime.combine(moment.date(), self.quiet_hours_end))
+            if end <= moment:
+                end += timedelta(days=1)
+            moment = end
+        return moment
+
+
+class NotificationDelivery(models.Model):
+    """
+    A notification queued for an out-of-app channel. Deliveries wait until
+    ``deliver_after`` (digest schedule, quiet hours) and are then sent in
+    groups per user and channel.
+    """
+    
+    CHANNEL_CHOICES = [
+        ('push', 'Push'),
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # No database constraint so the notifications table can be partitioned
+    notification = models.ForeignKey(
+        Notification,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='deliveries'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notification_deliveries'
+    )
+    
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    deliver_after = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'notification_deliveries'
+        ordering = ['deliver_after']
+        indexes = [
+            models.Index(fields=['status', 'deliver_after']),
+        ]
+    
+    def __str__(self):
+        return f"{self.channel} - {self.notification.title} ({self.status})"
+
+
+class NotificationBroadcast(models.Model):
+    """
+    A notification sent to many users, fanned out by a background worker.
+    The counters report progress while the worker runs.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='notification_broadcasts'
+    )
+    
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    priority = models.CharField(max_length=20, choices=Notification.PRIORITY_LEVELS, default='medium')
+    metadata = models.JSONField(default=dict, blank=True)
+    target_users = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='User IDs to notify; empty means every user'
+    )
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_recipients = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'notification_broadcasts'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.title} ({self.status})"
+    
+    @property
+    def progress_percentage(self):
+        if not self.total_recipients:
+            return 100 if self.status == 'completed' else 0
+        return round(self.processed_count * 100 / self.total_recipients, 1)
 
 
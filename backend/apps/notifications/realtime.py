@@ -0,0 +1,56 @@
+# backend/apps/notifications/realtime.py
+"""
+Live updates pushed to connected clients over the channel layer
+
+Writers call ``publish`` and the event is sent to the user's group after
+the surrounding transaction commits. Publishing is best effort: if the
+channel layer (Redis) is unreachable, events are dropped for a short
+while instead of slowing down every write.
+"""
+
+import json
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction as db_transaction
+
+logger = logging.getLogger(__name__)
+
+# Seconds to stop publishing after the channel layer fails
+RETRY_AFTER = 30
+_unavailable_until = 0.0
+
+
+def user_group(user_id):
+    return f'live_{user_id}'
+
+
+def send_event(user_id, event, data):
+    """Send one event now (callers normally use ``publish``)"""
+    global _unavailable_until
+    if time.monotonic() < _unavailable_until:
+        return False
+
+    layer = get_channel_layer()
+    if layer is None:
+        return False
+
+    payload = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    try:
+        async_to_sync(layer.group_send)(
+            user_group(user_id),
+            {'type': 'live.event', 'event': event, 'data': payload}
+        )
+    except Exception as exc:
+        _unavailable_until = time.monotonic() + RETRY_AFTER
+        logger.warning("Live updates paused for %ss: %s", RETRY_AFTER, exc)
+        return False
+    return True
+
+
+def publish(user_id, event, data):
+    """Push ``event`` to the user's connected clients once committed"""
+    db_transaction.on_commit(lambda: send_event(user_id, event, data))
@@ -0,0 +1,12 @@
+# backend/apps/notifications/routing.py
+"""
+WebSocket routes for notifications
+"""
+
+from django.urls import path
+
+from .consumers import LiveUpdatesConsumer
+
+websocket_urlpatterns = [
+    path('ws/live/', LiveUpdatesConsumer.as_asgi()),
+]
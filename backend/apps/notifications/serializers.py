@@ -4,7 +4,7 @@ Notification serializers
 """
 
 from rest_framework import serializers
-from .models import Notification, NotificationPreference
+from .models import Notification, NotificationPreference, NotificationBroadcast
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -37,4 +37,21 @@ class NotificationPreferenceSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class NotificationBroadcastSerializer(serializers.ModelSerializer):
+    """
+    Serializer for broadcasts and their fan-out progress
+    """
+    progress_percentage = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = NotificationBroadcast
+        fields = [
+            'id', 'title', 'message', 'notification_type', 'priority', 'metadata',
+            'target_users', 'status', 'total_recipients', 'processed_count',
+            'created_count', 'skipped_count', 'progress_percentage',
+            'error_message', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,510 @@
+# backend/apps/notifications/services.py
+"""
+Notification services
+Broadcast fan-out, counters, retention, delivery scheduling and digest dispatch
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from apps.users.models import User
+from utils.partitioning import drop_partition, expired_partitions, is_partitioned
+from utils.retention import delete_batch, get_batch_size, keyset_batches, purge_in_batches
+from .backends import ChannelMessage, get_backend
+from .models import (
+    Notification, NotificationBroadcast, NotificationCounter, NotificationPreference,
+    NotificationDelivery
+)
+from .realtime import publish
+from .serializers import NotificationSerializer
+
+
+def chunked(iterator, size):
+    """Yield lists of up to ``size`` items from an iterator"""
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def add_snapshot(deltas, user_id, snapshot, sign=1):
+    for field, value in snapshot.items():
+        deltas[user_id][field] += sign * value
+
+
+class NotificationCounterService:
+    """
+    Incrementally maintained notification counters
+    """
+    
+    @classmethod
+    def apply_change(cls, user_id, before, after):
+        """
+        Apply the difference between two notification snapshots (None for
+        a notification that did not / no longer exists) to the counters
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        add_snapshot(deltas, user_id, after or {})
+        add_snapshot(deltas, user_id, before or {}, sign=-1)
+        cls.apply_deltas(deltas)
+    
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """
+        Apply ``{user_id: {field: delta}}``. Users with the same delta (e.g.
+        every recipient of a broadcast) are updated in a single statement.
+        """
+        deltas = {
+            user_id: {field: value for field, value in delta.items() if value}
+            for user_id, delta in deltas.items()
+        }
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        
+        existing = set(
+            NotificationCounter.objects.filter(user_id__in=deltas).values_list('user_id', flat=True)
+        )
+        missing = [user_id for user_id in deltas if user_id not in existing]
+        if missing:
+            # Counted from the notification table, which already has the change
+            cls.rebuild(missing)
+        
+        groups = defaultdict(list)
+        for user_id in existing:
+            groups[tuple(sorted(deltas[user_id].items()))].append(user_id)
+        for delta, user_ids in groups.items():
+            NotificationCounter.objects.filter(user_id__in=user_ids).update(
+                updated_at=timezone.now(),
+                **{field: F(field) + value for field, value in delta}
+            )
+    
+    @classmethod
+    def rebuild(cls, user_ids):
+        """Recount the given users' counters from the notification table"""
+        user_ids = list(user_ids)
+        fields = NotificationCounter.counter_fields()
+        annotations = {
+            'total_count': Count('id'),
+            'unread_count': Count('id', filter=Q(is_read=False)),
+            'urgent_unread_count': Count('id', filter=Q(is_read=False, priority='urgent')),
+        }
+        for value, _ in Notification.NOTIFICATION_TYPES:
+            annotations[NotificationCounter.type_field(value)] = Count(
+                'id', filter=Q(notification_type=value)
+            )
+        for value, _ in Notification.PRIORITY_LEVELS:
+            annotations[NotificationCounter.priority_field(value)] = Count(
+                'id', filter=Q(priority=value)
+            )
+        
+        with transaction.atomic():
+            # Hold concurrent F() updates back until the recount is written
+            existing = set(
+                NotificationCounter.objects.select_for_update()
+                .filter(user_id__in=user_ids).values_list('user_id', flat=True)
+            )
+            rows = Notification.objects.filter(user_id__in=user_ids).order_by().values(
+                'user_id'
+            ).annotate(**annotations)
+            totals = {row.pop('user_id'): row for row in rows}
+            
+            zeros = dict.fromkeys(fields, 0)
+            counters = [
+                NotificationCounter(user_id=user_id, **totals.get(user_id, zeros))
+                for user_id in user_ids
+                if user_id in totals or user_id in existing
+            ]
+            NotificationCounter.objects.bulk_create(
+                counters,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=[*fields, 'updated_at'],
+            )
+        return len(counters)
+    
+    @classmethod
+    def reconcile(cls, batch_size=1000):
+        """Recount every user's counters to correct any drift"""
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True).iterator(
+            chunk_size=batch_size
+        )
+        return sum(cls.rebuild(chunk) for chunk in chunked(user_ids, batch_size))
+    
+    @classmethod
+    def get_counter(cls, user_id):
+        """The user's counters, counting them on first access"""
+        try:
+            return NotificationCounter.objects.get(user_id=user_id)
+        except NotificationCounter.DoesNotExist:
+            cls.rebuild([user_id])
+            counter, _ = NotificationCounter.objects.get_or_create(user_id=user_id)
+            return counter
+    
+    @classmethod
+    def mark_read(cls, notification):
+        """Mark one notification read; False if it already was"""
+        now = timezone.now()
+        with transaction.atomic():
+            # Conditional update so concurrent requests only count it once
+            updated = Notification.objects.filter(pk=notification.pk, is_read=False).update(
+                is_read=True, read_at=now
+            )
+            if updated:
+                notification.is_read = False
+                before = notification.counter_snapshot()
+                notification.is_read = True
+                notification.read_at = now
+                after = notification.counter_snapshot()
+                cls.apply_change(notification.user_id, before, after)
+                notification._counter_snapshot = after
+        return bool(updated)
+    
+    @classmethod
+    def mark_all_read(cls, user_id):
+        """Mark every unread notification of a user read"""
+        now = timezone.now()
+        with transaction.atomic():
+            counters = NotificationCounter.objects.select_for_update().filter(user_id=user_id)
+            list(counters)
+            updated = Notification.objects.filter(user_id=user_id, is_read=False).update(
+                is_read=True, read_at=now
+            )
+            if updated:
+                counters.update(unread_count=0, urgent_unread_count=0, updated_at=now)
+        return updated
+    
+    @classmethod
+    def removal_deltas(cls, queryset):
+        """Counter deltas for deleting ``queryset``, from one grouped query"""
+        deltas = defaultdict(lambda: defaultdict(int))
+        groups = queryset.order_by().values(
+            'user_id', 'notification_type', 'priority', 'is_read'
+        ).annotate(count=Count('id'))
+        for group in groups:
+            snapshot = Notification(
+                notification_type=group['notification_type'],
+                priority=group['priority'],
+                is_read=group['is_read'],
+            ).counter_snapshot()
+            add_snapshot(deltas, group['user_id'], snapshot, sign=-group['count'])
+        return deltas
+
+
+class NotificationRetentionService:
+    """
+    Deletes expired notifications, and notifications older than
+    NOTIFICATION_RETENTION_DAYS, in bounded keyset batches with raw
+    deletes (see utils.retention), keeping counters in step batch by
+    batch. When the table is partitioned, whole months past the retention
+    period are dropped as partitions instead.
+    """
+    
+    def __init__(self, batch_size=None, retention_days=None):
+        self.batch_size = get_batch_size(batch_size)
+        self.retention_days = retention_days or getattr(settings, 'NOTIFICATION_RETENTION_DAYS', None)
+    
+    def purge(self, queryset, ordering):
+        deleted = 0
+        for pks in keyset_batches(queryset, ordering, self.batch_size):
+            with transaction.atomic():
+                batch = queryset.filter(pk__in=pks)
+                deltas = NotificationCounterService.removal_deltas(batch)
+                deleted += delete_batch(batch)
+                NotificationCounterService.apply_deltas(deltas)
+        return deleted
+    
+    def purge_expired(self, now=None):
+        expired = Notification.objects.filter(expires_at__lt=now or timezone.now())
+        return self.purge(expired, ('expires_at', 'id'))
+    
+    def drop_partitions(self, cutoff):
+        """Drop monthly partitions that are entirely older than ``cutoff``"""
+        table = Notification._meta.db_table
+        if not is_partitioned(table):
+            return []
+        
+        dropped = []
+        for name, start, end in expired_partitions(table, cutoff):
+            in_partition = Notification.objects.filter(created_at__gte=start, created_at__lt=end)
+            user_ids = list(in_partition.order_by().values_list('user_id', flat=True).distinct())
+            # Deliveries reference notifications without a database constraint
+            purge_in_batches(
+                NotificationDelivery.objects.filter(notification__in=in_partition),
+                batch_size=self.batch_size,
+            )
+            drop_partition(table, name)
+            for chunk in chunked(user_ids, self.batch_size):
+                NotificationCounterService.rebuild(chunk)
+            dropped.append(name)
+        return dropped
+    
+    def purge_old(self, now=None):
+        if not self.retention_days:
+            return 0
+        cutoff = (now or timezone.now()) - timedelta(days=self.retention_days)
+        self.drop_partitions(cutoff)
+        return self.purge(Notification.objects.filter(created_at__lt=cutoff), ('created_at', 'id'))
+    
+    def run(self, now=None):
+        now = now or timezone.now()
+        return {
+            'expired': self.purge_expired(now),
+            'old': self.purge_old(now),
+        }
+
+
+class BroadcastService:
+    """
+    Fans a NotificationBroadcast out to its recipients.
+
+    User IDs are streamed from the database in chunks; for each chunk the
+    matching preferences are loaded in one query and the notifications are
+    written with one bulk_create, then the progress counters are updated.
+    """
+    
+    def __init__(self, broadcast, chunk_size=None):
+        self.broadcast = broadcast
+        self.chunk_size = chunk_size or settings.NOTIFICATION_BROADCAST_CHUNK_SIZE
+    
+    def recipients(self):
+        users = User.objects.all()
+        if self.broadcast.target_users:
+            users = users.filter(id__in=self.broadcast.target_users)
+        return users
+    
+    def preferences(self, user_ids):
+        """Preferences of the chunk's users for the broadcast's type"""
+        return {
+            (pref.user_id, pref.notification_type): pref
+            for pref in NotificationPreference.objects.filter(
+                user_id__in=user_ids,
+                notification_type=self.broadcast.notification_type,
+            )
+        }
+    
+    def build(self, user_id):
+        broadcast = self.broadcast
+        return Notification(
+            user_id=user_id,
+            title=broadcast.title,
+            message=broadcast.message,
+            notification_type=broadcast.notification_type,
+            priority=broadcast.priority,
+            metadata={**broadcast.metadata, 'broadcast_id': str(broadcast.id)},
+        )
+    
+    def run(self):
+        broadcast = self.broadcast
+        queryset = NotificationBroadcast.objects.filter(pk=broadcast.pk)
+        
+        recipients = self.recipients()
+        queryset.update(
+            status='running',
+            started_at=timezone.now(),
+            total_recipients=recipients.count(),
+        )
+        
+        try:
+            user_ids = recipients.order_by('pk').values_list('pk', flat=True).iterator(
+                chunk_size=self.chunk_size
+            )
+            for chunk in chunked(user_ids, self.chunk_size):
+                preferences = self.preferences(chunk)
+                skipped = {
+                    user_id for (user_id, _), pref in preferences.items() if not pref.wants_in_app
+                }
+                notifications = [self.build(user_id) for user_id in chunk if user_id not in skipped]
+                create_notifications(notifications, preferences)
+                queryset.update(
+                    processed_count=F('processed_count') + len(chunk),
+                    created_count=F('created_count') + len(notifications),
+                    skipped_count=F('skipped_count') + len(skipped),
+                )
+        except Exception as exc:
+            queryset.update(status='failed', error_message=str(exc), completed_at=timezone.now())
+            raise
+        
+        queryset.update(status='completed', completed_at=timezone.now())
+        broadcast.refresh_from_db()
+        return broadcast
+
+
+class DeliveryScheduler:
+    """
+    Queues out-of-app deliveries for new notifications according to each
+    user's preference for the notification type: enabled channels, digest
+    frequency and quiet hours. Users without a preference row get the
+    model defaults.
+    """
+    
+    @classmethod
+    def schedule(cls, notifications, preferences=None, now=None):
+        """
+        ``preferences`` may be passed as ``{(user_id, notification_type):
+        preference}`` when the caller has already loaded them
+        """
+        notifications = list(notifications)
+        if not notifications:
+            return []
+        now = now or timezone.now()
+        
+        if preferences is None:
+            preferences = {
+                (pref.user_id, pref.notification_type): pref
+                for pref in NotificationPreference.objects.filter(
+                    user_id__in={n.user_id for n in notifications},
+                    notification_type__in={n.notification_type for n in notifications},
+                )
+            }
+        
+        deliveries = []
+        for notification in notifications:
+            key = (notification.user_id, notification.notification_type)
+            preference = preferences.get(key) or NotificationPreference(
+                user_id=notification.user_id,
+                notification_type=notification.notification_type,
+            )
+            channels = preference.delivery_channels()
+            if not channels:
+                continue
+            deliver_after = preference.next_delivery_time(now)
+            deliveries.extend(
+                NotificationDelivery(
+                    notification=notification,
+                    user_id=notification.user_id,
+                    channel=channel,
+                    deliver_after=deliver_after,
+                )
+                for channel in channels
+            )
+        
+        return NotificationDelivery.objects.bulk_create(deliveries, batch_size=1000)
+
+
+def create_notifications(notifications, preferences=None):
+    """bulk_create notifications, count them and queue their deliveries"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications, batch_size=1000)
+        for notification in created:
+            notification._counter_snapshot = notification.counter_snapshot()
+            add_snapshot(deltas, notification.user_id, notification._counter_snapshot)
+        NotificationCounterService.apply_deltas(deltas)
+        DeliveryScheduler.schedule(created, preferences)
+    for notification in created:
+        publish(notification.user_id, 'notification.created', NotificationSerializer(notification).data)
+    return created
+
+
+class DigestDispatcher:
+    """
+    Sends due deliveries. Deliveries for the same user and channel are
+    merged into one message (a digest when there is more than one), and
+    each channel backend gets all of its messages in a single call.
+    
+    A run first claims its batch: the due rows are locked (skipping rows
+    another run holds), marked ``sending`` and leased until ``now +
+    lease``, then committed before anything is sent. Overlapping runs
+    therefore never send the same delivery; a claim whose worker died
+    becomes due again when its lease runs out. Failed sends are retried
+    with exponential backoff, ``retry_delay * 2 ** (attempts - 1)`` after
+    the failure, until ``max_attempts``.
+    """
+    
+    def __init__(self, batch_size=None, max_attempts=None, lease=None, retry_delay=None):
+        self.batch_size = batch_size or getattr(settings, 'NOTIFICATION_DISPATCH_BATCH_SIZE', 5000)
+        self.max_attempts = max_attempts or getattr(settings, 'NOTIFICATION_DELIVERY_MAX_ATTEMPTS', 5)
+        self.lease = lease or timedelta(
+            seconds=getattr(settings, 'NOTIFICATION_DELIVERY_LEASE_SECONDS', 600)
+        )
+        self.retry_delay = retry_delay or timedelta(
+            seconds=getattr(settings, 'NOTIFICATION_DELIVERY_RETRY_SECONDS', 60)
+        )
+    
+    def due(self, now):
+        return NotificationDelivery.objects.filter(
+            status__in=('pending', 'sending'), deliver_after__lte=now
+        )
+    
+    def claim(self, now):
+        """Claim up to ``batch_size`` due deliveries for this run and return them"""
+        with transaction.atomic():
+            ids = list(
+                self.due(now).select_for_update(skip_locked=True).order_by('deliver_after')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            NotificationDelivery.objects.filter(id__in=ids).update(
+                status='sending', deliver_after=now + self.lease
+            )
+        return list(
+            NotificationDelivery.objects.filter(id__in=ids).select_related('notification', 'user')
+            .order_by('channel', 'user_id', 'created_at')
+        )
+    
+    @staticmethod
+    def build_message(channel, deliveries):
+        notifications = [delivery.notification for delivery in deliveries]
+        if len(notifications) == 1:
+            subject = notifications[0].title
+            body = notifications[0].message
+        else:
+            subject = f"You have {len(notifications)} new notifications"
+            body = "\n".join(f"- {n.title}: {n.message}" for n in notifications)
+        return ChannelMessage(
+            channel=channel,
+            user=deliveries[0].user,
+            subject=subject,
+            body=body,
+            delivery_ids=[delivery.id for delivery in deliveries],
+        )
+    
+    def dispatch(self, now=None):
+        """Send everything that is due; returns the number of messages sent"""
+        now = now or timezone.now()
+        deliveries = self.claim(now)
+        
+        messages_by_channel = defaultdict(list)
+        for (channel, _), group in groupby(deliveries, key=lambda d: (d.channel, d.user_id)):
+            messages_by_channel[channel].append(self.build_message(channel, list(group)))
+        
+        attempts = {delivery.id: delivery.attempts + 1 for delivery in deliveries}
+        sent_count = 0
+        for channel, messages in messages_by_channel.items():
+            try:
+                sent = get_backend(channel).send_messages(messages)
+            except Exception:
+                sent = []
+            sent_ids = {delivery_id for message in sent for delivery_id in message.delivery_ids}
+            failed_ids = [
+                delivery_id for message in messages for delivery_id in message.delivery_ids
+                if delivery_id not in sent_ids
+            ]
+            
+            NotificationDelivery.objects.filter(id__in=sent_ids).update(
+                status='sent', sent_at=now, attempts=F('attempts') + 1
+            )
+            if failed_ids:
+                # One UPDATE per attempt count, each with its own backoff
+                retries = defaultdict(list)
+                for delivery_id in failed_ids:
+                    retries[attempts[delivery_id]].append(delivery_id)
+                for attempt, ids in retries.items():
+                    NotificationDelivery.objects.filter(id__in=ids).update(
+                        status='pending' if attempt < self.max_attempts else 'failed',
+                        deliver_after=now + self.retry_delay * 2 ** (attempt - 1),
+                        attempts=F('attempts') + 1,
+                    )
+            sent_count += len(sent)
+        
+        return sent_count
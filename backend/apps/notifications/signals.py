@@ -0,0 +1,56 @@
+# backend/apps/notifications/signals.py
+"""
+Queue deliveries for notifications created one at a time (bulk inserts
+go through services.create_notifications) and publish live updates
+"""
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.inventory.models import Product
+from apps.transactions.models import Transaction
+from .models import Notification
+from .realtime import publish
+from .serializers import NotificationSerializer
+from .services import DeliveryScheduler
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        DeliveryScheduler.schedule([instance])
+        publish(instance.user_id, 'notification.created', NotificationSerializer(instance).data)
+
+
+@receiver(post_save, sender=Transaction)
+def sale_completed(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    if instance.transaction_type != 'sale' or instance.status != 'completed':
+        return
+    publish(instance.user_id, 'sales.delta', {
+        'transaction_id': instance.id,
+        'total_amount': instance.total_amount,
+        'transaction_count': 1,
+        'transaction_date': instance.transaction_date,
+    })
+
+
+@receiver(post_save, sender=Product)
+def stock_dropped(sender, instance, raw=False, **kwargs):
+    if raw or not instance.track_inventory or not instance.is_low_stock:
+        return
+    # post_save runs before Product.save() refreshes _stock_snapshot, so
+    # the snapshot still holds the values loaded from the database
+    before = instance._stock_snapshot or {}
+    became_low = not before.get('low_stock_count')
+    became_out = instance.is_out_of_stock and not before.get('out_of_stock_count')
+    if not (became_low or became_out):
+        return
+    publish(instance.user_id, 'stock.low', {
+        'product_id': instance.id,
+        'name': instance.name,
+        'current_stock': instance.current_stock,
+        'minimum_stock_level': instance.minimum_stock_level,
+        'stock_status': instance.stock_status,
+    })
@@ -0,0 +1,47 @@
+# backend/apps/notifications/tasks.py
+"""
+Background tasks for notifications
+"""
+
+from celery import shared_task
+
+from utils.partitioning import maintain_partitions
+
+from .models import NotificationBroadcast
+from .services import (
+    BroadcastService, DigestDispatcher, NotificationCounterService, NotificationRetentionService
+)
+
+
+@shared_task
+def send_broadcast(broadcast_id):
+    """Fan a broadcast out to its recipients"""
+    broadcast = NotificationBroadcast.objects.filter(id=broadcast_id, status='pending').first()
+    if broadcast is None:
+        return None
+    BroadcastService(broadcast).run()
+    return str(broadcast.id)
+
+
+@shared_task
+def dispatch_notification_deliveries():
+    """Send due notifications and digests (run every minute by beat)"""
+    return DigestDispatcher().dispatch()
+
+
+@shared_task
+def reconcile_notification_counters():
+    """Recount notification counters to correct drift (run hourly by beat)"""
+    return NotificationCounterService.reconcile()
+
+
+@shared_task
+def purge_notifications():
+    """Delete expired and out-of-retention notifications (run daily by beat)"""
+    return NotificationRetentionService().run()
+
+
+@shared_task
+def maintain_table_partitions():
+    """Create upcoming monthly partitions for partitioned tables (run daily by beat)"""
+    return maintain_partitions()
@@ -1,3 +1,433 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import CommandError, call_command
+from django.db import NotSupportedError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Product, ProductCategory
+from apps.users.models import User
+from utils.partitioning import partition_table
+from utils.retention import keyset_batches
+from . import realtime
+from .backends import LocmemBackend
+from .models import (
+    Notification, NotificationBroadcast, NotificationCounter, NotificationDelivery,
+    NotificationPreference
+)
+from .routing import websocket_urlpatterns
+from .services import (
+    BroadcastService, DigestDispatcher, NotificationCounterService, NotificationRetentionService,
+    create_notifications
+)
+from .tasks import reconcile_notification_counters, send_broadcast
+
+
+def create_user(index, **kwargs):
+    return User.objects.create_user(
+        email=f'merchant{index}@example.com', username=f'merchant{index}', password='pass',
+        phone_number=f'0803100{index:04d}', first_name='Merchant', last_name=str(index), **kwargs
+    )
+
+
+class BroadcastTests(TestCase):
+    """Broadcasts are fanned out in batches by the worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user(0, user_type='admin')
+        cls.merchants = [create_user(index) for index in range(1, 8)]
+        NotificationPreference.objects.create(
+            user=cls.merchants[0], notification_type='system', in_app_enabled=False
+        )
+
+    def test_endpoint_queues_broadcast(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = client.post(
+                '/api/notifications/notifications/create_system_notification/',
+                {'title': 'Holiday', 'message': 'Banks close on Monday'}, format='json'
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+        send_broadcast(response.data['id'])
+        broadcast = NotificationBroadcast.objects.get(id=response.data['id'])
+        self.assertEqual(broadcast.status, 'completed')
+        self.assertEqual(broadcast.total_recipients, 8)
+        self.assertEqual(broadcast.created_count, 7)
+        self.assertEqual(broadcast.skipped_count, 1)
+        self.assertFalse(Notification.objects.filter(user=self.merchants[0]).exists())
+
+    def test_batches_per_chunk(self):
+        broadcast = NotificationBroadcast.objects.create(
+            title='Update', message='New features', notification_type='system',
+            target_users=[str(user.id) for user in self.merchants[1:]]
+        )
+        NotificationCounter.objects.bulk_create(
+            NotificationCounter(user=user) for user in self.merchants
+        )
+        # count, running, streamed ids, then per chunk of 3: preferences,
+        # savepoint, notifications, counter lookup and one counter update,
+        # deliveries, release and progress; completed and the refresh
+        with self.assertNumQueries(3 + 2 * 8 + 2):
+            BroadcastService(broadcast, chunk_size=3).run()
+        self.assertEqual(broadcast.created_count, 6)
+        self.assertEqual(broadcast.progress_percentage, 100)
+
+
+LOCMEM_BACKENDS = {
+    channel: 'apps.notifications.backends.LocmemBackend'
+    for channel in ('push', 'email', 'sms')
+}
+
+
+@override_settings(NOTIFICATION_CHANNEL_BACKENDS=LOCMEM_BACKENDS, NOTIFICATION_DIGEST_HOUR=8)
+class DigestTests(TestCase):
+    """Deliveries follow preferences and are grouped into digests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+
+    def setUp(self):
+        LocmemBackend.outbox = []
+        # 10:30 local time on a Wednesday
+        self.now = timezone.make_aware(datetime(2026, 10, 14, 10, 30))
+
+    def notify(self, count, notification_type='low_stock'):
+        return create_notifications([
+            Notification(
+                user=self.user, title=f'Alert {index}', message='Check stock',
+                notification_type=notification_type
+            )
+            for index in range(count)
+        ])
+
+    def prefer(self, **kwargs):
+        defaults = {'email_enabled': True, 'sms_enabled': True, 'push_enabled': False}
+        defaults.update(kwargs)
+        NotificationPreference.objects.create(
+            user=self.user, notification_type='low_stock', **defaults
+        )
+
+    def test_immediate_notifications_grouped_per_channel(self):
+        self.prefer()
+        self.notify(3)
+        self.assertEqual(NotificationDelivery.objects.count(), 6)
+
+        sent = DigestDispatcher().dispatch(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(sent, 2)
+        self.assertEqual(
+            sorted(message.channel for message in LocmemBackend.outbox), ['email', 'sms']
+        )
+        self.assertIn('3 new notifications', LocmemBackend.outbox[0].subject)
+        self.assertFalse(NotificationDelivery.objects.filter(status='pending').exists())
+
+    def test_daily_digest_waits_for_digest_hour(self):
+        preference = NotificationPreference(frequency='daily')
+        self.assertEqual(
+            timezone.localtime(preference.next_delivery_time(self.now)),
+            timezone.make_aware(datetime(2026, 10, 15, 8, 0))
+        )
+
+    def test_hourly_digest(self):
+        preference = NotificationPreference(frequency='hourly')
+        self.assertEqual(
+            preference.next_delivery_time(self.now),
+            timezone.make_aware(datetime(2026, 10, 14, 11, 0))
+        )
+
+    def test_quiet_hours_hold_delivery(self):
+        preference = NotificationPreference(
+            quiet_hours_start=time(22, 0), quiet_hours_end=time(7, 0)
+        )
+        late = timezone.make_aware(datetime(2026, 10, 14, 23, 15))
+        self.assertEqual(
+            preference.next_delivery_time(late),
+            timezone.make_aware(datetime(2026, 10, 15, 7, 0))
+        )
+        self.assertEqual(preference.next_delivery_time(self.now), self.now)
+
+    def test_claimed_deliveries_are_not_sent_twice(self):
+        self.prefer()
+        self.notify(2)
+        now = timezone.now() + timedelta(seconds=1)
+        claimed = DigestDispatcher().claim(now)
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(set(NotificationDelivery.objects.values_list('status', flat=True)), {'sending'})
+
+        # An overlapping run finds nothing to send
+        self.assertEqual(DigestDispatcher().dispatch(now), 0)
+        self.assertEqual(LocmemBackend.outbox, [])
+
+        # A claim whose run never finished is picked up after its lease
+        self.assertEqual(DigestDispatcher().dispatch(now + timedelta(hours=1)), 2)
+        self.assertEqual(set(NotificationDelivery.objects.values_list('status', flat=True)), {'sent'})
+
+    def test_failed_sends_back_off_exponentially(self):
+        self.prefer(sms_enabled=False)
+        self.notify(1)
+        delivery = NotificationDelivery.objects.get()
+        dispatcher = DigestDispatcher(max_attempts=3, retry_delay=timedelta(minutes=1))
+        now = timezone.now() + timedelta(seconds=1)
+
+        with mock.patch.object(LocmemBackend, 'send_messages', side_effect=RuntimeError):
+            for attempt, delay in ((1, 1), (2, 2)):
+                self.assertEqual(dispatcher.dispatch(now), 0)
+                delivery.refresh_from_db()
+                self.assertEqual((delivery.status, delivery.attempts), ('pending', attempt))
+                self.assertEqual(delivery.deliver_after, now + timedelta(minutes=delay))
+                # Not retried before its backoff runs out
+                self.assertEqual(dispatcher.claim(delivery.deliver_after - timedelta(seconds=1)), [])
+                now = delivery.deliver_after
+
+            dispatcher.dispatch(now)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('failed', 3))
+
+    def test_nothing_sent_before_due(self):
+        self.prefer(frequency='hourly')
+        self.notify(2)
+        self.assertEqual(DigestDispatcher().dispatch(timezone.now()), 0)
+        self.assertEqual(LocmemBackend.outbox, [])
+
+    def test_disabled_channels(self):
+        self.prefer(email_enabled=False, sms_enabled=False)
+        self.notify(1)
+        self.assertFalse(NotificationDelivery.objects.exists())
+
+
+class CounterTests(TestCase):
+    """Badge and dashboard counts come from counters kept in step with writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user(0, user_type='admin')
+        cls.user = create_user(1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, **kwargs):
+        defaults = {'user': self.user, 'title': 'Alert', 'message': '-', 'notification_type': 'low_stock'}
+        defaults.update(kwargs)
+        return Notification.objects.create(**defaults)
+
+    def assertCountersMatch(self):
+        counter = NotificationCounter.objects.get(user=self.user)
+        counted = {field: getattr(counter, field) for field in NotificationCounter.counter_fields()}
+        NotificationCounterService.rebuild([self.user.id])
+        counter.refresh_from_db()
+        self.assertEqual(
+            counted,
+            {field: getattr(counter, field) for field in NotificationCounter.counter_fields()}
+        )
+        return counter
+
+    def test_counters_follow_writes(self):
+        urgent = self.notify(priority='urgent')
+        self.notify(notification_type='system')
+        create_notifications([
+            Notification(user=self.user, title='Bulk', message='-', notification_type='warning')
+            for _ in range(3)
+        ])
+        counter = self.assertCountersMatch()
+        self.assertEqual(counter.unread_count, 5)
+        self.assertEqual(counter.urgent_unread_count, 1)
+        self.assertEqual(counter.warning_count, 3)
+
+        url = f'/api/notifications/notifications/{urgent.id}/mark_read/'
+        self.client.post(url)
+        self.client.post(url)
+        counter = self.assertCountersMatch()
+        self.assertEqual((counter.unread_count, counter.urgent_unread_count), (4, 0))
+
+        response = self.client.patch(
+            f'/api/notifications/notifications/{urgent.id}/',
+            {'notification_type': 'promotion', 'priority': 'low'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        counter = self.assertCountersMatch()
+        self.assertEqual((counter.promotion_count, counter.urgent_priority_count), (1, 0))
+
+        self.client.delete(f'/api/notifications/notifications/{urgent.id}/')
+        self.assertEqual(self.assertCountersMatch().total_count, 4)
+
+        self.client.post('/api/notifications/notifications/mark_all_read/')
+        counter = self.assertCountersMatch()
+        self.assertEqual((counter.total_count, counter.unread_count), (4, 0))
+
+    def test_cleanup_expired(self):
+        self.notify(expires_at=timezone.now() - timedelta(days=1))
+        self.notify(expires_at=timezone.now() - timedelta(days=1), is_read=True)
+        self.notify()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/notifications/notifications/cleanup_expired/')
+        self.assertEqual(response.data['deleted_count'], 2)
+        counter = self.assertCountersMatch()
+        self.assertEqual((counter.total_count, counter.unread_count), (1, 1))
+
+    def test_badge_is_a_single_read(self):
+        self.notify(priority='urgent')
+        self.notify()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/notifications/notifications/badge/')
+        self.assertEqual(response.data, {'unread_count': 2, 'urgent_count': 1})
+
+        response = self.client.get('/api/notifications/notifications/dashboard_stats/')
+        self.assertEqual(response.data['total_notifications'], 2)
+        self.assertEqual(response.data['by_priority']['urgent'], 1)
+        self.assertEqual(response.data['by_type']['low_stock'], 2)
+        self.assertEqual(len(response.data['recent_notifications']), 2)
+
+    def test_reconcile_corrects_drift(self):
+        self.notify()
+        Notification.objects.filter(user=self.user).update(is_read=True)
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread_count, 1)
+        reconcile_notification_counters()
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread_count, 0)
+
+
+@override_settings(NOTIFICATION_CHANNEL_BACKENDS=LOCMEM_BACKENDS)
+class RetentionTests(TestCase):
+    """Expired and old notifications are purged in bounded batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+
+    def notify(self, count, **kwargs):
+        return create_notifications([
+            Notification(user=self.user, title='Alert', message='-', notification_type='system', **kwargs)
+            for _ in range(count)
+        ])
+
+    def test_purge_expired_in_batches(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        self.notify(5, expires_at=yesterday)
+        self.notify(1, expires_at=yesterday, is_read=True)
+        self.notify(2)
+        self.assertEqual(NotificationDelivery.objects.count(), 16)
+
+        service = NotificationRetentionService(batch_size=4)
+        with CaptureQueriesContext(connection) as queries:
+            deleted = service.purge_expired()
+        self.assertEqual(deleted, 6)
+        # Rows are never loaded for cascade collection
+        self.assertFalse(any('"notifications"."title"' in query['sql'] for query in queries))
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(NotificationDelivery.objects.count(), 4)
+
+        counter = NotificationCounter.objects.get(user=self.user)
+        self.assertEqual((counter.total_count, counter.unread_count, counter.system_count), (2, 2, 2))
+
+    def test_purge_old(self):
+        self.notify(3)
+        Notification.objects.filter(
+            id__in=Notification.objects.values('id')[:2]
+        ).update(created_at=timezone.now() - timedelta(days=400))
+
+        result = NotificationRetentionService(batch_size=1, retention_days=365).run()
+        self.assertEqual(result, {'expired': 0, 'old': 2})
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).total_count, 1)
+
+    def test_keyset_batches(self):
+        self.notify(5)
+        batches = list(keyset_batches(Notification.objects.all(), ('created_at', 'id'), 2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(len({pk for batch in batches for pk in batch}), 5)
+
+
+class PartitioningTests(TestCase):
+    """Partitioning refuses to touch databases other than PostgreSQL"""
+
+    def test_refuses_other_databases(self):
+        with self.assertRaises(NotSupportedError):
+            partition_table(Notification)
+        with self.assertRaises(CommandError):
+            call_command('partition_tables')
+        self.assertIn(Notification._meta.db_table, connection.introspection.table_names())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LiveUpdatesTests(TransactionTestCase):
+    """Events reach the user's WebSocket through the channel layer"""
+
+    def setUp(self):
+        realtime._unavailable_until = 0.0
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/live/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_rejects_anonymous(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/live/')
+        communicator.scope['user'] = AnonymousUser()
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_notification_pushed(self):
+        user = await database_sync_to_async(create_user)(1)
+        other = await database_sync_to_async(create_user)(2)
+        communicator = await self.connect(user)
+
+        await database_sync_to_async(Notification.objects.create)(
+            user=other, title='Not yours', message='-', notification_type='system'
+        )
+        await database_sync_to_async(Notification.objects.create)(
+            user=user, title='Stock is low', message='Rice', notification_type='low_stock'
+        )
+
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['event'], 'notification.created')
+        self.assertEqual(message['data']['title'], 'Stock is low')
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_low_stock_and_sales_deltas(self):
+        user = await database_sync_to_async(create_user)(1)
+        communicator = await self.connect(user)
+
+        def change_stock():
+            category = ProductCategory.objects.create(name='Oils', category_type='food_beverages')
+            product = Product.objects.create(
+                user=user, category=category, name='Palm oil', cost_price=Decimal('900'),
+                selling_price=Decimal('1200'), current_stock=Decimal('10'),
+                minimum_stock_level=Decimal('3')
+            )
+            product = Product.objects.get(pk=product.pk)
+            product.current_stock = Decimal('9')
+            product.save()
+            product.current_stock = Decimal('2')
+            product.save()
+
+        await database_sync_to_async(change_stock)()
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['event'], 'stock.low')
+        self.assertEqual(message['data']['current_stock'], '2')
+        self.assertTrue(await communicator.receive_nothing())
+
+        await database_sync_to_async(realtime.send_event)(
+            user.id, 'sales.delta', {'total_amount': Decimal('1500.00')}
+        )
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['data'], {'total_amount': '1500.00'})
+        await communicator.disconnect()
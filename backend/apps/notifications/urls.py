@@ -5,11 +5,12 @@ URL configuration for notifications
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import NotificationViewSet, NotificationPreferenceViewSet
+from .views import NotificationViewSet, NotificationPreferenceViewSet, NotificationBroadcastViewSet
 
 router = DefaultRouter()
 router.register(r'notifications', NotificationViewSet)
 router.register(r'preferences', NotificationPreferenceViewSet)
+router.register(r'broadcasts', NotificationBroadcastViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -6,26 +6,23 @@ Notification management API views for user alerts and reminders
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django.db.models import Q, Count
 from django.utils import timezone
+from django.db import transaction as db_transaction
 from datetime import datetime, timedelta
 
-from .models import Notification, NotificationPreference
+from .models import Notification, NotificationPreference, NotificationBroadcast
 from .serializers import (
     NotificationSerializer,
-    NotificationPreferenceSerializer
+    NotificationPreferenceSerializer,
+    NotificationBroadcastSerializer
 )
+from .services import NotificationCounterService, NotificationRetentionService
+from .tasks import send_broadcast
+from utils.pagination import PaginatedActionsMixin, StandardResultsSetPagination
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for notification views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing user notifications
     """
@@ -33,6 +30,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
         """Filter notifications by user"""
@@ -46,15 +44,13 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def unread(self, request):
         """Get unread notifications"""
         notifications = self.get_queryset().filter(is_read=False)
-        serializer = self.get_serializer(notifications, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(notifications)
     
     @action(detail=False, methods=['get'])
     def urgent(self, request):
         """Get urgent notifications"""
         notifications = self.get_queryset().filter(priority='urgent')
-        serializer = self.get_serializer(notifications, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(notifications)
     
     @action(detail=False, methods=['get'])
     def by_type(self, request):
@@ -67,16 +63,13 @@ class NotificationViewSet(viewsets.ModelViewSet):
             )
         
         notifications = self.get_queryset().filter(notification_type=notification_type)
-        serializer = self.get_serializer(notifications, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(notifications)
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Mark notification as read"""
         notification = self.get_object()
-        notification.is_read = True
-        notification.read_at = timezone.now()
-        notification.save()
+        NotificationCounterService.mark_read(notification)
         
         serializer = self.get_serializer(notification)
         return Response(serializer.data)
@@ -84,10 +77,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        updated_count = self.get_queryset().filter(is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        updated_count = NotificationCounterService.mark_all_read(request.user.id)
         
         return Response({
             'message': f'Marked {updated_count} notifications as read',
@@ -97,36 +87,22 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
         """Get notification dashboard statistics"""
-        notifications = self.get_queryset()
-        
-        stats = {
-            'total_notifications': notifications.count(),
-            'unread_count': notifications.filter(is_read=False).count(),
-            'urgent_count': notifications.filter(priority='urgent', is_read=False).count(),
-            'by_type': {},
-            'by_priority': {},
-            'recent_notifications': []
-        }
-        
-        # By type
-        for notification_type, _ in Notification.NOTIFICATION_TYPES:
-            count = notifications.filter(notification_type=notification_type).count()
-            stats['by_type'][notification_type] = count
-        
-        # By priority
-        for priority, _ in Notification.PRIORITY_LEVELS:
-            count = notifications.filter(priority=priority).count()
-            stats['by_priority'][priority] = count
+        stats = NotificationCounterService.get_counter(request.user.id).stats()
         
         # Recent notifications (last 5)
-        recent = notifications[:5]
+        recent = self.get_queryset()[:5]
         stats['recent_notifications'] = NotificationSerializer(recent, many=True).data
         
         return Response(stats)
     
+    @action(detail=False, methods=['get'])
+    def badge(self, request):
+        """Unread and urgent counts for the app badge"""
+        return Response(NotificationCounterService.get_counter(request.user.id).badge())
+    
     @action(detail=False, methods=['post'])
     def create_system_notification(self, request):
-        """Create system notification (admin only)"""
+        """Queue a system notification broadcast (admin only)"""
         if request.user.user_type != 'admin':
             return Response(
                 {'error': 'Permission denied'}, 
@@ -145,41 +121,21 @@ class NotificationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        created_count = 0
+        broadcast = NotificationBroadcast.objects.create(
+            created_by=request.user,
+            title=title,
+            message=message,
+            notification_type=notification_type,
+            priority=priority,
+            metadata=request.data.get('metadata', {}),
+            target_users=[str(user_id) for user_id in target_users],
+        )
         
-        if target_users:
-            # Send to specific users
-            from apps.users.models import User
-            users = User.objects.filter(id__in=target_users)
-            for user in users:
-                Notification.objects.create(
-                    user=user,
-                    title=title,
-                    message=message,
-                    notification_type=notification_type,
-                    priority=priority,
-                    metadata=request.data.get('metadata', {})
-                )
-                created_count += 1
-        else:
-            # Send to all users
-            from apps.users.models import User
-            users = User.objects.all()
-            for user in users:
-                Notification.objects.create(
-                    user=user,
-                    title=title,
-                    message=message,
-                    notification_type=notification_type,
-                    priority=priority,
-                    metadata=request.data.get('metadata', {})
-                )
-                created_count += 1
+        # Fan out in the background once the broadcast row is committed
+        db_transaction.on_commit(lambda: send_broadcast.delay(str(broadcast.id)))
         
-        return Response({
-            'message': f'Created {created_count} notifications',
-            'created_count': created_count
-        })
+        serializer = NotificationBroadcastSerializer(broadcast)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=False, methods=['post'])
     def cleanup_expired(self, request):
@@ -190,11 +146,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        expired_notifications = Notification.objects.filter(
-            expires_at__lt=timezone.now()
-        )
-        deleted_count = expired_notifications.count()
-        expired_notifications.delete()
+        deleted_count = NotificationRetentionService().purge_expired()
         
         return Response({
             'message': f'Deleted {deleted_count} expired notifications',
@@ -202,7 +154,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
         })
 
 
-class NotificationPreferenceViewSet(viewsets.ModelViewSet):
+class NotificationPreferenceViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing notification preferences
     """
@@ -223,8 +175,7 @@ class NotificationPreferenceViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get active notification preferences"""
         preferences = self.get_queryset().filter(is_active=True)
-        serializer = self.get_serializer(preferences, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(preferences)
     
     @action(detail=False, methods=['post'])
     def bulk_update(self, request):
@@ -323,4 +274,20 @@ class NotificationPreferenceViewSet(viewsets.ModelViewSet):
         preference.save()
         
         serializer = self.get_serializer(preference)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class NotificationBroadcastViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for following broadcast progress (admin only)
+    """
+    queryset = NotificationBroadcast.objects.all()
+    serializer_class = NotificationBroadcastSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    
+    def get_queryset(self):
+        """Admins see every broadcast"""
+        if self.request.user.user_type != 'admin':
+            return NotificationBroadcast.objects.none()
+        return NotificationBroadcast.objects.all().order_by('-created_at')
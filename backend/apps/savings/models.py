@@ -4,6 +4,7 @@ Savings and wallet models for micro-savings functionality
 """
 
 import uuid
+from datetime import datetime
 from decimal import Decimal
 from django.db import models
 from django.core.validators import MinValueValidator
@@ -135,6 +136,33 @@ class SavingsAccount(models.Model):
             account_count = SavingsAccount.objects.filter(user=self.user).count() + 1
             self.account_number = f"SAV-{user_id}-{account_count:03d}"
         super().save(*args, **kwargs)
+        
+        # Sales read the auto-save settings from the cache
+        if self._auto_save_snapshot != self.auto_save_snapshot():
+            from .services import AutoSaveService
+            AutoSaveService.invalidate(self.user_id)
+        self._auto_save_snapshot = self.auto_save_snapshot()
+    
+    def delete(self, *args, **kwargs):
+        from .services import AutoSaveService
+        result = super().delete(*args, **kwargs)
+        AutoSaveService.invalidate(self.user_id)
+        return result
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auto_save_snapshot = instance.auto_save_snapshot()
+        return instance
+    
+    _auto_save_snapshot = None
+    
+    def auto_save_snapshot(self):
+        """Fields that decide whether and how much POS sales set aside"""
+        return (
+            self.is_default, self.status, self.auto_save_enabled, self.auto_save_percentage,
+            self.auto_save_minimum, self.auto_save_maximum
+        )
     
     @property
     def progress_percentage(self):
@@ -154,36 +182,17 @@ class SavingsAccount(models.Model):
         """Check if withdrawal amount is allowed"""
         return (self.current_balance - amount) >= self.minimum_balance
     
-    def add_funds(self, amount, transaction_type='deposit', reference=''):
-        """Add funds to savings account"""
+    def add_funds(self, amount, transaction_type='deposit', reference='', **kwargs):
+        """Add funds to savings account (one atomic UPDATE and ledger row)"""
+        from .services import SavingsLedgerService
+        if amount > 0:
+            return SavingsLedgerService.credit(self, amount, transaction_type, reference, **kwargs)
+    
+    def withdraw_funds(self, amount, transaction_type='withdrawal', reference='', **kwargs):
+        """Withdraw funds unless that would go below the minimum balance"""
+        from .services import SavingsLedgerService
         if amount > 0:
-            self.current_balance += amount
-            self.save()
-            
-            # Create savings transaction record
-            SavingsTransaction.objects.create(
-                savings_account=self,
-                transaction_type=transaction_type,
-                amount=amount,
-                reference=reference,
-                balance_after=self.current_balance
-            )
-    
-    def withdraw_funds(self, amount, transaction_type='withdrawal', reference=''):
-        """Withdraw funds from savings account"""
-        if amount > 0 and self.can_withdraw(amount):
-            self.current_balance -= amount
-            self.save()
-            
-            # Create savings transaction record
-            SavingsTransaction.objects.create(
-                savings_account=self,
-                transaction_type=transaction_type,
-                amount=-amount,  # Negative for withdrawal
-                reference=reference,
-                balance_after=self.current_balance
-            )
-            return True
+            return SavingsLedgerService.debit(self, amount, transaction_type, reference, **kwargs) is not None
         return False
 
 
@@ -267,6 +276,7 @@ class SavingsTransaction(models.Model):
         ordering = ['-transaction_date']
         indexes = [
             models.Index(fields=['savings_account', 'transaction_date']),
+            models.Index(fields=['transaction_date', 'id']),
             models.Index(fields=['transaction_reference']),
             models.Index(fields=['transaction_type']),
             models.Index(fields=['source_transaction_id']),
@@ -278,16 +288,22 @@ class SavingsTransaction(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate transaction reference and set balance_before"""
         if not self.transaction_reference:
-            date_str = self.transaction_date.strftime('%Y%m%d') if self.transaction_date else datetime.now().strftime('%Y%m%d')
-            account_id = str(self.savings_account.id)[:8].upper()
-            transaction_count = SavingsTransaction.objects.filter(savings_account=self.savings_account).count() + 1
-            self.transaction_reference = f"SVG-{date_str}-{account_id}-{transaction_count:03d}"
+            self.transaction_reference = self.make_reference()
         
-        if not self.balance_before:
+        if self.balance_before is None:
             self.balance_before = self.savings_account.current_balance
         
         super().save(*args, **kwargs)
     
+    def make_reference(self):
+        """
+        Unique without counting the account's rows, which would race under
+        concurrent deposits (bulk_create callers set it themselves)
+        """
+        date_str = self.transaction_date.strftime('%Y%m%d') if self.transaction_date else datetime.now().strftime('%Y%m%d')
+        account_id = str(self.savings_account_id)[:8].upper()
+        return f"SVG-{date_str}-{account_id}-{self.id.hex[:8].upper()}"
+    
     @property
     def is_credit(self):
         """Check if transaction is a credit (positive amount)"""
@@ -5,36 +5,52 @@ Savings serializers for savings accounts and transactions
 
 from rest_framework import serializers
 from .models import SavingsAccount, SavingsTransaction, SavingsGoal
+from utils.serializers import SparseFieldsetMixin
 
 
-class SavingsAccountSerializer(serializers.ModelSerializer):
+class SavingsAccountSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for savings accounts
     """
     progress_percentage = serializers.ReadOnlyField()
     remaining_to_target = serializers.ReadOnlyField()
+    pending_auto_save = serializers.SerializerMethodField()
+    available_balance = serializers.SerializerMethodField()
     
     class Meta:
         model = SavingsAccount
         fields = [
             'id', 'account_number', 'account_name', 'account_type',
-            'current_balance', 'minimum_balance', 'target_amount',
+            'current_balance', 'pending_auto_save', 'available_balance',
+            'minimum_balance', 'target_amount',
             'auto_save_enabled', 'auto_save_percentage', 'auto_save_minimum',
             'auto_save_maximum', 'interest_rate', 'total_interest_earned',
             'status', 'is_default', 'progress_percentage', 'remaining_to_target',
             'created_at'
         ]
         read_only_fields = [
-            'id', 'account_number', 'current_balance', 'total_interest_earned',
+            'id', 'account_number', 'current_balance', 'pending_auto_save',
+            'available_balance', 'total_interest_earned',
             'progress_percentage', 'remaining_to_target', 'created_at'
         ]
     
+    def get_pending_auto_save(self, obj):
+        # Annotated by the viewset queryset; fall back to a sum query
+        if not hasattr(obj, 'pending_auto_save'):
+            from .services import AutoSaveService
+            obj.pending_auto_save = AutoSaveService.pending_for(obj.pk)
+        return obj.pending_auto_save
+    
+    def get_available_balance(self, obj):
+        """Balance including auto-saves not yet settled"""
+        return obj.current_balance + self.get_pending_auto_save(obj)
+    
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class SavingsTransactionSerializer(serializers.ModelSerializer):
+class SavingsTransactionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for savings transactions
     """
@@ -56,7 +72,7 @@ class SavingsTransactionSerializer(serializers.ModelSerializer):
         ]
 
 
-class SavingsGoalSerializer(serializers.ModelSerializer):
+class SavingsGoalSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for savings goals
     """
@@ -0,0 +1,296 @@
+# backend/apps/savings/services.py
+"""
+Savings services
+Balance ledger, auto-save accrual from POS sales (settled in batches) and
+daily interest accrual
+"""
+
+from datetime import datetime, time
+from decimal import ROUND_DOWN, Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from utils.retention import keyset_batches
+
+from . import signals
+from .models import SavingsAccount, SavingsTransaction
+
+
+class SavingsLedgerService:
+    """
+    Every balance movement goes through ``post``.
+
+    The balance changes in one ``UPDATE ... SET current_balance =
+    current_balance + amount`` (debits only match while they keep the
+    minimum balance) and exactly one ledger row records the movement with
+    the balance the database produced, in the same transaction. The
+    balance is never read before it is written, so concurrent deposits to
+    one account queue on the row lock instead of overwriting each other.
+    """
+    
+    @classmethod
+    def post(cls, account, amount, transaction_type, reference='', notes='', processed_by=None):
+        """
+        Apply a signed ``amount`` to ``account`` and record it. Returns the
+        ledger row, or None when a debit would break the minimum balance.
+        """
+        if not amount:
+            return None
+        balance = SavingsAccount.objects.filter(pk=account.pk)
+        target = balance
+        if amount < 0:
+            target = balance.filter(current_balance__gte=F('minimum_balance') - amount)
+        
+        with transaction.atomic():
+            if not target.update(current_balance=F('current_balance') + amount, updated_at=timezone.now()):
+                return None
+            account.current_balance = balance.values_list('current_balance', flat=True).get()
+            entry = SavingsTransaction.objects.create(
+                savings_account=account,
+                transaction_type=transaction_type,
+                amount=amount,
+                reference=reference,
+                notes=notes,
+                processed_by=processed_by,
+                balance_before=account.current_balance - amount,
+                balance_after=account.current_balance,
+            )
+            cls.balance_changed(account)
+        return entry
+    
+    @classmethod
+    def credit(cls, account, amount, transaction_type='deposit', reference='', **kwargs):
+        return cls.post(account, abs(amount), transaction_type, reference, **kwargs)
+    
+    @classmethod
+    def debit(cls, account, amount, transaction_type='withdrawal', reference='', **kwargs):
+        return cls.post(account, -abs(amount), transaction_type, reference, **kwargs)
+    
+    @staticmethod
+    def balance_changed(account):
+        """The balance moved without save(); let balance listeners (alert rules) see it"""
+        signals.balance_changed.send(sender=SavingsAccount, instance=account)
+
+
+class AutoSaveService:
+    """
+    Auto-save from POS sales.
+    
+    A sale records its auto-save share and target account on the
+    Transaction row it inserts anyway (``auto_save_amount`` and
+    ``auto_save_account``), so the sale path writes nothing to the savings
+    tables. Those unsettled rows are the accrual buffer: ``settle_all``
+    credits each account once with their sum through the ledger, so one
+    ``auto_save`` row covers them all. Until then reads add the pending amount via
+    ``with_pending``.
+    """
+    
+    CACHE_TIMEOUT = 60 * 60
+    # Accruals to accounts in these states are released instead of credited
+    RELEASE_STATUSES = ['frozen', 'closed']
+    
+    @staticmethod
+    def _cache_key(user_id):
+        return f'auto_save:{user_id}'
+    
+    @classmethod
+    def terms(cls, user_id):
+        """Auto-save settings of the user's default account, or ``{}``"""
+        key = cls._cache_key(user_id)
+        terms = cache.get(key)
+        if terms is None:
+            account = SavingsAccount.objects.filter(
+                user_id=user_id, is_default=True, auto_save_enabled=True, status='active'
+            ).values('id', 'auto_save_percentage', 'auto_save_minimum', 'auto_save_maximum').first()
+            terms = {
+                'account_id': account['id'],
+                'percentage': account['auto_save_percentage'],
+                'minimum': account['auto_save_minimum'],
+                'maximum': account['auto_save_maximum'],
+            } if account else {}
+            cache.set(key, terms, cls.CACHE_TIMEOUT)
+        return terms
+    
+    @classmethod
+    def invalidate(cls, user_id):
+        cache.delete(cls._cache_key(user_id))
+    
+    @classmethod
+    def accrual_for(cls, user_id, amount):
+        """``(account_id, amount)`` to set aside from a sale of ``amount``"""
+        terms = cls.terms(user_id)
+        if not terms or amount < terms['minimum']:
+            return None, Decimal('0.00')
+        saved = min(amount * terms['percentage'] / 100, terms['maximum'])
+        saved = saved.quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+        if saved <= 0:
+            return None, Decimal('0.00')
+        return terms['account_id'], saved
+    
+    @staticmethod
+    def pending():
+        from apps.transactions.models import Transaction
+        return Transaction.objects.filter(
+            auto_save_account__isnull=False,
+            auto_save_entry__isnull=True,
+        )
+    
+    @classmethod
+    def with_pending(cls, queryset):
+        """Annotate accounts with ``pending_auto_save``, the unsettled accruals"""
+        pending = cls.pending().filter(auto_save_account=OuterRef('pk')).order_by().values(
+            'auto_save_account'
+        ).annotate(total=Sum('auto_save_amount')).values('total')
+        return queryset.annotate(pending_auto_save=Coalesce(
+            Subquery(pending), Value(Decimal('0.00')), output_field=DecimalField()
+        ))
+    
+    @classmethod
+    def pending_for(cls, account_id):
+        return cls.pending().filter(auto_save_account_id=account_id).aggregate(
+            total=Coalesce(Sum('auto_save_amount'), Value(Decimal('0.00')))
+        )['total']
+    
+    @classmethod
+    def release(cls, account_id):
+        """Drop an account's pending accruals without crediting them"""
+        return cls.pending().filter(auto_save_account_id=account_id).update(
+            auto_save_account=None, auto_save_amount=Decimal('0.00')
+        )
+    
+    @classmethod
+    def settle(cls, account_id):
+        """
+        Credit an account with its pending accruals: one UPDATE, one ledger
+        row. Accruals made before auto-save was turned off are still
+        credited; those of a frozen or closed account are released instead.
+        """
+        with transaction.atomic():
+            account = SavingsAccount.objects.select_for_update().filter(pk=account_id).first()
+            if account is None:
+                return None
+            if account.status in cls.RELEASE_STATUSES:
+                cls.release(account_id)
+                return None
+            pending = cls.pending().filter(auto_save_account_id=account_id)
+            rows = list(pending.values_list('id', 'auto_save_amount'))
+            if not rows:
+                return None
+            total = sum(amount for _, amount in rows)
+            
+            entry = SavingsLedgerService.credit(
+                account, total, 'auto_save', reference=f'Auto-save from {len(rows)} sales'
+            )
+            pending.filter(id__in=[pk for pk, _ in rows]).update(auto_save_entry=entry)
+        return entry
+    
+    @classmethod
+    def settle_all(cls):
+        """Settle every account that has pending accruals"""
+        account_ids = cls.pending().order_by().values_list('auto_save_account_id', flat=True).distinct()
+        settled = 0
+        for account_id in list(account_ids):
+            if cls.settle(account_id):
+                settled += 1
+        return settled
+
+
+class InterestAccrualService:
+    """
+    Daily interest accrual for every active interest-bearing account.
+    
+    Accounts due for accrual are walked in primary-key batches. Each batch
+    is locked and read in one query, interest is computed for the whole
+    batch with numpy (simple daily interest on the current balance for
+    every day since ``last_interest_calculation``, so missed days are
+    caught up in one posting), then one UPDATE credits every account and
+    one bulk_create writes their ``interest`` ledger rows.
+    
+    ``last_interest_calculation`` is moved to the accrual date in the same
+    UPDATE, so running again for the same date finds nothing to do. Every
+    credited account then gets the ledger's ``balance_changed`` signal.
+    Amounts that round to zero are left to accumulate more days.
+    """
+    
+    def __init__(self, batch_size=1000, accrual_date=None):
+        self.batch_size = batch_size
+        self.accrual_date = accrual_date or timezone.localdate()
+        self.accrued_at = timezone.make_aware(datetime.combine(self.accrual_date, time.min))
+    
+    def due(self):
+        return SavingsAccount.objects.filter(
+            Q(last_interest_calculation__lt=self.accrued_at)
+            | Q(last_interest_calculation__isnull=True, created_at__lt=self.accrued_at),
+            status='active',
+            interest_rate__gt=0,
+            current_balance__gt=0,
+        )
+    
+    def interest_cents(self, balances, rates, since):
+        """Interest in kobo for each account, from balance, annual rate and start date"""
+        days = (np.datetime64(self.accrual_date) - np.array(since, dtype='datetime64[D]')).astype(np.int64)
+        balances = np.rint(np.asarray(balances, dtype=float) * 100)
+        rates = np.asarray(rates, dtype=float)
+        return days, np.rint(balances * rates * np.maximum(days, 0) / 36500).astype(np.int64)
+    
+    def run_batch(self, pks):
+        with transaction.atomic():
+            rows = list(self.due().filter(pk__in=pks).select_for_update().values_list(
+                'id', 'current_balance', 'interest_rate', 'last_interest_calculation', 'created_at',
+                'user_id', 'account_name'
+            ))
+            if not rows:
+                return 0
+            ids, balances, rates, last, created, users, names = zip(*rows)
+            since = [timezone.localdate(accrued or opened) for accrued, opened in zip(last, created)]
+            days, cents = self.interest_cents(balances, rates, since)
+            
+            accrued = np.flatnonzero(cents > 0)
+            if not len(accrued):
+                return 0
+            amounts = {ids[i]: Decimal(int(cents[i])).scaleb(-2) for i in accrued}
+            interest = Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+                output_field=DecimalField(max_digits=15, decimal_places=2)
+            )
+            SavingsAccount.objects.filter(pk__in=amounts).update(
+                current_balance=F('current_balance') + interest,
+                total_interest_earned=F('total_interest_earned') + interest,
+                last_interest_calculation=self.accrued_at,
+                updated_at=timezone.now(),
+            )
+            
+            entries = [
+                SavingsTransaction(
+                    savings_account_id=ids[i],
+                    transaction_type='interest',
+                    amount=amounts[ids[i]],
+                    reference=f'Interest to {self.accrual_date:%Y-%m-%d}',
+                    notes=f'{days[i]} day(s) at {rates[i]}% p.a.',
+                    balance_before=balances[i],
+                    balance_after=balances[i] + amounts[ids[i]],
+                )
+                for i in accrued
+            ]
+            for entry in entries:
+                entry.transaction_reference = entry.make_reference()
+            SavingsTransaction.objects.bulk_create(entries, batch_size=self.batch_size)
+            
+            for i in accrued:
+                SavingsLedgerService.balance_changed(SavingsAccount(
+                    id=ids[i], user_id=users[i], account_name=names[i],
+                    current_balance=balances[i] + amounts[ids[i]],
+                ))
+        return len(entries)
+    
+    def run(self):
+        checked = accrued = 0
+        for pks in keyset_batches(self.due(), ('id',), self.batch_size):
+            accrued += self.run_batch(pks)
+            checked += len(pks)
+        return {'checked': checked, 'accrued': accrued}
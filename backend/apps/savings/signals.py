@@ -0,0 +1,11 @@
+# backend/apps/savings/signals.py
+"""
+Signals sent by the savings ledger
+"""
+
+from django.dispatch import Signal
+
+# Sent with ``sender=SavingsAccount`` and ``instance`` after the ledger moves
+# an account's balance with an UPDATE rather than save(); the instance's
+# ``current_balance`` is the balance the database produced
+balance_changed = Signal()
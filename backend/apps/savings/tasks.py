@@ -0,0 +1,20 @@
+# backend/apps/savings/tasks.py
+"""
+Background tasks for savings
+"""
+
+from celery import shared_task
+
+from .services import AutoSaveService, InterestAccrualService
+
+
+@shared_task
+def settle_auto_saves():
+    """Credit pending auto-saves, one ledger row per account (run by beat)"""
+    return AutoSaveService.settle_all()
+
+
+@shared_task
+def accrue_savings_interest():
+    """Post interest up to today on every interest-bearing account (run daily by beat)"""
+    return InterestAccrualService().run()
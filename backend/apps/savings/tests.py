@@ -1,3 +1,402 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Product, ProductCategory
+from apps.transactions.models import Transaction, TransactionCategory
+from apps.users.models import User
+from .models import SavingsAccount, SavingsGoal, SavingsTransaction
+from .services import AutoSaveService, InterestAccrualService
+from .signals import balance_changed
+
+
+class SavingsQueryCountTests(TestCase):
+    """List endpoints must not issue a query per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='saver@example.com', username='saver', password='pass',
+            phone_number='08030000005', first_name='Efe', last_name='Okoro'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_accounts(self, count):
+        for index in range(count):
+            account = SavingsAccount.objects.create(user=self.user, account_name=f'Account {index}')
+            SavingsTransaction.objects.create(
+                savings_account=account, transaction_type='deposit',
+                amount=Decimal('1000.00'), balance_after=Decimal('1000.00')
+            )
+            SavingsGoal.objects.create(
+                savings_account=account, name='New freezer', target_amount=Decimal('150000'),
+                target_date=timezone.now().date() + timedelta(days=90)
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.create_accounts(2)
+        small = self.count_queries(url)
+        self.create_accounts(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_account_list(self):
+        self.assertConstantQueries('/api/savings/accounts/')
+
+    def test_transaction_list(self):
+        self.assertConstantQueries('/api/savings/transactions/')
+
+    def test_deposits_action(self):
+        self.assertConstantQueries('/api/savings/transactions/deposits/')
+
+    def test_goal_list(self):
+        self.assertConstantQueries('/api/savings/goals/')
+
+
+class AutoSaveTests(TestCase):
+    """Sales accrue auto-saves on their own row; settlement credits them in one step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='saver@example.com', username='saver', password='pass',
+            phone_number='08030000005', first_name='Efe', last_name='Okoro'
+        )
+        cls.category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        cls.item = Product.objects.create(
+            user=cls.user, category=ProductCategory.objects.create(
+                name='Provisions', category_type='food_beverages'
+            ),
+            name='Milo', cost_price=Decimal('400.00'), selling_price=Decimal('500.00'),
+            current_stock=Decimal('1000')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.account = SavingsAccount.objects.create(
+            user=self.user, account_name='Shop savings', is_default=True,
+            auto_save_enabled=True, auto_save_percentage=Decimal('10.00'),
+            auto_save_minimum=Decimal('100.00'), auto_save_maximum=Decimal('200.00'),
+            current_balance=Decimal('1000.00')
+        )
+
+    def sell(self, quantity=1):
+        response = self.client.post('/api/transactions/transactions/', {
+            'transaction_category': self.category.id,
+            'transaction_type': 'sale',
+            'payment_method': 'cash',
+            'items': [{'product_id': str(self.item.id), 'quantity': quantity}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Transaction.objects.latest('transaction_date')
+
+    def account_data(self):
+        return self.client.get(f'/api/savings/accounts/{self.account.id}/').data
+
+    def test_sale_writes_nothing_to_savings(self):
+        self.sell()
+        with CaptureQueriesContext(connection) as context:
+            sale = self.sell()
+        self.assertEqual(sale.auto_save_amount, Decimal('50.00'))
+        self.assertEqual(sale.auto_save_account_id, self.account.id)
+
+        statements = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([sql for sql in statements if '"savings_' in sql])
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE "transactions"')]), 0)
+
+    def test_accrual_respects_minimum_and_maximum(self):
+        self.assertEqual(AutoSaveService.accrual_for(self.user.id, Decimal('99')), (None, Decimal('0.00')))
+        self.assertEqual(
+            AutoSaveService.accrual_for(self.user.id, Decimal('5000')), (self.account.id, Decimal('200.00'))
+        )
+
+    def test_pending_is_visible_until_settled(self):
+        self.sell()
+        self.sell(2)
+        data = self.account_data()
+        self.assertEqual(data['current_balance'], '1000.00')
+        self.assertEqual(data['pending_auto_save'], Decimal('150.00'))
+        self.assertEqual(data['available_balance'], Decimal('1150.00'))
+
+        self.assertEqual(AutoSaveService.settle_all(), 1)
+        entry = SavingsTransaction.objects.get(transaction_type='auto_save')
+        self.assertEqual(
+            (entry.amount, entry.balance_before, entry.balance_after),
+            (Decimal('150.00'), Decimal('1000.00'), Decimal('1150.00'))
+        )
+        self.assertEqual(entry.source_transactions.count(), 2)
+
+        data = self.account_data()
+        self.assertEqual(data['current_balance'], '1150.00')
+        self.assertEqual(data['pending_auto_save'], Decimal('0.00'))
+        self.assertEqual(AutoSaveService.settle_all(), 0)
+
+    def test_withdraw_settles_pending_first(self):
+        self.sell(2)
+        response = self.client.post(
+            f'/api/savings/accounts/{self.account.id}/withdraw/', {'amount': '1100'}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('0.00'))
+
+    def test_inactive_account_releases_pending_accruals(self):
+        sale = self.sell(2)
+        self.account.status = 'frozen'
+        self.account.save()
+
+        self.assertEqual(AutoSaveService.settle_all(), 0)
+        self.assertFalse(SavingsTransaction.objects.filter(transaction_type='auto_save').exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('1000.00'))
+        sale.refresh_from_db()
+        self.assertEqual((sale.auto_save_account_id, sale.auto_save_amount), (None, Decimal('0.00')))
+        self.assertEqual(self.sell().auto_save_amount, Decimal('0.00'))
+
+    def test_disabled_auto_save_still_settles_earlier_accruals(self):
+        self.sell(2)
+        self.account.auto_save_enabled = False
+        self.account.save()
+        self.assertEqual(self.sell().auto_save_amount, Decimal('0.00'))
+
+        self.assertEqual(AutoSaveService.settle_all(), 1)
+        self.assertEqual(SavingsTransaction.objects.get(transaction_type='auto_save').amount, Decimal('100.00'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.current_balance, Decimal('1100.00'))
+        self.assertEqual(AutoSaveService.pending_for(self.account.id), Decimal('0.00'))
+
+    def test_disabling_auto_save_refreshes_cached_terms(self):
+        self.sell()
+        self.account.auto_save_enabled = False
+        self.account.save()
+        self.assertEqual(self.sell().auto_save_amount, Decimal('0.00'))
+
+
+class SavingsLedgerTests(TestCase):
+    """Balances move with F() updates and every movement has exactly one ledger row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='saver@example.com', username='saver', password='pass',
+            phone_number='08030000005', first_name='Efe', last_name='Okoro'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.account = SavingsAccount.objects.create(
+            user=self.user, account_name='Shop savings', minimum_balance=Decimal('100.00')
+        )
+
+    def assertLedgerConsistent(self):
+        self.account.refresh_from_db()
+        entries = list(self.account.transactions.order_by('created_at'))
+        for entry in entries:
+            self.assertEqual(entry.balance_before + entry.amount, entry.balance_after)
+        self.assertEqual(sum(entry.amount for entry in entries), self.account.current_balance)
+
+    def test_deposit_and_withdraw_write_one_row_each(self):
+        url = f'/api/savings/accounts/{self.account.id}/'
+        self.assertEqual(self.client.post(url + 'deposit/', {'amount': '1000'}).status_code, 200)
+        response = self.client.post(url + 'withdraw/', {'amount': '400'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_balance'], '600.00')
+
+        self.assertEqual(
+            list(self.account.transactions.order_by('created_at').values_list('transaction_type', 'amount')),
+            [('deposit', Decimal('1000.00')), ('withdrawal', Decimal('-400.00'))]
+        )
+        self.assertLedgerConsistent()
+
+    def test_concurrent_deposits_are_not_lost(self):
+        # Two requests holding the same stale copy of the account
+        first = SavingsAccount.objects.get(pk=self.account.pk)
+        second = SavingsAccount.objects.get(pk=self.account.pk)
+        first.add_funds(Decimal('300'))
+        second.add_funds(Decimal('200'))
+        self.assertEqual(second.current_balance, Decimal('500.00'))
+        self.assertLedgerConsistent()
+
+    def test_withdrawal_checks_minimum_balance_in_the_update(self):
+        self.account.add_funds(Decimal('1000'))
+        stale = SavingsAccount.objects.get(pk=self.account.pk)
+        self.account.withdraw_funds(Decimal('700'))
+
+        # The stale copy still sees 1000, the database only 300
+        self.assertTrue(stale.can_withdraw(Decimal('500')))
+        self.assertFalse(stale.withdraw_funds(Decimal('500')))
+        self.assertEqual(self.account.transactions.count(), 2)
+        self.assertLedgerConsistent()
+
+    def test_ledger_sends_balance_changed_not_post_save(self):
+        saved, changed = mock.Mock(), mock.Mock()
+        post_save.connect(saved, sender=SavingsAccount)
+        balance_changed.connect(changed, sender=SavingsAccount)
+        self.addCleanup(post_save.disconnect, saved, sender=SavingsAccount)
+        self.addCleanup(balance_changed.disconnect, changed, sender=SavingsAccount)
+
+        stale = SavingsAccount.objects.get(pk=self.account.pk)
+        self.account.add_funds(Decimal('300'))
+        stale.add_funds(Decimal('200'))
+        saved.assert_not_called()
+        self.assertEqual(changed.call_count, 2)
+        self.assertEqual(changed.call_args.kwargs['instance'].current_balance, Decimal('500.00'))
+
+
+class InterestAccrualTests(TestCase):
+    """Interest is posted in set-based batches, once per accrual date"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='saver@example.com', username='saver', password='pass',
+            phone_number='08030000005', first_name='Efe', last_name='Okoro'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+
+    def account(self, balance='36500.00', rate='10.00', days_ago=1, **extra):
+        return SavingsAccount.objects.create(
+            user=self.user, account_name='Shop savings', current_balance=Decimal(balance),
+            interest_rate=Decimal(rate),
+            last_interest_calculation=timezone.now() - timedelta(days=days_ago), **extra
+        )
+
+    def test_catches_up_missed_days_once(self):
+        account = self.account(days_ago=3)
+        result = InterestAccrualService().run()
+        self.assertEqual(result, {'checked': 1, 'accrued': 1})
+
+        account.refresh_from_db()
+        self.assertEqual(account.current_balance, Decimal('36530.00'))
+        self.assertEqual(account.total_interest_earned, Decimal('30.00'))
+        self.assertEqual(timezone.localdate(account.last_interest_calculation), self.today)
+        entry = account.transactions.get()
+        self.assertEqual(
+            (entry.transaction_type, entry.amount, entry.balance_before, entry.balance_after),
+            ('interest', Decimal('30.00'), Decimal('36500.00'), Decimal('36530.00'))
+        )
+
+        # Same accrual date again: nothing to do
+        self.assertEqual(InterestAccrualService().run(), {'checked': 0, 'accrued': 0})
+        self.assertEqual(account.transactions.count(), 1)
+
+    def test_skips_ineligible_accounts(self):
+        self.account(rate='0.00')
+        self.account(balance='0.00')
+        self.account(status='frozen')
+        # Rounds to zero: left to accumulate more days
+        small = self.account(balance='10.00')
+        self.assertEqual(InterestAccrualService().run(), {'checked': 1, 'accrued': 0})
+        small.refresh_from_db()
+        self.assertLess(timezone.localdate(small.last_interest_calculation), self.today)
+
+    def test_interest_postings_send_balance_changed(self):
+        credited = self.account(days_ago=3)
+        self.account(balance='10.00')
+        changed = mock.Mock()
+        balance_changed.connect(changed, sender=SavingsAccount)
+        self.addCleanup(balance_changed.disconnect, changed, sender=SavingsAccount)
+
+        InterestAccrualService().run()
+        changed.assert_called_once()
+        account = changed.call_args.kwargs['instance']
+        self.assertEqual((account.id, account.user_id), (credited.id, self.user.id))
+        self.assertEqual(account.current_balance, Decimal('36530.00'))
+
+    def test_queries_per_batch(self):
+        for _ in range(5):
+            self.account()
+        # Per batch of 2: page of ids, then in a savepoint the locked read,
+        # one UPDATE and one INSERT (balance listeners find the alert rules
+        # cached when the accounts were created)
+        with self.assertNumQueries(3 * 6):
+            result = InterestAccrualService(batch_size=2).run()
+        self.assertEqual(result, {'checked': 5, 'accrued': 5})
+
+
+class SavingsSummaryTests(TestCase):
+    """Summary endpoints aggregate in the database with a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='saver@example.com', username='saver', password='pass',
+            phone_number='08030000005', first_name='Efe', last_name='Okoro'
+        )
+        cls.account = SavingsAccount.objects.create(
+            user=cls.user, account_name='Shop savings', auto_save_enabled=True,
+            auto_save_percentage=Decimal('10.00'), target_amount=Decimal('5000.00')
+        )
+        cls.account.add_funds(Decimal('1000'))
+        cls.account.add_funds(Decimal('200'), 'auto_save')
+        cls.account.withdraw_funds(Decimal('300'))
+        SavingsAccount.objects.create(user=cls.user, account_name='Rent', status='frozen')
+        for target, current in (('1000', '250'), ('2000', '2000')):
+            SavingsGoal.objects.create(
+                savings_account=cls.account, name='Goal', target_amount=Decimal(target),
+                current_amount=Decimal(current), target_date=timezone.now().date() + timedelta(days=10)
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_transaction_summary(self):
+        with CaptureQueriesContext(connection) as short:
+            response = self.client.get('/api/savings/transactions/summary/?days=7')
+        data = response.data
+        self.assertEqual(data['total_transactions'], 3)
+        self.assertEqual(data['total_deposits'], Decimal('1200.00'))
+        self.assertEqual(data['total_withdrawals'], Decimal('300.00'))
+        self.assertEqual(data['net_flow'], Decimal('900.00'))
+        self.assertEqual(data['transactions_by_type']['auto_save'], {'count': 1, 'amount': Decimal('200.00')})
+        self.assertEqual(data['transactions_by_type']['interest']['count'], 0)
+        self.assertEqual(len(data['daily_breakdown']), 7)
+        self.assertEqual(data['daily_breakdown'][0]['net_flow'], Decimal('900.00'))
+        self.assertEqual(data['daily_breakdown'][0]['transactions_count'], 3)
+
+        with self.assertNumQueries(len(short.captured_queries)):
+            self.client.get('/api/savings/transactions/summary/?days=90')
+
+    def test_account_dashboard_stats(self):
+        data = self.client.get('/api/savings/accounts/dashboard_stats/').data
+        self.assertEqual(data['total_accounts'], 2)
+        self.assertEqual(data['active_accounts'], 1)
+        self.assertEqual(data['total_balance'], Decimal('900.00'))
+        self.assertEqual(data['auto_save_enabled'], 1)
+        self.assertEqual(data['accounts_with_targets'], 1)
+        self.assertEqual(data['total_target_amount'], Decimal('5000.00'))
+        self.assertEqual(data['monthly_auto_save'], Decimal('90.00'))
 
-# Create your tests here.
+    def test_goal_dashboard_stats(self):
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get('/api/savings/goals/dashboard_stats/').data
+        self.assertEqual(data['total_goals'], 2)
+        self.assertEqual(data['active_goals'], 2)
+        self.assertEqual(data['total_remaining'], Decimal('750.00'))
+        self.assertAlmostEqual(float(data['average_progress']), 62.5)
+        self.assertEqual(data['goals_due_soon'], 2)
+        # Authentication aside, one aggregate query
+        self.assertEqual(len(context.captured_queries), 1)
@@ -6,8 +6,8 @@ Savings management API views for savings accounts, transactions, and goals
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q, Sum, Count
+from django.db.models import Avg, Case, Count, DecimalField, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate
 from django.utils import timezone
 from django.db import transaction as db_transaction
 from datetime import datetime, timedelta
@@ -19,16 +19,12 @@ from .serializers import (
     SavingsTransactionSerializer,
     SavingsGoalSerializer
 )
+from .services import AutoSaveService
+from utils.export import StreamingExportMixin
+from utils.pagination import PaginatedActionsMixin, StandardResultsSetPagination
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for savings views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class SavingsAccountViewSet(viewsets.ModelViewSet):
+class SavingsAccountViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing savings accounts
     """
@@ -39,7 +35,9 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter savings accounts by user"""
-        return SavingsAccount.objects.filter(user=self.request.user).order_by('-is_default', 'account_name')
+        return AutoSaveService.with_pending(
+            SavingsAccount.objects.filter(user=self.request.user)
+        ).order_by('-is_default', 'account_name')
     
     def perform_create(self, serializer):
         """Set user when creating savings account"""
@@ -49,8 +47,7 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get active savings accounts"""
         accounts = self.get_queryset().filter(status='active')
-        serializer = self.get_serializer(accounts, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(accounts)
     
     @action(detail=True, methods=['post'])
     def deposit(self, request, pk=None):
@@ -72,18 +69,7 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        account.add_funds(amount, 'deposit', reference)
-        
-        # Create transaction record
-        SavingsTransaction.objects.create(
-            savings_account=account,
-            transaction_type='deposit',
-            amount=amount,
-            reference=reference,
-            balance_after=account.current_balance,
-            notes=notes,
-            processed_by=request.user
-        )
+        account.add_funds(amount, 'deposit', reference, notes=notes, processed_by=request.user)
         
         serializer = self.get_serializer(account)
         return Response(serializer.data)
@@ -108,26 +94,23 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Pending auto-saves become withdrawable once credited
+        if account.pending_auto_save:
+            AutoSaveService.settle(account.pk)
+            account = self.get_object()
+        
         if not account.can_withdraw(amount):
             return Response(
                 {'error': 'Insufficient funds or below minimum balance'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        success = account.withdraw_funds(amount, 'withdrawal', reference)
+        # The balance check is repeated in the UPDATE itself
+        success = account.withdraw_funds(
+            amount, 'withdrawal', reference, notes=notes, processed_by=request.user
+        )
         
         if success:
-            # Create transaction record
-            SavingsTransaction.objects.create(
-                savings_account=account,
-                transaction_type='withdrawal',
-                amount=-amount,
-                reference=reference,
-                balance_after=account.current_balance,
-                notes=notes,
-                processed_by=request.user
-            )
-            
             serializer = self.get_serializer(account)
             return Response(serializer.data)
         else:
@@ -140,7 +123,7 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
     def transactions(self, request, pk=None):
         """Get savings account transactions"""
         account = self.get_object()
-        transactions = account.transactions.all().order_by('-transaction_date')
+        transactions = account.transactions.select_related('savings_account').order_by('-transaction_date')
         
         # Filter by date range
         start_date = request.query_params.get('start_date', None)
@@ -150,8 +133,7 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
         if end_date:
             transactions = transactions.filter(transaction_date__date__lte=end_date)
         
-        serializer = SavingsTransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(transactions, SavingsTransactionSerializer)
     
     @action(detail=True, methods=['post'])
     def set_default(self, request, pk=None):
@@ -171,26 +153,28 @@ class SavingsAccountViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
         """Get savings dashboard statistics"""
-        accounts = self.get_queryset()
-        
-        stats = {
-            'total_accounts': accounts.count(),
-            'active_accounts': accounts.filter(status='active').count(),
-            'total_balance': sum(account.current_balance for account in accounts),
-            'total_interest_earned': sum(account.total_interest_earned for account in accounts),
-            'auto_save_enabled': accounts.filter(auto_save_enabled=True).count(),
-            'accounts_with_targets': accounts.filter(target_amount__gt=0).count(),
-            'total_target_amount': sum(account.target_amount for account in accounts if account.target_amount),
-            'monthly_auto_save': sum(
-                account.current_balance * account.auto_save_percentage / 100 
-                for account in accounts.filter(auto_save_enabled=True)
-            )
-        }
+        zero = Value(Decimal('0.00'))
+        auto_save = Q(auto_save_enabled=True)
+        stats = SavingsAccount.objects.filter(user=request.user).aggregate(
+            total_accounts=Count('id'),
+            active_accounts=Count('id', filter=Q(status='active')),
+            total_balance=Coalesce(Sum('current_balance'), zero),
+            total_interest_earned=Coalesce(Sum('total_interest_earned'), zero),
+            auto_save_accounts=Count('id', filter=auto_save),
+            accounts_with_targets=Count('id', filter=Q(target_amount__gt=0)),
+            total_target_amount=Coalesce(Sum('target_amount'), zero),
+            monthly_auto_save=Coalesce(Sum(
+                F('current_balance') * F('auto_save_percentage') / 100,
+                filter=auto_save, output_field=DecimalField()
+            ), zero),
+        )
+        # Aggregated under another name, which would shadow the field
+        stats['auto_save_enabled'] = stats.pop('auto_save_accounts')
         
         return Response(stats)
 
 
-class SavingsTransactionViewSet(viewsets.ModelViewSet):
+class SavingsTransactionViewSet(PaginatedActionsMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing savings transactions
     """
@@ -198,41 +182,70 @@ class SavingsTransactionViewSet(viewsets.ModelViewSet):
     serializer_class = SavingsTransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-transaction_date', '-id')
+    
+    export_ordering = ('transaction_date', 'id')
+    export_filename = 'savings-ledger'
+    export_columns = [
+        ('id', 'id'),
+        ('transaction_date', 'transaction_date'),
+        ('account_number', 'savings_account__account_number'),
+        ('transaction_reference', 'transaction_reference'),
+        ('transaction_type', 'transaction_type'),
+        ('amount', 'amount'),
+        ('balance_before', 'balance_before'),
+        ('balance_after', 'balance_after'),
+        ('reference', 'reference'),
+        ('source_transaction_id', 'source_transaction_id'),
+        ('status', 'status'),
+    ]
     
     def get_queryset(self):
         """Filter savings transactions by user's accounts"""
         return SavingsTransaction.objects.filter(
             savings_account__user=self.request.user
-        ).order_by('-transaction_date')
+        ).select_related('savings_account').order_by('-transaction_date')
+    
+    def get_export_queryset(self):
+        """Apply export filters: date range, transaction type and account"""
+        queryset = self.get_queryset()
+        params = self.request.query_params
+        
+        if params.get('start_date'):
+            queryset = queryset.filter(transaction_date__date__gte=params['start_date'])
+        if params.get('end_date'):
+            queryset = queryset.filter(transaction_date__date__lte=params['end_date'])
+        if params.get('type'):
+            queryset = queryset.filter(transaction_type=params['type'])
+        if params.get('account'):
+            queryset = queryset.filter(savings_account_id=params['account'])
+        
+        return queryset
     
     @action(detail=False, methods=['get'])
     def deposits(self, request):
         """Get deposit transactions"""
         deposits = self.get_queryset().filter(amount__gt=0)
-        serializer = self.get_serializer(deposits, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(deposits)
     
     @action(detail=False, methods=['get'])
     def withdrawals(self, request):
         """Get withdrawal transactions"""
         withdrawals = self.get_queryset().filter(amount__lt=0)
-        serializer = self.get_serializer(withdrawals, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(withdrawals)
     
     @action(detail=False, methods=['get'])
     def auto_saves(self, request):
         """Get auto-save transactions"""
         auto_saves = self.get_queryset().filter(transaction_type='auto_save')
-        serializer = self.get_serializer(auto_saves, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(auto_saves)
     
     @action(detail=False, methods=['get'])
     def today(self, request):
         """Get today's transactions"""
         today = timezone.now().date()
         transactions = self.get_queryset().filter(transaction_date__date=today)
-        serializer = self.get_serializer(transactions, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(transactions)
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
@@ -240,35 +253,57 @@ class SavingsTransactionViewSet(viewsets.ModelViewSet):
         days = int(request.query_params.get('days', 30))
         since_date = timezone.now() - timedelta(days=days)
         
-        transactions = self.get_queryset().filter(transaction_date__gte=since_date)
+        transactions = self.get_queryset().filter(transaction_date__gte=since_date).order_by()
+        zero = Value(Decimal('0.00'))
+        credits = Coalesce(Sum('amount', filter=Q(amount__gt=0)), zero)
+        debits = Coalesce(Sum('amount', filter=Q(amount__lt=0)), zero)
+        
+        totals = transactions.aggregate(
+            total_transactions=Count('id'),
+            total_deposits=credits,
+            total_withdrawals=debits,
+            net_flow=Coalesce(Sum('amount'), zero),
+        )
+        by_type = {
+            row['transaction_type']: row
+            for row in transactions.values('transaction_type').annotate(
+                count=Count('id'), amount=Sum('amount')
+            )
+        }
+        by_day = {
+            row['date']: row
+            for row in transactions.annotate(date=TruncDate('transaction_date')).values('date').annotate(
+                deposits=credits, withdrawals=debits, transactions_count=Count('id')
+            )
+        }
         
         summary = {
-            'total_transactions': transactions.count(),
-            'total_deposits': sum(t.amount for t in transactions.filter(amount__gt=0)),
-            'total_withdrawals': abs(sum(t.amount for t in transactions.filter(amount__lt=0))),
-            'net_flow': sum(t.amount for t in transactions),
+            'total_transactions': totals['total_transactions'],
+            'total_deposits': totals['total_deposits'],
+            'total_withdrawals': abs(totals['total_withdrawals']),
+            'net_flow': totals['net_flow'],
             'transactions_by_type': {},
             'daily_breakdown': []
         }
         
         # Transactions by type
         for transaction_type, _ in SavingsTransaction.TRANSACTION_TYPES:
-            type_transactions = transactions.filter(transaction_type=transaction_type)
+            row = by_type.get(transaction_type, {})
             summary['transactions_by_type'][transaction_type] = {
-                'count': type_transactions.count(),
-                'amount': sum(t.amount for t in type_transactions)
+                'count': row.get('count', 0),
+                'amount': row.get('amount', Decimal('0.00'))
             }
         
         # Daily breakdown
         for i in range(days):
             date = (timezone.now() - timedelta(days=i)).date()
-            day_transactions = transactions.filter(transaction_date__date=date)
+            row = by_day.get(date, {})
             
             daily_data = {
                 'date': date,
-                'deposits': sum(t.amount for t in day_transactions.filter(amount__gt=0)),
-                'withdrawals': abs(sum(t.amount for t in day_transactions.filter(amount__lt=0))),
-                'transactions_count': day_transactions.count()
+                'deposits': row.get('deposits', Decimal('0.00')),
+                'withdrawals': abs(row.get('withdrawals', Decimal('0.00'))),
+                'transactions_count': row.get('transactions_count', 0)
             }
             daily_data['net_flow'] = daily_data['deposits'] - daily_data['withdrawals']
             summary['daily_breakdown'].append(daily_data)
@@ -276,7 +311,7 @@ class SavingsTransactionViewSet(viewsets.ModelViewSet):
         return Response(summary)
 
 
-class SavingsGoalViewSet(viewsets.ModelViewSet):
+class SavingsGoalViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing savings goals
     """
@@ -289,7 +324,7 @@ class SavingsGoalViewSet(viewsets.ModelViewSet):
         """Filter savings goals by user's accounts"""
         return SavingsGoal.objects.filter(
             savings_account__user=self.request.user
-        ).order_by('-created_at')
+        ).select_related('savings_account').order_by('-created_at')
     
     def perform_create(self, serializer):
         """Set processed_by when creating goal"""
@@ -299,15 +334,13 @@ class SavingsGoalViewSet(viewsets.ModelViewSet):
     def active(self, request):
         """Get active savings goals"""
         goals = self.get_queryset().filter(status='active')
-        serializer = self.get_serializer(goals, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(goals)
     
     @action(detail=False, methods=['get'])
     def completed(self, request):
         """Get completed savings goals"""
         goals = self.get_queryset().filter(status='completed')
-        serializer = self.get_serializer(goals, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(goals)
     
     @action(detail=True, methods=['post'])
     def contribute(self, request, pk=None):
@@ -343,18 +376,9 @@ class SavingsGoalViewSet(viewsets.ModelViewSet):
             goal.save()
             
             # Add funds to savings account
-            account = goal.savings_account
-            account.add_funds(amount, 'deposit', reference)
-            
-            # Create transaction record
-            SavingsTransaction.objects.create(
-                savings_account=account,
-                transaction_type='deposit',
-                amount=amount,
-                reference=reference,
-                balance_after=account.current_balance,
-                notes=f"Contribution to goal: {goal.name}",
-                processed_by=request.user
+            goal.savings_account.add_funds(
+                amount, 'deposit', reference,
+                notes=f"Contribution to goal: {goal.name}", processed_by=request.user
             )
         
         serializer = self.get_serializer(goal)
@@ -397,21 +421,29 @@ class SavingsGoalViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
         """Get savings goals dashboard statistics"""
-        goals = self.get_queryset()
-        
-        stats = {
-            'total_goals': goals.count(),
-            'active_goals': goals.filter(status='active').count(),
-            'completed_goals': goals.filter(status='completed').count(),
-            'paused_goals': goals.filter(status='paused').count(),
-            'total_target_amount': sum(goal.target_amount for goal in goals),
-            'total_current_amount': sum(goal.current_amount for goal in goals),
-            'total_remaining': sum(goal.remaining_amount for goal in goals),
-            'average_progress': sum(goal.progress_percentage for goal in goals) / goals.count() if goals.count() > 0 else 0,
-            'goals_due_soon': goals.filter(
+        zero = Value(Decimal('0.00'))
+        progress = Case(
+            When(target_amount__gt=0, then=Least(
+                F('current_amount') * 100 / F('target_amount'), Value(Decimal('100'))
+            )),
+            default=zero,
+            output_field=DecimalField()
+        )
+        stats = self.get_queryset().order_by().aggregate(
+            total_goals=Count('id'),
+            active_goals=Count('id', filter=Q(status='active')),
+            completed_goals=Count('id', filter=Q(status='completed')),
+            paused_goals=Count('id', filter=Q(status='paused')),
+            total_target_amount=Coalesce(Sum('target_amount'), zero),
+            total_current_amount=Coalesce(Sum('current_amount'), zero),
+            total_remaining=Coalesce(Sum(
+                Greatest(F('target_amount') - F('current_amount'), zero), output_field=DecimalField()
+            ), zero),
+            average_progress=Coalesce(Avg(progress, output_field=FloatField()), Value(0.0)),
+            goals_due_soon=Count('id', filter=Q(
                 status='active',
                 target_date__lte=timezone.now().date() + timedelta(days=30)
-            ).count()
-        }
+            )),
+        )
         
-        return Response(stats)
\ No newline at end of file
+        return Response(stats)
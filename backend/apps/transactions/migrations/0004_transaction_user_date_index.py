@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0003_transactioncategory_alter_transaction_options_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "transaction_date", "id"],
+                name="transaction_user_id_cd515b_idx",
+            ),
+        ),
+    ]
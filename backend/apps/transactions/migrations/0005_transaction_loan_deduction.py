@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0004_loan_portfolio_summary"),
+        ("transactions", "0004_transaction_user_date_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="loan_deduction_amount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="loan_repayment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="deducted_transactions",
+                to="loans.loanrepayment",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(
+                    ("loan_deduction_amount__gt", 0), ("loan_repayment__isnull", True)
+                ),
+                fields=["user", "transaction_date"],
+                name="transactions_unsettled_loan",
+            ),
+        ),
+    ]
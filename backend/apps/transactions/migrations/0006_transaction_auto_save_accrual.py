@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0004_loan_portfolio_summary"),
+        ("savings", "0003_savingstransaction_savings_tra_transac_e27944_idx"),
+        ("transactions", "0005_transaction_loan_deduction"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="auto_save_account",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="auto_save_sources",
+                to="savings.savingsaccount",
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="auto_save_entry",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="source_transactions",
+                to="savings.savingstransaction",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(
+                    ("auto_save_account__isnull", False),
+                    ("auto_save_entry__isnull", True),
+                ),
+                fields=["auto_save_account"],
+                name="transactions_unsettled_save",
+            ),
+        ),
+    ]
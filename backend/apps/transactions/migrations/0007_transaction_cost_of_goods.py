@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0006_transaction_auto_save_accrual"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="cost_of_goods",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                help_text="Cost price of the items sold, recorded with the sale",
+                max_digits=15,
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_cost_of_goods(apps, schema_editor):
+    """Sales recorded before cost_of_goods existed take it from their items"""
+    Transaction = apps.get_model("transactions", "Transaction")
+    TransactionItem = apps.get_model("transactions", "TransactionItem")
+    cost = TransactionItem.objects.filter(transaction=models.OuterRef("pk")).order_by().values(
+        "transaction"
+    ).annotate(
+        total=models.Sum(
+            models.F("unit_cost") * models.F("quantity"),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        )
+    ).values("total")
+    Transaction.objects.filter(transaction_type="sale", cost_of_goods=0).update(
+        cost_of_goods=Coalesce(
+            models.Subquery(cost), models.Value(Decimal("0.00")),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0007_transaction_cost_of_goods"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_cost_of_goods, migrations.RunPython.noop),
+    ]
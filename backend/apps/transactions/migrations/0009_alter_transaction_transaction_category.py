@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Records the transaction_category default the model already declared but no
+# migration captured. The default is applied by Django, not the database, so
+# PostgreSQL runs no SQL for it.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0008_fill_transaction_cost_of_goods"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_category",
+            field=models.ForeignKey(
+                default="cashflow",
+                help_text="Select category FIRST",
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="transactions",
+                to="transactions.transactioncategory",
+            ),
+        ),
+    ]
@@ -10,6 +10,7 @@ Complete Transaction System with:
 import uuid
 from decimal import Decimal
 from datetime import datetime
+from django.apps import apps as django_apps
 from django.db import models, transaction as db_transaction
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
@@ -110,6 +111,12 @@ class Transaction(models.Model):
     tax_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     discount_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    cost_of_goods = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        help_text='Cost price of the items sold, recorded with the sale'
+    )
     
     # Payment
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS)
@@ -134,8 +141,32 @@ class Transaction(models.Model):
     journal_entry_created = models.BooleanField(default=False)
     journal_entry_reference = models.CharField(max_length=100, blank=True)
     
-    # Auto-save
+    # Auto-save, credited to the account in batches (see AutoSaveService)
     auto_save_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    auto_save_account = models.ForeignKey(
+        'savings.SavingsAccount',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='auto_save_sources'
+    )
+    auto_save_entry = models.ForeignKey(
+        'savings.SavingsTransaction',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='source_transactions'
+    )
+    
+    # Loan auto-deduction, settled hourly into one repayment per merchant
+    loan_deduction_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    loan_repayment = models.ForeignKey(
+        'loans.LoanRepayment',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deducted_transactions'
+    )
     
     # Timestamps
     transaction_date = models.DateTimeField(auto_now_add=True)
@@ -146,13 +177,42 @@ class Transaction(models.Model):
         ordering = ['-transaction_date']
         indexes = [
             models.Index(fields=['user', 'transaction_date']),
+            models.Index(fields=['user', 'transaction_date', 'id']),
             models.Index(fields=['transaction_number']),
             models.Index(fields=['status']),
+            models.Index(
+                fields=['user', 'transaction_date'],
+                condition=models.Q(loan_deduction_amount__gt=0, loan_repayment__isnull=True),
+                name='transactions_unsettled_loan',
+            ),
+            models.Index(
+                fields=['auto_save_account'],
+                condition=models.Q(auto_save_account__isnull=False, auto_save_entry__isnull=True),
+                name='transactions_unsettled_save',
+            ),
         ]
     
     def __str__(self):
         return f"{self.transaction_number} - ₦{self.total_amount}"
     
+    # Fields that decide the transaction's contribution to BusinessMetrics
+    METRICS_FIELDS = (
+        'user_id', 'status', 'transaction_type', 'flow_direction',
+        'total_amount', 'cost_of_goods', 'transaction_date',
+    )
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            instance._metrics_snapshot = instance.metrics_snapshot()
+        return instance
+    
+    _metrics_snapshot = None
+    
+    def metrics_snapshot(self):
+        return {field: getattr(self, field) for field in self.METRICS_FIELDS}
+    
     def save(self, *args, **kwargs):
         # Auto-generate transaction number
         if not self.transaction_number:
@@ -179,6 +239,8 @@ class Transaction(models.Model):
         AUTO-CREATE JOURNAL ENTRY
         This makes transaction appear in all financial statements
         """
+        if not django_apps.is_installed('apps.accounting'):
+            return
         from apps.accounting.models import JournalEntry, JournalEntryLine, ChartOfAccounts
         
         try:
@@ -7,13 +7,14 @@ from rest_framework import serializers
 from decimal import Decimal
 from .models import Transaction, TransactionItem, TransactionCategory
 from apps.inventory.models import Product
+from utils.serializers import SparseFieldsetMixin
 
 
 class TransactionCategorySerializer(serializers.ModelSerializer):
     """
     Serializer for transaction categories
     """
-    transaction_count = serializers.ReadOnlyField(source='get_transaction_count')
+    transaction_count = serializers.SerializerMethodField()
     
     class Meta:
         model = TransactionCategory
@@ -22,49 +23,69 @@ class TransactionCategorySerializer(serializers.ModelSerializer):
             'is_active', 'transaction_count', 'created_at'
         ]
         read_only_fields = ['id', 'transaction_count', 'created_at']
+    
+    def get_transaction_count(self, obj):
+        # Annotated by the viewset queryset; fall back to a count query
+        if hasattr(obj, 'transaction_count'):
+            return obj.transaction_count
+        return obj.transactions.count()
 
 
-class TransactionItemSerializer(serializers.ModelSerializer):
+class TransactionItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for transaction items
     """
-    product_name = serializers.ReadOnlyField()
-    profit = serializers.ReadOnlyField()
+    profit = serializers.SerializerMethodField()
     
     class Meta:
         model = TransactionItem
         fields = [
-            'id', 'product', 'product_name', 'quantity', 'unit_price',
-            'unit_cost', 'line_total', 'discount_amount', 'profit'
+            'id', 'product', 'item_name', 'quantity', 'unit_price',
+            'unit_cost', 'line_total', 'profit'
         ]
-        read_only_fields = ['id', 'product_name', 'line_total', 'profit']
+        read_only_fields = ['id', 'line_total', 'profit']
+    
+    def get_profit(self, obj):
+        return (obj.unit_price - obj.unit_cost) * obj.quantity
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for POS transactions
+
+    ``items`` and ``profit`` read from ``items.all()``, so list querysets
+    should prefetch ``items`` (see TransactionViewSet.get_queryset).
     """
-    transaction_items = TransactionItemSerializer(many=True, read_only=True)
-    profit = serializers.ReadOnlyField()
-    is_paid = serializers.ReadOnlyField()
+    items = TransactionItemSerializer(many=True, read_only=True)
+    category_name = serializers.ReadOnlyField(source='transaction_category.name')
+    profit = serializers.SerializerMethodField()
+    is_paid = serializers.SerializerMethodField()
     
     class Meta:
         model = Transaction
         fields = [
-            'id', 'transaction_number', 'reference_number', 'transaction_type',
+            'id', 'transaction_number', 'transaction_category', 'category_name',
+            'transaction_type', 'flow_direction',
             'subtotal', 'tax_amount', 'discount_amount', 'total_amount',
-            'payment_method', 'amount_paid', 'change_amount',
-            'customer_name', 'customer_phone', 'customer_email',
-            'status', 'notes', 'ai_category', 'ai_confidence',
-            'pos_device_serial', 'pos_transaction_id', 'latitude', 'longitude',
-            'auto_save_amount', 'auto_save_applied', 'transaction_date',
-            'transaction_items', 'profit', 'is_paid'
+            'payment_method', 'amount_paid', 'transaction_remark',
+            'counterparty_name', 'counterparty_phone', 'status', 'notes',
+            'auto_save_amount', 'loan_deduction_amount', 'transaction_date',
+            'items', 'profit', 'is_paid'
         ]
         read_only_fields = [
-            'id', 'transaction_number', 'transaction_items', 'profit', 
-            'is_paid', 'transaction_date'
+            'id', 'transaction_number', 'category_name', 'items', 'profit',
+            'is_paid', 'loan_deduction_amount', 'transaction_date'
         ]
     
+    def get_profit(self, obj):
+        return sum(
+            ((item.unit_price - item.unit_cost) * item.quantity for item in obj.items.all()),
+            Decimal('0.00')
+        )
+    
+    def get_is_paid(self, obj):
+        return obj.amount_paid >= obj.total_amount
+    
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
@@ -83,10 +104,11 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = [
-            'transaction_type', 'payment_method', 'customer_name',
-            'customer_phone', 'customer_email', 'notes',
-            'pos_device_serial', 'pos_transaction_id', 'items'
+            'transaction_category', 'transaction_type', 'payment_method',
+            'counterparty_name', 'counterparty_phone', 'transaction_remark',
+            'notes', 'items'
         ]
+        extra_kwargs = {'transaction_category': {'required': True}}
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
@@ -120,13 +142,26 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(f"Product with ID {item_data['product_id']} not found")
         
         validated_data['subtotal'] = subtotal
+        validated_data['cost_of_goods'] = total_cost
         validated_data['total_amount'] = subtotal  # Simplified for prototype
         validated_data['amount_paid'] = validated_data.get('amount_paid', subtotal)
         
+        # Loan auto-deduction and auto-save are recorded on the sale row
+        # and settled in batches, so the sale writes nothing else for them
+        if validated_data['transaction_type'] == 'sale':
+            from apps.loans.services import AutoDeductionService
+            from apps.savings.services import AutoSaveService
+            user_id = validated_data['user'].id
+            validated_data['loan_deduction_amount'] = AutoDeductionService.deduction_for(user_id, subtotal)
+            validated_data['auto_save_account_id'], validated_data['auto_save_amount'] = (
+                AutoSaveService.accrual_for(user_id, subtotal)
+            )
+        
         # Create transaction
         transaction = super().create(validated_data)
         
         # Create transaction items and update stock
+        sold = []
         for item_data in items_data:
             product = Product.objects.get(
                 id=item_data['product_id'], 
@@ -139,12 +174,11 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
             TransactionItem.objects.create(
                 transaction=transaction,
                 product=product,
-                product_name=product.name,
+                item_name=product.name,
                 quantity=quantity,
                 unit_price=unit_price,
                 unit_cost=product.cost_price,
-                line_total=unit_price * quantity,
-                discount_amount=Decimal(str(item_data.get('discount_amount', '0.00')))
+                line_total=unit_price * quantity
             )
             
             # Update product stock and sales data
@@ -167,41 +201,10 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
                 reference_number=transaction.transaction_number,
                 created_by=self.context['request'].user
             )
+            sold.append((product.id, quantity, unit_price * quantity))
         
-        # Apply auto-save if enabled
-        self._apply_auto_save(transaction)
+        if transaction.transaction_type == 'sale':
+            from apps.inventory.services import SalesRankingService
+            SalesRankingService.record(transaction.user_id, sold, transaction.transaction_date)
         
         return transaction
-    
-    def _apply_auto_save(self, transaction):
-        """Apply automatic savings from transaction"""
-        user = transaction.user
-        try:
-            from apps.savings.models import SavingsAccount
-            savings_account = SavingsAccount.objects.filter(
-                user=user, 
-                is_default=True, 
-                auto_save_enabled=True,
-                status='active'
-            ).first()
-            
-            if savings_account and transaction.total_amount >= savings_account.auto_save_minimum:
-                auto_save_amount = min(
-                    (transaction.total_amount * savings_account.auto_save_percentage) / 100,
-                    savings_account.auto_save_maximum
-                )
-                
-                if auto_save_amount > 0:
-                    savings_account.add_funds(
-                        auto_save_amount,
-                        transaction_type='auto_save',
-                        reference=transaction.transaction_number
-                    )
-                    
-                    transaction.auto_save_amount = auto_save_amount
-                    transaction.auto_save_applied = True
-                    transaction.save()
-        except Exception:
-            pass  # Don't fail transaction if auto-save fails
-
-
@@ -1,3 +1,217 @@
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Product, ProductCategory
+from apps.users.models import User
+from .models import Transaction, TransactionCategory, TransactionItem
+
+
+class TransactionQueryCountTests(TestCase):
+    """List endpoints must not issue a query per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='trader@example.com', username='trader', password='pass',
+            phone_number='08030000001', first_name='Ada', last_name='Obi'
+        )
+        cls.category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transactions(self, count):
+        for _ in range(count):
+            txn = Transaction.objects.create(
+                user=self.user,
+                transaction_category=self.category,
+                transaction_type='sale',
+                payment_method='cash',
+                total_amount=Decimal('500.00'),
+                amount_paid=Decimal('500.00'),
+                status='pending',
+            )
+            for name in ('Indomie', 'Milo'):
+                TransactionItem.objects.create(
+                    transaction=txn, item_name=name, quantity=Decimal('2'),
+                    unit_price=Decimal('125.00'), unit_cost=Decimal('100.00')
+                )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.create_transactions(2)
+        small = self.count_queries(url)
+        self.create_transactions(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_list(self):
+        self.assertConstantQueries('/api/transactions/transactions/')
+
+    def test_list_with_keyset_pagination(self):
+        self.assertConstantQueries('/api/transactions/transactions/?pagination=cursor')
+
+    def test_sales_action(self):
+        self.assertConstantQueries('/api/transactions/transactions/sales/')
+
+    def test_category_transactions_action(self):
+        self.assertConstantQueries(f'/api/transactions/categories/{self.category.id}/transactions/')
+
+    def test_categories(self):
+        self.assertConstantQueries('/api/transactions/categories/')
+
+    def test_list_payload(self):
+        self.create_transactions(1)
+        response = self.client.get('/api/transactions/transactions/')
+        row = response.data['results'][0]
+        self.assertEqual(len(row['items']), 2)
+        self.assertEqual(row['profit'], Decimal('100.00'))
+        self.assertEqual(row['category_name'], 'Sales')
+
+    def test_sparse_fieldset_skips_items(self):
+        self.create_transactions(3)
+        # Count and page only; items are not prefetched
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/transactions/transactions/?fields=id,total_amount,category_name'
+            )
+        self.assertEqual(
+            set(response.data['results'][0]), {'id', 'total_amount', 'category_name'}
+        )
+
+    def test_actions_are_paginated(self):
+        self.create_transactions(25)
+        response = self.client.get('/api/transactions/transactions/sales/')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_items_by_product_are_paginated(self):
+        self.create_transactions(25)
+        product = Product.objects.create(
+            user=self.user, name='Indomie',
+            category=ProductCategory.objects.create(name='Provisions', category_type='food_beverages'),
+            cost_price=Decimal('100.00'), selling_price=Decimal('125.00'), current_stock=Decimal('50')
+        )
+        TransactionItem.objects.filter(item_name='Indomie').update(product=product)
+        response = self.client.get(f'/api/transactions/items/by_product/?product_id={product.id}')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+
+
+class TransactionPaginationTests(TestCase):
+    """Keyset cursors page through transactions without gaps or repeats"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='pager@example.com', username='pager', password='pass',
+            phone_number='08030000015', first_name='Bola', last_name='Ige'
+        )
+        category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        for _ in range(5):
+            Transaction.objects.create(
+                user=cls.user, transaction_category=category, transaction_type='sale',
+                payment_method='cash', total_amount=Decimal('100.00'), amount_paid=Decimal('100.00')
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_next_links_walk_every_row_once(self):
+        response = self.client.get('/api/transactions/transactions/?pagination=cursor&page_size=2')
+        self.assertNotIn('count', response.data)
+        seen = []
+        while True:
+            seen += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        expected = Transaction.objects.order_by('-transaction_date', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/api/transactions/transactions/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_count_is_opt_in(self):
+        response = self.client.get('/api/transactions/transactions/?pagination=cursor&count=true')
+        self.assertEqual(response.data['count'], 5)
+
+    def test_client_type_header_switches_to_keyset(self):
+        response = self.client.get('/api/transactions/transactions/', HTTP_X_CLIENT_TYPE='sync')
+        self.assertEqual(set(response.data), {'next', 'results'})
+        response = self.client.get('/api/transactions/transactions/', HTTP_X_CLIENT_TYPE='web')
+        self.assertEqual(response.data['count'], 5)
+        self.assertIn('previous', response.data)
+
+
+class TransactionExportTests(TestCase):
+    """The export action streams every row in export order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='exporter@example.com', username='exporter', password='pass',
+            phone_number='08030000016', first_name='Chidi', last_name='Nwa'
+        )
+        category = TransactionCategory.objects.create(name='Sales', category_type='sales')
+        for amount in ('100.00', '200.00', '300.00'):
+            Transaction.objects.create(
+                user=cls.user, transaction_category=category, transaction_type='sale',
+                payment_method='cash', total_amount=Decimal(amount), amount_paid=Decimal(amount)
+            )
+        ordered = Transaction.objects.order_by('transaction_date', 'id').values_list('id', flat=True)
+        cls.ids = [str(pk) for pk in ordered]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        response = self.client.get('/api/transactions/transactions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'], r'filename="transactions-\d{8}\.csv"')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0][:2], ['id', 'transaction_number'])
+        self.assertEqual([row[0] for row in rows[1:]], self.ids)
+        self.assertEqual(rows[1][rows[0].index('category')], 'Sales')
+
+    def test_ndjson(self):
+        response, content = self.export(file_format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.ids)
+        self.assertEqual(rows[0]['total_amount'], '100.00')
+
+    def test_gzip(self):
+        response, content = self.export(compress='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv.gz"'))
+        rows = list(csv.reader(io.StringIO(gzip.decompress(content).decode())))
+        self.assertEqual(len(rows), 4)
+
+    def test_resume_after(self):
+        _, content = self.export(file_format='ndjson', resume_after=self.ids[0])
+        self.assertEqual([json.loads(line)['id'] for line in content.decode().splitlines()], self.ids[1:])
 
-# Create your tests here.
+        response = self.client.get('/api/transactions/transactions/export/', {'resume_after': 'missing'})
+        self.assertEqual(response.status_code, 400)
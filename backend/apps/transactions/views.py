@@ -7,7 +7,6 @@ Handles sales, purchases, and transaction categorization
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django.db.models import Q, Sum, Count, F
 from django.utils import timezone
 from django.db import transaction as db_transaction
@@ -20,16 +19,13 @@ from .serializers import (
     TransactionCreateSerializer,
     TransactionItemSerializer
 )
+from apps.inventory.services import SalesRankingService
+from utils.export import StreamingExportMixin
+from utils.pagination import PaginatedActionsMixin, StandardResultsSetPagination
+from utils.serializers import wants_field
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for transaction views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class TransactionCategoryViewSet(viewsets.ModelViewSet):
+class TransactionCategoryViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing transaction categories
     """
@@ -46,14 +42,15 @@ class TransactionCategoryViewSet(viewsets.ModelViewSet):
         """Filter categories by user's transactions"""
         return TransactionCategory.objects.filter(
             transactions__user=self.request.user
-        ).distinct().order_by('name')
+        ).annotate(
+            transaction_count=Count('transactions')
+        ).order_by('name')
     
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get only active categories"""
         categories = self.get_queryset().filter(is_active=True)
-        serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(categories)
     
     @action(detail=True, methods=['get'])
     def transactions(self, request, pk=None):
@@ -62,13 +59,14 @@ class TransactionCategoryViewSet(viewsets.ModelViewSet):
         transactions = Transaction.objects.filter(
             transaction_category=category,
             user=request.user
-        ).order_by('-transaction_date')
+        ).select_related('transaction_category').order_by('-transaction_date')
+        if wants_field(request, 'items', 'profit'):
+            transactions = transactions.prefetch_related('items')
         
-        serializer = TransactionSerializer(transactions, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self.paginated_response(transactions, TransactionSerializer)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(PaginatedActionsMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing POS transactions
     """
@@ -76,10 +74,40 @@ class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-transaction_date', '-id')
+    
+    # Streaming export (filters come from get_queryset)
+    export_ordering = ('transaction_date', 'id')
+    export_filename = 'transactions'
+    export_columns = [
+        ('id', 'id'),
+        ('transaction_number', 'transaction_number'),
+        ('transaction_date', 'transaction_date'),
+        ('transaction_type', 'transaction_type'),
+        ('flow_direction', 'flow_direction'),
+        ('category', 'transaction_category__name'),
+        ('subtotal', 'subtotal'),
+        ('tax_amount', 'tax_amount'),
+        ('discount_amount', 'discount_amount'),
+        ('total_amount', 'total_amount'),
+        ('payment_method', 'payment_method'),
+        ('amount_paid', 'amount_paid'),
+        ('counterparty_name', 'counterparty_name'),
+        ('counterparty_phone', 'counterparty_phone'),
+        ('status', 'status'),
+        ('auto_save_amount', 'auto_save_amount'),
+        ('loan_deduction_amount', 'loan_deduction_amount'),
+    ]
     
     def get_queryset(self):
         """Filter transactions by user"""
-        queryset = Transaction.objects.filter(user=self.request.user)
+        queryset = Transaction.objects.filter(
+            user=self.request.user
+        ).select_related('transaction_category')
+        
+        # Items are only loaded when the response includes them
+        if wants_field(self.request, 'items', 'profit'):
+            queryset = queryset.prefetch_related('items')
         
         # Filter by transaction type
         transaction_type = self.request.query_params.get('type', None)
@@ -130,22 +158,19 @@ class TransactionViewSet(viewsets.ModelViewSet):
         """Get today's transactions"""
         today = timezone.now().date()
         transactions = self.get_queryset().filter(transaction_date__date=today)
-        serializer = self.get_serializer(transactions, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(transactions)
     
     @action(detail=False, methods=['get'])
     def sales(self, request):
         """Get sales transactions"""
         sales = self.get_queryset().filter(transaction_type='sale')
-        serializer = self.get_serializer(sales, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(sales)
     
     @action(detail=False, methods=['get'])
     def purchases(self, request):
         """Get purchase transactions"""
         purchases = self.get_queryset().filter(transaction_type='purchase')
-        serializer = self.get_serializer(purchases, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(purchases)
     
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
@@ -304,6 +329,11 @@ class TransactionViewSet(viewsets.ModelViewSet):
                     item.product.current_stock += item.quantity
                     item.product.save()
             
+            # Returned units come off the product sales rankings
+            SalesRankingService.record(transaction.user_id, [
+                (item.product_id, -item.quantity, -item.line_total) for item in transaction.items.all()
+            ], refund_transaction.transaction_date, sales=0)
+            
             serializer = self.get_serializer(refund_transaction)
             return Response(serializer.data)
     
@@ -339,7 +369,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
             )
 
 
-class TransactionItemViewSet(viewsets.ModelViewSet):
+class TransactionItemViewSet(PaginatedActionsMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing transaction items
     """
@@ -356,19 +386,23 @@ class TransactionItemViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def top_selling(self, request):
-        """Get top selling items"""
-        days = int(request.query_params.get('days', 30))
-        since_date = timezone.now() - timedelta(days=days)
-        
-        items = self.get_queryset().filter(
-            transaction__transaction_date__gte=since_date,
-            transaction__transaction_type='sale'
-        ).values('product_name').annotate(
-            total_quantity=Sum('quantity'),
-            total_revenue=Sum('line_total'),
-            transaction_count=Count('transaction')
-        ).order_by('-total_quantity')[:10]
+        """Get top selling items over the last 7, 30 or 90 days"""
+        try:
+            days = int(request.query_params.get('days', 30))
+            rankings = SalesRankingService.top(request.user.id, days)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
+        items = [
+            {
+                'product_id': ranking.product_id,
+                'item_name': ranking.product.name,
+                'total_quantity': getattr(ranking, f'units_{days}d'),
+                'total_revenue': getattr(ranking, f'revenue_{days}d'),
+                'transaction_count': getattr(ranking, f'sales_{days}d'),
+            }
+            for ranking in rankings
+        ]
         return Response(items)
     
     @action(detail=False, methods=['get'])
@@ -382,5 +416,4 @@ class TransactionItemViewSet(viewsets.ModelViewSet):
             )
         
         items = self.get_queryset().filter(product_id=product_id)
-        serializer = self.get_serializer(items, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return self.paginated_response(items)
\ No newline at end of file
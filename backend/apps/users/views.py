@@ -6,7 +6,6 @@ User management API views for authentication and profile management
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, login, logout
 from django.db.models import Q
@@ -21,13 +20,7 @@ from .serializers import (
     BusinessProfileSerializer,
     GuarantorSerializer
 )
-
-
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination for user views"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+from utils.pagination import StandardResultsSetPagination
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -0,0 +1,14 @@
+"""
+Celery application for background work (notification fan-out, digests,
+scheduled jobs). Settings are read from the CELERY_* Django settings.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('config')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
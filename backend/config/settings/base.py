@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 # Import corsheaders defaults to extend allowed headers if needed
 from corsheaders.defaults import default_headers as CORS_DEFAULT_HEADERS
@@ -48,6 +49,7 @@ THIRD_PARTY_APPS = [
     'django_filters',
     'corsheaders',
     'rest_framework.authtoken',
+    'channels',
 ]
 
 LOCAL_APPS = [
@@ -193,6 +195,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Clients (sent as the X-Client-Type header) that page through whole
+# histories and get keyset cursors instead of page numbers by default
+KEYSET_PAGINATION_CLIENTS = ['sync', 'export']
+
 # CORS settings
 # When DEBUG is True, allow all origins for local development ease. In
 # production, configure the CORS_ALLOWED_ORIGINS env var (comma-separated)
@@ -219,6 +225,26 @@ CORS_ALLOW_HEADERS = list(CORS_DEFAULT_HEADERS) + [
 # Redis configuration
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 
+# Shared cache: invalidations made in one web or worker process (dashboard
+# snapshots, the alert rule index, auto-save and auto-deduction terms) must
+# reach every other process, so this cannot be the per-process LocMemCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default=REDIS_URL),
+        'KEY_PREFIX': 'bivio',
+    },
+}
+
+# Channels: WebSocket live updates over Redis pub/sub
+ASGI_APPLICATION = 'config.asgi.application'
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+        'CONFIG': {'hosts': [REDIS_URL]},
+    },
+}
+
 # Celery configuration
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -226,6 +252,99 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Run tasks inline (no broker needed), e.g. for local development
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-notification-deliveries': {
+        'task': 'apps.notifications.tasks.dispatch_notification_deliveries',
+        'schedule': 60.0,
+    },
+    'reconcile-notification-counters': {
+        'task': 'apps.notifications.tasks.reconcile_notification_counters',
+        'schedule': 60.0 * 60,
+    },
+    'purge-notifications': {
+        'task': 'apps.notifications.tasks.purge_notifications',
+        'schedule': 60.0 * 60 * 24,
+    },
+    'maintain-table-partitions': {
+        'task': 'apps.notifications.tasks.maintain_table_partitions',
+        'schedule': 60.0 * 60 * 24,
+    },
+    'update-loan-delinquency': {
+        'task': 'apps.loans.tasks.update_delinquency',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'rebuild-loan-portfolio': {
+        'task': 'apps.loans.tasks.rebuild_loan_portfolio',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'settle-loan-deductions': {
+        'task': 'apps.loans.tasks.settle_loan_deductions',
+        'schedule': crontab(minute=5),
+    },
+    'settle-auto-saves': {
+        'task': 'apps.savings.tasks.settle_auto_saves',
+        'schedule': 60.0 * 5,
+    },
+    'accrue-savings-interest': {
+        'task': 'apps.savings.tasks.accrue_savings_interest',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'rebuild-inventory-summaries': {
+        'task': 'apps.inventory.tasks.rebuild_inventory_summaries',
+        'schedule': crontab(hour=2, minute=15),
+    },
+    'roll-product-sales-rankings': {
+        'task': 'apps.inventory.tasks.roll_sales_rankings',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'close-business-metrics': {
+        'task': 'apps.analytics.tasks.close_business_metrics',
+        'schedule': crontab(hour=0, minute=45),
+    },
+    'forecast-inventory-demand': {
+        'task': 'apps.inventory.tasks.forecast_demand',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'forecast-cash-flow': {
+        'task': 'apps.analytics.tasks.forecast_cash_flow',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+
+# Retention: rows are deleted in keyset batches of RETENTION_BATCH_SIZE;
+# notifications older than NOTIFICATION_RETENTION_DAYS are removed, and
+# daily product sales buckets older than PRODUCT_SALES_RETENTION_DAYS
+RETENTION_BATCH_SIZE = 5000
+NOTIFICATION_RETENTION_DAYS = 365
+PRODUCT_SALES_RETENTION_DAYS = 400
+
+# Append-mostly tables that `manage.py partition_tables` converts to
+# monthly range partitions on PostgreSQL (model label -> partition column)
+PARTITIONED_MODELS = {
+    'notifications.Notification': 'created_at',
+    'inventory.StockMovement': 'created_at',
+}
+
+# Broadcast notifications are created in batches of this many users
+NOTIFICATION_BROADCAST_CHUNK_SIZE = 1000
+
+# Out-of-app notification delivery: one backend per channel, digests sent
+# at NOTIFICATION_DIGEST_HOUR (local time), failed sends retried
+NOTIFICATION_CHANNEL_BACKENDS = {
+    'push': 'apps.notifications.backends.ConsoleBackend',
+    'email': 'apps.notifications.backends.EmailBackend',
+    'sms': 'apps.notifications.backends.SMSBackend',
+}
+NOTIFICATION_DIGEST_HOUR = 8
+NOTIFICATION_DELIVERY_MAX_ATTEMPTS = 5
+# Deliveries claimed by a dispatch run are retried if not sent within this
+NOTIFICATION_DELIVERY_LEASE_SECONDS = 600
+# Failed sends are retried after this, doubling with every attempt
+NOTIFICATION_DELIVERY_RETRY_SECONDS = 60
+SMS_BULK_SIZE = 100
 
 # AI Service Configuration
 AI_SERVICE_URL = config('AI_SERVICE_URL', default='http://localhost:8001')
@@ -0,0 +1,18 @@
+# backend/config/settings/test.py
+"""
+Settings for test runs: a per-process cache and channel layer, so tests need
+no Redis and never share state with a running server.
+
+``manage.py test`` selects this module; point any other runner at it with
+``DJANGO_SETTINGS_MODULE=config.settings.test``.
+"""
+
+from .base import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
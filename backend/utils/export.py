@@ -0,0 +1,161 @@
+"""
+Streaming CSV / NDJSON export helpers
+
+Rows are read with ``values_list().iterator(chunk_size=...)`` and written
+straight into a StreamingHttpResponse, so memory stays flat no matter how
+many years of data are exported.
+"""
+
+import csv
+import json
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .pagination import keyset_filter
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = 2000
+# Flush buffered output to the client roughly every 64KB
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def _buffered(lines):
+    """Join small lines into larger chunks before sending them"""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def apply_resume_point(queryset, ordering, resume_after):
+    """
+    Continue an interrupted export after the row with id ``resume_after``.
+    Returns None if that row is not in the queryset.
+    """
+    values = list(queryset.filter(id=resume_after).values_list(*[f.lstrip('-') for f in ordering])[:1])
+    if not values:
+        return None
+    return keyset_filter(queryset, ordering, values[0])
+
+
+def streaming_export(queryset, columns, file_format, filename, compress=False,
+                     chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Build a StreamingHttpResponse for ``queryset``.
+
+    ``columns`` is a list of ``(header, lookup)`` pairs passed to
+    ``values_list``, so related fields can be exported with ``__`` lookups
+    without loading model instances.
+    """
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=chunk_size)
+
+    lines = csv_lines(headers, rows) if file_format == 'csv' else ndjson_lines(headers, rows)
+    chunks = _buffered(lines)
+    filename = f"{filename}.{file_format}"
+    content_type = EXPORT_FORMATS[file_format]
+
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class StreamingExportMixin:
+    """
+    Adds a streaming ``export`` action to a viewset.
+
+    Query parameters:
+    - ``file_format``: ``csv`` (default) or ``ndjson``
+    - ``compress=gzip``: gzip the stream on the fly
+    - ``resume_after``: id of the last row received, to resume an export
+    """
+    export_columns = []
+    export_ordering = ('created_at', 'id')
+    export_filename = 'export'
+
+    def get_export_queryset(self):
+        return self.get_queryset()
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered rows as CSV or NDJSON"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"file_format must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.get_export_queryset().order_by(*self.export_ordering)
+
+        resume_after = request.query_params.get('resume_after')
+        if resume_after:
+            try:
+                queryset = apply_resume_point(queryset, self.export_ordering, resume_after)
+            except (ValueError, ValidationError):
+                queryset = None
+            if queryset is None:
+                return Response(
+                    {'error': 'resume_after does not match an exported row'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        return streaming_export(
+            queryset,
+            self.export_columns,
+            file_format,
+            filename=f"{self.export_filename}-{timezone.now():%Y%m%d}",
+            compress=request.query_params.get('compress') == 'gzip',
+        )
@@ -1,8 +1,182 @@
-from rest_framework.pagination import PageNumberPagination
+"""
+Shared pagination classes for the API
+
+Page-number pagination is the default. List views that declare a
+``keyset_ordering`` can also be walked with opaque keyset cursors, which
+avoid the COUNT(*) and OFFSET scan that page numbers need on deep pages.
+"""
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values):
+    """Encode ordering values into an opaque, URL-safe cursor"""
+    payload = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+
+
+def cursor_values(obj, ordering):
+    """Ordering values of a row, in the order used by the cursor"""
+    return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+
+def keyset_filter(queryset, ordering, values):
+    """
+    Restrict a queryset to rows that come strictly after ``values``
+    when sorted by ``ordering`` (e.g. ``('-transaction_date', '-id')``)
+    """
+    if len(values) != len(ordering):
+        raise ValueError('Cursor does not match ordering')
+
+    condition = Q()
+    equal = {}
+    for field, raw_value in zip(ordering, values):
+        name = field.lstrip('-')
+        value = queryset.model._meta.get_field(name).to_python(raw_value)
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return queryset.filter(condition)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination on an indexed ordering such as
+    ``(transaction_date, id)``. No count query is run unless the
+    client passes ``?count=true``.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        self.count = queryset.count() if self.wants_count(request) else None
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                queryset = keyset_filter(queryset, self.ordering, decode_cursor(cursor))
+            except (ValueError, TypeError, ValidationError):
+                raise NotFound('Invalid cursor')
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = encode_cursor(cursor_values(self.page[-1], self.ordering))
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
 
 
 class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Standard pagination for API views.
+
+    Views that set ``keyset_ordering`` switch to keyset pagination when the
+    request carries a ``cursor``, asks for ``?pagination=cursor``, or comes
+    from a client listed in ``KEYSET_PAGINATION_CLIENTS`` (sent in the
+    ``X-Client-Type`` header, e.g. the sync and export clients).
+    """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+    keyset_pagination_class = KeysetPagination
+
+    keyset = None
+
+    def use_keyset(self, request, view):
+        if not getattr(view, 'keyset_ordering', None):
+            return False
+        if self.keyset_pagination_class.cursor_query_param in request.query_params:
+            return True
+        if request.query_params.get('pagination') == 'cursor':
+            return True
+        client = request.headers.get('X-Client-Type', '').lower()
+        return client in getattr(settings, 'KEYSET_PAGINATION_CLIENTS', [])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request, view):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class PaginatedActionsMixin:
+    """
+    Paginate collections returned from custom ``@action`` methods the same
+    way as the default list endpoint
+    """
+
+    def paginated_response(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        context = self.get_serializer_context()
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = serializer_class(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
 
+        serializer = serializer_class(queryset, many=True, context=context)
+        return Response(serializer.data)
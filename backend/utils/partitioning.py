@@ -0,0 +1,195 @@
+"""
+Monthly range partitioning for append-mostly tables (PostgreSQL only)
+
+Tables listed in ``PARTITIONED_MODELS`` can be converted to
+``PARTITION BY RANGE (created_at)`` with the ``partition_tables`` command.
+Partitions are named ``<table>_YYYY_MM``; a ``<table>_default`` partition
+catches rows outside the created months. Retention then detaches and drops
+whole partitions instead of deleting rows one by one.
+
+On other databases every helper is a no-op and retention falls back to
+batched deletes (see ``utils.retention``).
+"""
+
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.db import NotSupportedError, connections, transaction
+from django.utils import timezone
+
+DEFAULT_COLUMN = 'created_at'
+
+
+def partitioned_models():
+    """``(model, column)`` pairs configured in PARTITIONED_MODELS"""
+    return [
+        (apps.get_model(label), column)
+        for label, column in getattr(settings, 'PARTITIONED_MODELS', {}).items()
+    ]
+
+
+def supports_partitioning(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(moment, months):
+    index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f'{table}_{month:%Y_%m}'
+
+
+def is_partitioned(table, using='default'):
+    if not supports_partitioning(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(table, using='default'):
+    """``[(name, start, end)]`` of the monthly partitions of ``table``"""
+    pattern = re.compile(rf'^{re.escape(table)}_(\d{{4}})_(\d{{2}})$')
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)', [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    result = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            start = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+            result.append((name, start, add_months(start, 1)))
+    return sorted(result, key=lambda item: item[1])
+
+
+def create_partition(table, month, using='default'):
+    start = month_start(month)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {quote(partition_name(table, start))} '
+            f'PARTITION OF {quote(table)} FOR VALUES FROM (%s) TO (%s)',
+            [start, add_months(start, 1)]
+        )
+
+
+def ensure_partitions(table, months_ahead=3, now=None, using='default'):
+    """Create this month's partition and the next ``months_ahead``"""
+    current = month_start(now or timezone.now())
+    for offset in range(months_ahead + 1):
+        create_partition(table, add_months(current, offset), using)
+
+
+def expired_partitions(table, cutoff, using='default'):
+    """Partitions whose whole range is older than ``cutoff``"""
+    return [item for item in partitions(table, using) if item[2] <= cutoff]
+
+
+def drop_partition(table, name, using='default'):
+    quote = connections[using].ops.quote_name
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}')
+        cursor.execute(f'DROP TABLE {quote(name)}')
+
+
+def maintain_partitions(months_ahead=3, using='default'):
+    """Keep future partitions in place for every partitioned model"""
+    created = []
+    for model, _ in partitioned_models():
+        table = model._meta.db_table
+        if is_partitioned(table, using):
+            ensure_partitions(table, months_ahead, using=using)
+            created.append(table)
+    return created
+
+
+def table_indexes(table, using='default'):
+    """``[(name, definition)]`` of the indexes on ``table`` other than its primary key"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT i.indexname, i.indexdef FROM pg_indexes i '
+            'JOIN pg_class c ON c.relname = i.indexname '
+            'JOIN pg_index x ON x.indexrelid = c.oid '
+            'WHERE x.indrelid = to_regclass(%s) AND NOT x.indisprimary', [table]
+        )
+        return cursor.fetchall()
+
+
+def table_foreign_keys(table, using='default'):
+    """``[(name, definition)]`` of the foreign key constraints on ``table``"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [table]
+        )
+        return cursor.fetchall()
+
+
+def partition_table(model, column=DEFAULT_COLUMN, months_ahead=3, using='default'):
+    """
+    Rebuild ``model``'s table as a range-partitioned table on ``column``.
+
+    The primary key becomes ``(id, column)`` because PostgreSQL requires the
+    partition key in every unique constraint, so foreign keys that point at
+    this table must be declared with ``db_constraint=False``; if any still
+    exist the old table cannot be dropped and nothing is changed. The
+    table's own indexes and foreign keys are read from the catalog first and
+    recreated as they were. Existing rows are copied, so run this in a
+    maintenance window.
+    """
+    if not supports_partitioning(using):
+        raise NotSupportedError('Table partitioning requires PostgreSQL')
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    legacy = f'{table}_unpartitioned'
+    pk = model._meta.pk.column
+
+    indexes = table_indexes(table, using)
+    foreign_keys = table_foreign_keys(table, using)
+
+    with transaction.atomic(using=using), connection.schema_editor(atomic=False) as editor:
+        editor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        editor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE ({quote(column)})'
+        )
+        editor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MIN({quote(column)}) FROM {quote(legacy)}')
+            oldest = cursor.fetchone()[0]
+        month = month_start(oldest or timezone.now())
+        last = add_months(month_start(timezone.now()), months_ahead)
+        while month <= last:
+            create_partition(table, month, using)
+            month = add_months(month, 1)
+
+        editor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}')
+        # No CASCADE: a constraint that still references the old table
+        # aborts the conversion instead of being dropped with it
+        editor.execute(f'DROP TABLE {quote(legacy)}')
+
+        editor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(pk)}, {quote(column)})')
+        for name, definition in foreign_keys:
+            editor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        for _, definition in indexes:
+            # Index definitions name the table, which now is the partitioned one
+            editor.execute(definition)
@@ -0,0 +1,76 @@
+"""
+Batched retention deletes
+
+Old rows are walked in keyset order and deleted ``batch_size`` at a time
+with raw DELETE statements. Django's ``QuerySet.delete()`` would first
+load every row (and every cascaded row) into memory to send signals, and
+a single unbounded DELETE holds locks on the whole set until it commits.
+"""
+
+from django.conf import settings
+from django.db import models, transaction
+
+from .pagination import keyset_filter
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def get_batch_size(batch_size=None):
+    return batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def keyset_batches(queryset, ordering, batch_size):
+    """
+    Yield lists of primary keys from ``queryset`` walked in ``ordering``,
+    which must end with a unique field (e.g. ``('expires_at', 'id')``)
+    """
+    fields = [field.lstrip('-') for field in ordering]
+    queryset = queryset.order_by(*ordering)
+    last = None
+    while True:
+        page = queryset if last is None else keyset_filter(queryset, ordering, last)
+        rows = list(page.values_list('pk', *fields)[:batch_size])
+        if not rows:
+            return
+        yield [row[0] for row in rows]
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][1:]
+
+
+def raw_delete(queryset):
+    """DELETE matching rows without collecting related objects or sending signals"""
+    return queryset._raw_delete(queryset.db)
+
+
+def delete_batch(queryset):
+    """
+    Raw-delete a bounded batch of rows and handle direct relations the way
+    Django would: CASCADE children are raw-deleted first and SET_NULL
+    references are cleared. Only one level of relations is followed.
+    """
+    pks = list(queryset.values_list('pk', flat=True))
+    if not pks:
+        return 0
+    for relation in queryset.model._meta.related_objects:
+        if relation.many_to_many:
+            continue
+        related = relation.related_model._base_manager.filter(
+            **{f'{relation.field.name}__in': pks}
+        )
+        if relation.on_delete is models.CASCADE:
+            raw_delete(related)
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+    return raw_delete(queryset.model._base_manager.filter(pk__in=pks))
+
+
+def purge_in_batches(queryset, ordering=None, batch_size=None):
+    """Delete every row in ``queryset``, one short transaction per batch"""
+    ordering = ordering or (queryset.model._meta.pk.name,)
+    batch_size = get_batch_size(batch_size)
+    deleted = 0
+    for pks in keyset_batches(queryset, ordering, batch_size):
+        with transaction.atomic(using=queryset.db):
+            deleted += delete_batch(queryset.filter(pk__in=pks))
+    return deleted
@@ -0,0 +1,38 @@
+"""
+Shared serializer helpers
+"""
+
+
+def requested_fields(request, query_param='fields'):
+    """
+    Field names asked for with ``?fields=a,b,c``, or None when the client
+    wants the full representation
+    """
+    if request is None or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        return None
+    raw = getattr(request, 'query_params', request.GET).get(query_param)
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+def wants_field(request, *names):
+    """Whether any of ``names`` will be rendered for this request"""
+    fields = requested_fields(request)
+    return fields is None or any(name in fields for name in names)
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for read requests: ``?fields=id,total_amount`` drops
+    every other field, including heavy nested ones, from the response.
+    Only the top-level serializer of a request is trimmed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields is None:
+            return
+        for name in set(self.fields) - fields:
+            self.fields.pop(name)
@@ -0,0 +1,34 @@
+"""
+Token authentication for WebSocket connections
+
+Browsers cannot set an Authorization header on a WebSocket handshake, so
+the DRF token is read from the ``token`` query parameter instead.
+Connections without a valid token keep whatever user the session
+middleware found (or AnonymousUser).
+"""
+
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+
+
+@database_sync_to_async
+def get_token_user(key):
+    from rest_framework.authtoken.models import Token
+    try:
+        return Token.objects.select_related('user').get(key=key).user
+    except Token.DoesNotExist:
+        return None
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        key = (query.get('token') or [None])[0]
+        if key:
+            user = await get_token_user(key)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)